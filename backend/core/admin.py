@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import User, Patient, Doctor, Appointment, MedicalRecord, Bed, Resource, Billing, Inventory, EmergencyResponse
+from .search import filter_records
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -34,10 +35,17 @@ class AppointmentAdmin(admin.ModelAdmin):
 class MedicalRecordAdmin(admin.ModelAdmin):
     list_display = ('patient', 'doctor', 'diagnosis', 'record_date')
     list_filter = ('record_date', 'created_at')
-    search_fields = ('patient__user__first_name', 'patient__user__last_name', 'diagnosis', 'treatment')
+    search_fields = ('patient__user__first_name', 'patient__user__last_name')
     raw_id_fields = ('patient', 'doctor')
     date_hierarchy = 'record_date'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Names through search_fields, clinical text through the FTS index
+        by_name, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term:
+            return by_name, may_have_duplicates
+        return by_name | filter_records(queryset, search_term), may_have_duplicates
+
 @admin.register(Bed)
 class BedAdmin(admin.ModelAdmin):
     list_display = ('bed_number', 'ward', 'status', 'patient')
@@ -66,6 +74,10 @@ class InventoryAdmin(admin.ModelAdmin):
     list_filter = ('category', 'expiry_date')
     search_fields = ('name', 'category', 'supplier')
 
+    def get_readonly_fields(self, request, obj=None):
+        # Stock changes go through the movement ledger
+        return ('quantity',) if obj else ()
+
 @admin.register(EmergencyResponse)
 class EmergencyResponseAdmin(admin.ModelAdmin):
     list_display = ('patient', 'description', 'status', 'priority', 'created_at')
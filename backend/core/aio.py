@@ -0,0 +1,80 @@
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.urls import URLPattern, URLResolver
+
+_lock = threading.Lock()
+_executor = None
+_pid = None
+
+
+def executor():
+    """This process's pool of ``ASYNC_DB_THREADS`` threads for blocking database work."""
+    global _executor, _pid
+    with _lock:
+        # A forked worker must not share its parent's threads
+        if _pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='db')
+            _pid = os.getpid()
+        return _executor
+
+
+def _call(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # Pool threads keep their connections between calls: there are only
+        # ASYNC_DB_THREADS of them. Only broken connections are dropped.
+        for conn in connections.all(initialized_only=True):
+            if conn.connection is None:
+                continue
+            if conn.get_autocommit() != conn.settings_dict['AUTOCOMMIT'] or (conn.errors_occurred and not conn.is_usable()):
+                conn.close()
+            conn.errors_occurred = False
+
+
+async def run_pooled(fn, *args, **kwargs):
+    """
+    Awaits the blocking ``fn`` run on a pool thread with that thread's own
+    database connection. Under ASGI, Django otherwise runs all sync code on
+    one shared thread, so concurrent calls would queue up behind each other.
+    """
+    return await sync_to_async(_call, thread_sensitive=False, executor=executor())(fn, args, kwargs)
+
+
+def pooled(view):
+    """
+    Async wrapper running the sync ``view`` on the pool, rendering its
+    response there as well.
+    """
+    def respond(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response = response.render()
+        return response
+
+    @functools.wraps(view)
+    async def pooled_view(request, *args, **kwargs):
+        return await run_pooled(respond, request, *args, **kwargs)
+    return pooled_view
+
+
+def pooled_patterns(patterns):
+    """``patterns`` with every sync view wrapped in ``pooled()``, includes too."""
+    wrapped = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            wrapped.append(URLResolver(
+                pattern.pattern, pooled_patterns(pattern.url_patterns), pattern.default_kwargs,
+                pattern.app_name, pattern.namespace,
+            ))
+        elif iscoroutinefunction(pattern.callback):
+            wrapped.append(pattern)
+        else:
+            wrapped.append(URLPattern(pattern.pattern, pooled(pattern.callback), pattern.default_args, pattern.name))
+    return wrapped
@@ -0,0 +1,161 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    # Seconds an entry is trusted. Invalidation is explicit; without a
+    # shared BACKEND it only reaches this process and the TTL bounds
+    # staleness in the others.
+    'TTL': 60,
+    # Optional Django cache alias shared by all processes, e.g. 'default'.
+    # Entries then live there only, so invalidation reaches every process.
+    'BACKEND': None,
+}
+
+
+class TokenCache:
+    """
+    In-process LRU of token key -> token (with its user loaded) and a TTL,
+    or, given a shared Django cache as ``backend``, that cache alone: a
+    process-local copy would keep a revoked token alive in the other
+    processes until its TTL ran out. Counters are per process.
+    """
+
+    def __init__(self, max_entries, ttl, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _shared_key(self, key):
+        return f'auth-token:{key}'
+
+    def get(self, key):
+        if self.backend is not None:
+            token = self.backend.get(self._shared_key(key))
+            with self._lock:
+                if token is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return token
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                token, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return token
+                del self._entries[key]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, token):
+        if self.backend is not None:
+            self.backend.set(self._shared_key(key), token, self.ttl)
+        else:
+            self._store(key, token, time.monotonic())
+
+    def _store(self, key, token, now):
+        with self._lock:
+            self._entries[key] = (token, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self.invalidations += 1
+        if self.backend is not None:
+            self.backend.delete(self._shared_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def _build_token_cache():
+    options = {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+    backend = caches[options['BACKEND']] if options['BACKEND'] else None
+    return TokenCache(options['MAX_ENTRIES'], options['TTL'], backend)
+
+
+token_cache = _build_token_cache()
+
+
+def invalidate_token(key):
+    token_cache.delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    ``TokenAuthentication`` that skips the token + user query for keys seen
+    recently. Entries are dropped on logout, password change and
+    deactivation by the signal handlers in ``core.signals``.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if token.user.is_active:
+                token_cache.set(key, token)
+            cached = token
+
+        # Hand each request its own copies so per-request state, such as a
+        # cached patient_profile, never sticks to the shared entry.
+        token = copy.copy(cached)
+        token.user = copy.copy(cached.user)
+        token.user._state.fields_cache = {}
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
+
+
+class QueryTokenAuthentication(CachedTokenAuthentication):
+    """
+    Reads the token from a ``token`` query parameter, for clients such as
+    the browser's ``EventSource`` that cannot send headers. Only enabled on
+    streaming endpoints, since URLs end up in access logs.
+    """
+
+    def authenticate(self, request):
+        key = request.query_params.get('token')
+        if not key:
+            return None
+        return self.authenticate_credentials(key)
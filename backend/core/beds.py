@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Value
+from django.db.models.functions import Replace
+from django.utils import timezone
+
+from .conditional import bump_versions
+from .dashboard import invalidate_dashboard_cache
+from .models import Appointment, Bed, BedAssignment
+
+# Candidates fetched per round; a claim only fails when another admission
+# took the same bed in between, so a handful is plenty.
+CANDIDATES_PER_ROUND = 8
+# Rounds per scope before giving up, so a run of lost races ends in 409
+MAX_CLAIM_ROUNDS = 5
+
+# The beds claim_bed() can take
+AVAILABLE = {'status': 'available', 'patient__isnull': True}
+
+
+def claim_bed(bed_id, patient, appointment=None):
+    """
+    Claims one bed for ``patient`` with a compare-and-set ``UPDATE`` that
+    only matches while the bed is still available, and opens its
+    ``BedAssignment``. Returns True if this call won the bed.
+    """
+    with transaction.atomic():
+        claimed = Bed.objects.filter(pk=bed_id, **AVAILABLE).update(
+            status='occupied', patient=patient, updated_at=timezone.now()
+        )
+        if claimed:
+            BedAssignment.objects.create(bed_id=bed_id, patient=patient, appointment=appointment)
+            bump_versions(Bed)
+    return claimed == 1
+
+
+def allocate_bed(patient, wards=None, any_ward=True, appointment=None):
+    """
+    Picks and claims an available bed. ``wards`` lists preferred wards in
+    order; with ``any_ward`` the search falls back to every ward once those
+    are full. Returns the claimed bed, or None.
+
+    The claim itself is the single-statement transaction. No transaction
+    is held across the candidate read, which on SQLite would turn
+    concurrent admissions into lock-upgrade failures. A bed whose claim
+    fails is not tried again, and a bed left with an open stay is skipped.
+    Raises IntegrityError if ``patient`` got a bed elsewhere meanwhile.
+    """
+    scopes = [{'ward': ward} for ward in wards or []]
+    if any_ward or not scopes:
+        scopes.append({})
+
+    tried = set()
+    for scope in scopes:
+        for _ in range(MAX_CLAIM_ROUNDS):
+            candidates = list(
+                Bed.objects.filter(**AVAILABLE, **scope)
+                .exclude(pk__in=tried)
+                .order_by('id')
+                .values_list('id', flat=True)[:CANDIDATES_PER_ROUND]
+            )
+            if not candidates:
+                break
+            for bed_id in candidates:
+                tried.add(bed_id)
+                try:
+                    claimed = claim_bed(bed_id, patient, appointment)
+                except IntegrityError:
+                    if Bed.objects.filter(patient=patient).exists():
+                        raise
+                    # An open stay nobody closed still holds this bed
+                    continue
+                if claimed:
+                    invalidate_dashboard_cache()
+                    return Bed.objects.select_related('patient__user').get(pk=bed_id)
+    return None
+
+
+def release_bed(bed):
+    """
+    Frees ``bed`` and closes its open assignment. The open stay is found
+    through the partial unique index on ``bed``, and the note on the
+    appointment that asked for the bed is rewritten in the same pass.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        closed = BedAssignment.objects.filter(bed=bed, released_at__isnull=True).update(released_at=now)
+        if closed:
+            Appointment.objects.filter(bed_assignments__bed=bed, bed_assignments__released_at=now).update(
+                notes=Replace(
+                    'notes',
+                    Value(f'\n(Bed assigned: {bed.bed_number} - {bed.ward})'),
+                    Value(f'\n(Bed released: {bed.bed_number} - {bed.ward})'),
+                ),
+                updated_at=now,
+            )
+        Bed.objects.filter(pk=bed.pk).update(status='available', patient=None, updated_at=now)
+        bump_versions(Bed)
+    invalidate_dashboard_cache()
+
+
+def length_of_stay(assignments):
+    """
+    Aggregates completed stays in ``assignments`` (a ``BedAssignment``
+    queryset) in one query: the number of stays and the average and
+    longest stay in hours.
+    """
+    stay = ExpressionWrapper(F('released_at') - F('assigned_at'), output_field=DurationField())
+    totals = assignments.filter(released_at__isnull=False).aggregate(
+        stays=Count('id'), average=Avg(stay), longest=Max(stay)
+    )
+    return {
+        'stays': totals['stays'],
+        'average_hours': _hours(totals['average']),
+        'longest_hours': _hours(totals['longest']),
+    }
+
+
+def _hours(duration):
+    return round(duration / timedelta(hours=1), 2) if duration is not None else None
@@ -0,0 +1,125 @@
+import asyncio
+import datetime
+import json
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .aio import run_pooled
+
+MAX_QUEUE = 500
+STREAM_POLL_SECONDS = 1.0
+STREAM_HEARTBEAT_SECONDS = 15
+# Streams end after this long and the client reconnects with Last-Event-ID,
+# so a board left open does not hold a worker forever.
+STREAM_MAX_SECONDS = 300
+STREAM_RETRY_MS = 2000
+# Changes are re-read this far behind the cursor: a write that took its
+# timestamp before another but committed after it is still picked up.
+STREAM_OVERLAP = datetime.timedelta(seconds=5)
+STREAM_BATCH = 100
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def active_queue(queryset, limit=MAX_QUEUE):
+    """
+    Active emergencies, most severe first and oldest first within a
+    priority: an ordered walk of ``emergency_queue_idx``.
+    """
+    return queryset.filter(status='active').order_by('priority_rank', 'created_at', 'id')[:limit]
+
+
+def make_cursor(moment):
+    delta = moment - _EPOCH
+    return str((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+
+def parse_cursor(value):
+    """Returns the moment a cursor stands for, or None if it is malformed."""
+    try:
+        return _EPOCH + datetime.timedelta(microseconds=int(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+class ChangeStream:
+    """
+    Server-Sent Events for emergencies of ``queryset`` created, changed or
+    resolved after ``since``, read through ``emergency_updated_idx``.
+    ``render`` turns a list of emergencies into their serialized data. Each
+    event's id is the cursor to resume from.
+    """
+
+    def __init__(self, queryset, render, since, poll=STREAM_POLL_SECONDS, max_seconds=STREAM_MAX_SECONDS):
+        self.queryset = queryset
+        self.render = render
+        self.since = self.started_from = since
+        self.poll = poll
+        self.sent = {}  # id -> updated_at of rows sent within the overlap window
+        self.announced = set()
+        self.deadline = self.last_write = time.monotonic()
+        self.deadline += max_seconds
+
+    def step(self):
+        """
+        Reads the next changes once. Returns the events to send and how long
+        to wait before the next step, or None once the stream is over.
+        """
+        # Rows already sent are skipped, so fetch enough to get past them
+        rows = self.queryset.filter(updated_at__gte=self.since - STREAM_OVERLAP).order_by('updated_at', 'id')
+        changed = [
+            emergency for emergency in rows[:STREAM_BATCH + len(self.sent)]
+            if self.sent.get(emergency.pk) != emergency.updated_at
+        ][:STREAM_BATCH]
+        events = []
+        if changed:
+            for emergency, data in zip(changed, self.render(changed)):
+                if emergency.status == 'resolved':
+                    event = 'resolved'
+                elif emergency.created_at > self.started_from and emergency.pk not in self.announced:
+                    event = 'created'
+                else:
+                    event = 'updated'
+                self.announced.add(emergency.pk)
+                self.sent[emergency.pk] = emergency.updated_at
+                self.since = max(self.since, emergency.updated_at)
+                payload = json.dumps(data, cls=DjangoJSONEncoder)
+                events.append(f'id: {make_cursor(self.since)}\nevent: {event}\ndata: {payload}\n\n')
+            self.sent = {pk: updated for pk, updated in self.sent.items() if updated >= self.since - STREAM_OVERLAP}
+            self.last_write = time.monotonic()
+        elif time.monotonic() - self.last_write >= STREAM_HEARTBEAT_SECONDS:
+            events.append(': keepalive\n\n')
+            self.last_write = time.monotonic()
+
+        if time.monotonic() >= self.deadline:
+            return events, None
+        return events, 0 if len(changed) == STREAM_BATCH else self.poll
+
+
+def event_stream(*args, **kwargs):
+    """Yields the events of a ``ChangeStream``, sleeping between reads."""
+    stream = ChangeStream(*args, **kwargs)
+    yield f'retry: {STREAM_RETRY_MS}\n\n'
+    while True:
+        events, wait = stream.step()
+        yield from events
+        if wait is None:
+            return
+        time.sleep(wait)
+
+
+async def aevent_stream(*args, **kwargs):
+    """
+    ``event_stream()`` for ASGI: reads run on the database pool and the
+    waits in between hold no thread, so open boards cost no workers.
+    """
+    stream = ChangeStream(*args, **kwargs)
+    yield f'retry: {STREAM_RETRY_MS}\n\n'
+    while True:
+        events, wait = await run_pooled(stream.step)
+        for event in events:
+            yield event
+        if wait is None:
+            return
+        await asyncio.sleep(wait)
@@ -0,0 +1,99 @@
+import datetime
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .board import make_cursor, parse_cursor
+from .models import Tombstone
+
+MAX_CHANGES = 500
+# Tombstones are pruned after this long (prune_tombstones); older cursors
+# could miss deletions, so those clients have to sync from scratch.
+TOMBSTONE_DAYS = 30
+# A caught-up cursor stays this far behind now: a write that took its
+# timestamp before another but committed after it is still sent next time.
+FEED_OVERLAP = datetime.timedelta(seconds=5)
+
+
+def changes_since(queryset, since, limit=MAX_CHANGES):
+    """
+    Rows of ``queryset`` changed after ``since`` and the ids of its model
+    deleted after it, read oldest first through the ``updated_at`` index
+    and the tombstones, about ``limit`` of them together. Without ``since``
+    every row is returned and no deletions.
+
+    Returns ``(rows, deleted_ids, cursor, has_more)``. A page is only cut
+    between two timestamps, so the next one can start strictly after
+    ``cursor``. The last page's cursor is held back by ``FEED_OVERLAP``
+    and its newest changes are sent again on the next call; clients apply
+    them by id.
+    """
+    tombstones = Tombstone.objects.filter(model=queryset.model._meta.label_lower)
+    if since is None:
+        tombstones = tombstones.none()
+    else:
+        queryset = queryset.filter(updated_at__gt=since)
+        tombstones = tombstones.filter(deleted_at__gt=since)
+    queryset = queryset.order_by('updated_at', 'id')
+    tombstones = tombstones.order_by('deleted_at', 'id').values_list('deleted_at', 'object_id')
+
+    rows = list(queryset[:limit + 1])
+    deleted = list(tombstones[:limit + 1])
+    moments = sorted([row.updated_at for row in rows] + [moment for moment, _ in deleted])
+    has_more = len(moments) > limit
+    if has_more:
+        cut = moments[limit]
+        if cut == moments[0]:
+            # The whole page shares one timestamp; send all of its changes
+            rows = list(queryset.filter(updated_at__lte=cut))
+            deleted = list(tombstones.filter(deleted_at__lte=cut))
+        else:
+            rows = [row for row in rows if row.updated_at < cut]
+            deleted = [(moment, pk) for moment, pk in deleted if moment < cut]
+        cursor = max([row.updated_at for row in rows] + [moment for moment, _ in deleted])
+    else:
+        cursor = timezone.now() - FEED_OVERLAP
+        if moments:
+            cursor = min(cursor, moments[-1])
+        elif since is not None:
+            cursor = min(cursor, since)
+    return rows, [pk for _, pk in deleted], cursor, has_more
+
+
+class ChangeFeedMixin:
+    """
+    Adds ``GET <list url>/changes/?cursor=`` to a viewset whose model has an
+    indexed ``updated_at`` and records ``Tombstone`` rows on delete. The
+    viewset's filters apply to the changed rows; deletions are not
+    filtered.
+    """
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Rows changed and ids deleted since ``cursor``, or a full sync when
+        it is left out. Repeat with the returned ``cursor`` while
+        ``has_more``; ``limit`` caps a page (default and at most 500).
+        """
+        value = request.query_params.get('cursor')
+        since = None
+        if value:
+            since = parse_cursor(value)
+            if since is None:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            if since < timezone.now() - datetime.timedelta(days=TOMBSTONE_DAYS):
+                return Response({'error': 'Cursor has expired, sync again without one'}, status=status.HTTP_410_GONE)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', MAX_CHANGES)), MAX_CHANGES))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows, deleted, cursor, has_more = changes_since(self.filter_queryset(self.get_queryset()), since, limit)
+        return Response({
+            'cursor': make_cursor(cursor),
+            'has_more': has_more,
+            'results': self.get_serializer(rows, many=True).data,
+            'deleted': deleted,
+        })
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Sequence
+
+
+def version_name(model):
+    return f'version:{model._meta.label_lower}'
+
+
+def bump_versions(*models):
+    """
+    Moves the version counter (a ``Sequence`` row) of each model on, so
+    every ETag built from it changes. Call it in the writing transaction
+    wherever rows change without a signal, e.g. ``update()``.
+    """
+    for model in models:
+        name = version_name(model)
+        versions = Sequence.objects.filter(name=name)
+        if not versions.update(next_value=F('next_value') + 1):
+            Sequence.objects.bulk_create([Sequence(name=name, next_value=0)], ignore_conflicts=True)
+            versions.update(next_value=F('next_value') + 1)
+
+
+def model_versions(models):
+    """The current version of each model in one query; 0 if never written."""
+    versions = dict(Sequence.objects.filter(name__in=[version_name(model) for model in models]).values_list('name', 'next_value'))
+    return [versions.get(version_name(model), 0) for model in models]
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5('|'.join(str(part) for part in parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def etag_matches(request, etag):
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    # Proxies that compress the body turn our ETag into a weak one
+    return '*' in etags or etag in etags or f'W/{etag}' in etags
+
+
+def with_etag(response, etag):
+    response['ETag'] = etag
+    # Browsers revalidate on every request, so polling components get 304s
+    # without changes of their own
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Accept', 'Authorization'))
+    return response
+
+
+class ConditionalStats:
+    """Per-process counts of conditional GETs answered with 304 or in full, per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'not_modified': 0, 'full': 0, 'full_seconds': 0.0})
+
+    def record(self, endpoint, not_modified, seconds=0.0):
+        with self._lock:
+            counts = self._counts[endpoint]
+            if not_modified:
+                counts['not_modified'] += 1
+            else:
+                counts['full'] += 1
+                counts['full_seconds'] += seconds
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def stats(self):
+        with self._lock:
+            endpoints = {}
+            for endpoint, counts in sorted(self._counts.items()):
+                requests = counts['not_modified'] + counts['full']
+                full_ms = counts['full_seconds'] * 1000 / counts['full'] if counts['full'] else None
+                endpoints[endpoint] = {
+                    'requests': requests,
+                    'not_modified': counts['not_modified'],
+                    'hit_rate': round(counts['not_modified'] / requests, 4) if requests else None,
+                    'full_response_ms': round(full_ms, 2) if full_ms is not None else None,
+                    # Time the 304s saved, at the average cost of a full response
+                    'saved_ms': round(full_ms * counts['not_modified'], 1) if full_ms is not None else None,
+                }
+            requests = sum(endpoint['requests'] for endpoint in endpoints.values())
+            not_modified = sum(endpoint['not_modified'] for endpoint in endpoints.values())
+            return {
+                'requests': requests,
+                'not_modified': not_modified,
+                'hit_rate': round(not_modified / requests, 4) if requests else None,
+                'endpoints': endpoints,
+            }
+
+
+conditional_stats = ConditionalStats()
+
+
+def conditional_data_response(request, endpoint, data, seconds):
+    """
+    Responds with ``data`` under an ETag hashed from the payload itself, or
+    with 304 if the client has it. For payloads that are cheap to build
+    (e.g. already cached) but not to send. ``seconds`` is what building
+    ``data`` took.
+    """
+    etag = make_etag(request.get_full_path(), request.accepted_media_type, json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder))
+    not_modified = etag_matches(request, etag)
+    conditional_stats.record(endpoint, not_modified, 0.0 if not_modified else seconds)
+    return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED) if not_modified else Response(data), etag)
+
+
+class ConditionalGetMixin:
+    """
+    Answers ``list`` and ``retrieve`` with an ETag built from the request
+    and the version counters of ``etag_models`` (every model the payload
+    reads), and with 304 before any query or serializer runs when the
+    client's ``If-None-Match`` still matches.
+    """
+    etag_models = ()
+
+    def get_etag(self, request):
+        return make_etag(
+            request.get_full_path(), request.user.pk, request.accepted_media_type, *model_versions(self.etag_models)
+        )
+
+    def conditional(self, request, respond):
+        endpoint = f'{self.basename}-{self.action}'
+        etag = self.get_etag(request)
+        if etag_matches(request, etag):
+            conditional_stats.record(endpoint, True)
+            return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+        started = time.perf_counter()
+        response = respond()
+        conditional_stats.record(endpoint, False, time.perf_counter() - started)
+        return with_etag(response, etag) if response.status_code == status.HTTP_200_OK else response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
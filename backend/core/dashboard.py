@@ -0,0 +1,226 @@
+import asyncio
+
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .aio import run_pooled
+from .models import User, Patient, Doctor, Appointment, MedicalRecord, Bed, Billing, Inventory, EmergencyResponse
+from .replicas import reading_replica
+from .serializers import BedSerializer
+
+# Counts are invalidated on writes, the TTL only bounds time-based figures
+# such as "upcoming" and "today" that change without any write.
+DASHBOARD_CACHE_TTL = 60
+GENERATION_KEY = 'dashboard:generation'
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+def invalidate_dashboard_cache():
+    """
+    Bumps the generation number baked into every dashboard key, so all
+    cached role/profile payloads become unreachable at once.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+
+
+def _key(key, generation):
+    # Counts read from the replica may lag, so a user pinned to the primary
+    # must not be served them
+    source = 'replica' if reading_replica() else 'primary'
+    return f'dashboard:{generation}:{source}:{key}'
+
+
+def _cached(key):
+    key = _key(key, _generation())
+    return key, cache.get(key)
+
+
+def _merge(results):
+    data = {}
+    for result in results:
+        data.update(result)
+    return data
+
+
+def counts(key, queries):
+    """
+    The merged results of ``queries``, independent callables returning a
+    dict each, from the cache or run one after another.
+    """
+    if not queries:
+        return {}
+    key, data = _cached(key)
+    if data is None:
+        data = _merge(query() for query in queries)
+        cache.set(key, data, DASHBOARD_CACHE_TTL)
+    return data
+
+
+async def acounts(key, queries):
+    """``counts()`` for async views: on a miss the queries run concurrently, each on a pool thread."""
+    if not queries:
+        return {}
+    # On the pool too: cache.aget() would queue behind the one thread Django
+    # keeps for sync code
+    key, data = await run_pooled(_cached, key)
+    if data is None:
+        data = _merge(await asyncio.gather(*(run_pooled(query) for query in queries)))
+        await run_pooled(cache.set, key, data, DASHBOARD_CACHE_TTL)
+    return data
+
+
+def _bed_counts():
+    return Bed.objects.aggregate(
+        available_beds=Count('id', filter=Q(status='available')),
+        occupied_beds=Count('id', filter=Q(status='occupied')),
+    )
+
+
+def _inventory_counts():
+    return Inventory.objects.aggregate(
+        low_stock_items=Count('id', filter=Q(quantity__lte=F('minimum_threshold'))),
+        total_inventory_value=Count('id'),
+    )
+
+
+def _active_emergencies():
+    return {'active_emergencies': EmergencyResponse.objects.filter(status='active').count()}
+
+
+def _pending_bills():
+    return {'pending_bills': Billing.objects.filter(status='pending').count()}
+
+
+def _total_appointments():
+    return {'total_appointments': Appointment.objects.count()}
+
+
+def admin_queries():
+    return [
+        lambda: {'total_patients': Patient.objects.count()},
+        lambda: {'total_doctors': Doctor.objects.count()},
+        lambda: {'total_staff': User.objects.filter(role='staff').count()},
+        _total_appointments,
+        _bed_counts,
+        _active_emergencies,
+        _inventory_counts,
+        _pending_bills,
+    ]
+
+
+def staff_queries():
+    return [
+        _total_appointments,
+        lambda: {'available_beds': _bed_counts()['available_beds']},
+        _active_emergencies,
+        lambda: {'low_stock_items': _inventory_counts()['low_stock_items']},
+        _pending_bills,
+    ]
+
+
+def patient_queries(patient):
+    def appointments():
+        return Appointment.objects.filter(patient=patient).aggregate(
+            my_appointments=Count('id'),
+            upcoming_appointments=Count('id', filter=Q(
+                appointment_date__gte=timezone.now(),
+                status__in=['scheduled', 'confirmed'],
+            )),
+        )
+
+    def bills():
+        return Billing.objects.filter(patient=patient).aggregate(
+            my_bills=Count('id'),
+            pending_bills=Count('id', filter=Q(status='pending')),
+        )
+
+    def current_bed():
+        bed = Bed.objects.select_related('patient__user').filter(patient=patient).first()
+        return {'current_bed': dict(BedSerializer(bed).data) if bed else None}
+
+    return [
+        appointments,
+        bills,
+        lambda: {'my_medical_records': MedicalRecord.objects.filter(patient=patient).count()},
+        current_bed,
+    ]
+
+
+def doctor_queries(doctor):
+    def appointments():
+        return Appointment.objects.filter(doctor=doctor).aggregate(
+            my_appointments=Count('id'),
+            today_appointments=Count('id', filter=Q(appointment_date__date=timezone.now().date())),
+            pending_appointments=Count('id', filter=Q(status='scheduled')),
+            my_patients=Count('patient', distinct=True),
+            completed_appointments=Count('id', filter=Q(status='completed')),
+        )
+    return [appointments]
+
+
+def for_user(user):
+    """
+    What the dashboard shows ``user``: the fixed part of the payload, and
+    the cache key and queries of the counts to add to it (``counts()`` or
+    ``acounts()``). Looks up the caller's profile, so it may query.
+    """
+    if user.role == 'admin':
+        # Admin sees all data
+        return {'role': 'admin'}, 'admin', admin_queries()
+    if user.role == 'patient':
+        # Patient sees personal data
+        data = {
+            'role': 'patient',
+            'welcome_message': f'Welcome back, {user.get_full_name()}',
+        }
+        try:
+            patient_profile = user.patient_profile
+        except Patient.DoesNotExist:
+            # If profile doesn't exist, return basic data
+            data.update({
+                'error': 'Profile not found. Please contact administrator.',
+                'my_appointments': 0,
+                'upcoming_appointments': 0,
+                'my_bills': 0,
+                'pending_bills': 0,
+                'my_medical_records': 0,
+                'current_bed': None,
+            })
+            return data, None, []
+        return data, f'patient:{patient_profile.pk}', patient_queries(patient_profile)
+    if user.role == 'doctor':
+        # Doctor sees their appointments and patients
+        data = {
+            'role': 'doctor',
+            'welcome_message': f'Welcome back, Dr. {user.get_full_name()}',
+        }
+        try:
+            doctor_profile = user.doctor_profile
+        except Doctor.DoesNotExist:
+            # If profile doesn't exist, return basic data
+            data.update({
+                'error': 'Profile not found. Please contact administrator.',
+                'my_appointments': 0,
+                'today_appointments': 0,
+                'pending_appointments': 0,
+                'my_patients': 0,
+                'completed_appointments': 0,
+            })
+            return data, None, []
+        return data, f'doctor:{doctor_profile.pk}', doctor_queries(doctor_profile)
+    # Staff sees operational data
+    return {
+        'role': 'staff',
+        'welcome_message': f'Welcome back, {user.get_full_name()}',
+    }, 'staff', staff_queries()
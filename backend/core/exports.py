@@ -0,0 +1,241 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Trim
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.decorators import action
+from rest_framework.negotiation import BaseContentNegotiation
+
+from .aio import run_pooled
+from .models import BillMedicine, Payment, Prescription
+
+# Rows fetched per query. Related rows are fetched once per chunk, so an
+# export holds at most this many rows in memory whatever its size.
+EXPORT_CHUNK_SIZE = 2000
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def _full_name(prefix):
+    return Trim(Concat(f'{prefix}__first_name', Value(' '), f'{prefix}__last_name'))
+
+
+class Nested:
+    """Rows of ``model`` pointing at the exported row through ``fk``."""
+
+    def __init__(self, model, fk, fields, summary):
+        self.model = model
+        self.fk = fk
+        self.fields = fields
+        self.summary = summary
+
+    def fetch(self, ids):
+        grouped = defaultdict(list)
+        rows = self.model.objects.filter(**{f'{self.fk}__in': ids}).order_by(self.fk, 'pk').values(self.fk, **self.fields)
+        for row in rows:
+            grouped[row.pop(self.fk)].append(row)
+        return grouped
+
+
+class Dataset:
+    """
+    Shape of one export. ``columns`` are model lookups or ``(header,
+    expression)`` pairs, read with ``values()`` so no model instances are
+    built. ``nested`` relations are fetched with one query per chunk and
+    come out as lists in NDJSON and as one summary cell in CSV.
+    ``ordering`` ends with ``id``; its other fields must be columns.
+    """
+
+    def __init__(self, name, columns, ordering, nested=None):
+        self.name = name
+        self.fields = [column for column in columns if isinstance(column, str)]
+        self.expressions = dict(column for column in columns if isinstance(column, tuple))
+        self.headers = [column if isinstance(column, str) else column[0] for column in columns] + list(nested or {})
+        self.ordering = ordering
+        self.nested = nested or {}
+
+    def rows(self, queryset):
+        return (
+            queryset.select_related(None).prefetch_related(None)
+            .order_by(*self.ordering).values('pk', *self.fields, **self.expressions)
+        )
+
+    def chunks(self, queryset):
+        rows = self.rows(queryset).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        while True:
+            chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+            if not chunk:
+                return
+            self.complete(chunk)
+            yield chunk
+
+    def chunk_after(self, queryset, key=None):
+        """
+        The chunk following the row whose ordering values are ``key`` (from
+        the start without one), read with its own query, and the key of its
+        last row. Unlike ``chunks()`` no cursor stays open in between.
+        """
+        rows = self.rows(queryset)
+        if key is not None:
+            *fields, last = key
+            after = Q(pk__gt=last)
+            for field, value in reversed(list(zip(self.ordering, fields))):
+                after = Q(**{f'{field}__gt': value}) | Q(**{field: value}) & after
+            rows = rows.filter(after)
+        chunk = list(rows[:EXPORT_CHUNK_SIZE])
+        if not chunk:
+            return chunk, None
+        key = tuple(chunk[-1][field] for field in self.ordering[:-1]) + (chunk[-1]['pk'],)
+        self.complete(chunk)
+        return chunk, key
+
+    def complete(self, chunk):
+        """Adds the nested rows to ``chunk`` and drops the primary keys."""
+        ids = [row['pk'] for row in chunk]
+        for relation, nested in self.nested.items():
+            related = nested.fetch(ids)
+            for row in chunk:
+                row[relation] = related.get(row['pk'], [])
+        for row in chunk:
+            del row['pk']
+
+    def csv_row(self, row):
+        for relation, nested in self.nested.items():
+            row[relation] = '; '.join(nested.summary.format(**item) for item in row[relation])
+        return [row[header] for header in self.headers]
+
+
+DATASETS = {
+    'billings': Dataset(
+        'billings',
+        columns=(
+            'invoice_number', 'patient_id', ('medical_id', F('patient__medical_id')),
+            ('patient_name', _full_name('patient__user')), 'appointment_id',
+            'bill_type', 'status', 'description', 'created_at', 'due_date', 'paid_date',
+            'doctor_fee', 'room_charge', 'medicine_total', 'subtotal', 'tax_rate', 'tax_amount',
+            'insurance_amount', 'discount_amount', 'total_amount', 'paid_amount', 'pending_amount',
+        ),
+        ordering=('created_at', 'id'),
+        nested={
+            'medicines': Nested(
+                BillMedicine, 'bill_id',
+                {'name': F('medicine_name'), 'qty': F('quantity'), 'unit': F('unit_price'), 'total': F('total_price')},
+                '{name} x{qty} = {total}',
+            ),
+            'payments': Nested(
+                Payment, 'bill_id',
+                {'date': F('payment_date'), 'method': F('payment_method'), 'paid': F('amount'), 'reference': F('transaction_id')},
+                '{date:%Y-%m-%d} {method} {paid}',
+            ),
+        },
+    ),
+    'appointments': Dataset(
+        'appointments',
+        columns=(
+            'id', 'patient_id', ('patient_name', _full_name('patient__user')),
+            'doctor_id', ('doctor_name', _full_name('doctor__user')), ('department', F('doctor__department')),
+            'appointment_date', 'status', 'notes', 'created_at',
+        ),
+        ordering=('appointment_date', 'id'),
+    ),
+    'medical-records': Dataset(
+        'medical-records',
+        columns=(
+            'id', 'patient_id', ('patient_name', _full_name('patient__user')),
+            'doctor_id', ('doctor_name', _full_name('doctor__user')), 'appointment_id',
+            'record_date', 'diagnosis', 'treatment', 'notes',
+        ),
+        ordering=('record_date', 'id'),
+        nested={
+            'prescriptions': Nested(
+                Prescription, 'medical_record_id',
+                {'medicine': F('medicine__name'), 'qty': F('quantity'), 'dose': F('dosage'), 'days': F('duration')},
+                '{medicine} x{qty} {dose}',
+            ),
+        },
+    ),
+}
+
+
+def render(dataset, chunk, fmt, header=False):
+    """``chunk`` as CSV or NDJSON text, after the CSV header row with ``header``."""
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(dataset.headers)
+        for row in chunk:
+            writer.writerow(dataset.csv_row(row))
+    else:
+        for row in chunk:
+            buffer.write(json.dumps(row, cls=DjangoJSONEncoder))
+            buffer.write('\n')
+    return buffer.getvalue()
+
+
+def stream_rows(dataset, queryset, fmt):
+    """
+    Yields the export of ``queryset`` as CSV or NDJSON text, one chunk of
+    ``EXPORT_CHUNK_SIZE`` rows at a time.
+    """
+    header = True
+    for chunk in dataset.chunks(queryset):
+        yield render(dataset, chunk, fmt, header)
+        header = False
+    if header and fmt == 'csv':
+        yield render(dataset, [], fmt, header)
+
+
+async def astream_rows(dataset, queryset, fmt):
+    """
+    ``stream_rows()`` for ASGI, which would otherwise read a sync stream
+    into memory whole. Each chunk is read and rendered on the database
+    pool, so the export still holds one chunk at a time.
+    """
+    def step(key, header):
+        chunk, key = dataset.chunk_after(queryset, key)
+        if not chunk and not (header and fmt == 'csv'):
+            return None, None
+        return render(dataset, chunk, fmt, header), key
+
+    text, key = await run_pooled(step, None, True)
+    while text is not None:
+        yield text
+        if key is None:
+            return
+        text, key = await run_pooled(step, key, False)
+
+
+class StreamingNegotiation(BaseContentNegotiation):
+    """Streaming endpoints write their own body, so accept whatever the client asks for."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ExportMixin:
+    """
+    Adds ``GET <list url>/export/csv/`` and ``.../export/ndjson/`` to a
+    viewset. The viewset's filters (patient, doctor, status, date range,
+    ``mine``) apply; pagination does not.
+    """
+    export_dataset = None
+
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<fmt>csv|ndjson)', content_negotiation_class=StreamingNegotiation)
+    def export(self, request, fmt=None):
+        dataset = DATASETS[self.export_dataset]
+        queryset = self.filter_queryset(self.get_queryset())
+        stream = astream_rows if settings.ASYNC_READS else stream_rows
+        response = StreamingHttpResponse(stream(dataset, queryset, fmt), content_type=CONTENT_TYPES[fmt])
+        filename = f'{dataset.name}-{timezone.localdate():%Y%m%d}.{fmt}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -0,0 +1,105 @@
+import datetime
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class ScopedFilterBackend(BaseFilterBackend):
+    """
+    Database-side filtering driven by attributes declared on the viewset:
+
+    * ``filter_params`` maps a query parameter to an ORM lookup, e.g.
+      ``{'patient': 'patient_id', 'status': 'status'}``. Comma separated
+      values become an ``__in`` lookup.
+    * ``date_filter_field`` is the field ``date_from`` / ``date_to`` apply
+      to. Both bounds are inclusive and accept a date or an ISO datetime.
+    * ``mine_lookups`` maps a role to the lookup that ``mine=true`` resolves
+      against the caller's profile, e.g. ``{'patient': 'patient'}``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        for param, lookup in getattr(view, 'filter_params', {}).items():
+            value = params.get(param)
+            if value in (None, ''):
+                continue
+            values = [v.strip() for v in value.split(',') if v.strip()]
+            if lookup == 'id' or lookup.endswith('_id'):
+                values = [self._parse_id(param, v) for v in values]
+            if len(values) == 1:
+                queryset = queryset.filter(**{lookup: values[0]})
+            else:
+                queryset = queryset.filter(**{f'{lookup}__in': values})
+
+        date_field = getattr(view, 'date_filter_field', None)
+        if date_field:
+            is_datetime = isinstance(queryset.model._meta.get_field(date_field), models.DateTimeField)
+            date_from = params.get('date_from')
+            date_to = params.get('date_to')
+            if date_from:
+                bound, _ = self._parse_bound('date_from', date_from, is_datetime)
+                queryset = queryset.filter(**{f'{date_field}__gte': bound})
+            if date_to:
+                bound, exclusive = self._parse_bound('date_to', date_to, is_datetime, end=True)
+                lookup = 'lt' if exclusive else 'lte'
+                queryset = queryset.filter(**{f'{date_field}__{lookup}': bound})
+
+        if params.get('mine', '').lower() in ('true', '1', 'yes'):
+            queryset = self._filter_mine(request, queryset, view)
+
+        return queryset
+
+    def _filter_mine(self, request, queryset, view):
+        lookups = getattr(view, 'mine_lookups', {})
+        user = request.user
+        lookup = lookups.get(user.role)
+        if lookup is None:
+            # Admin and staff already see everything; "mine" is a no-op.
+            return queryset
+        profile_attr = f'{user.role}_profile'
+        try:
+            profile = getattr(user, profile_attr)
+        except ObjectDoesNotExist:
+            return queryset.none()
+        return queryset.filter(**{lookup: profile})
+
+    def _parse_id(self, param, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({param: f'Invalid id: {value}'})
+
+    def _parse_bound(self, param, value, is_datetime, end=False):
+        """
+        Returns ``(bound, exclusive)``. A bare end date on a datetime field
+        becomes an exclusive bound at midnight of the following day.
+        """
+        # Try the bare date first: parse_datetime also accepts "YYYY-MM-DD".
+        parsed = None
+        for parser in (parse_date, parse_datetime):
+            try:
+                parsed = parser(value)
+            except ValueError:
+                continue
+            if parsed is not None:
+                break
+        if parsed is None:
+            raise ValidationError({param: f'Invalid date: {value}'})
+
+        if isinstance(parsed, datetime.datetime):
+            if not is_datetime:
+                return parsed.date(), False
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            return parsed, False
+
+        if not is_datetime:
+            return parsed, False
+        if end:
+            parsed += datetime.timedelta(days=1)
+        return timezone.make_aware(datetime.datetime.combine(parsed, datetime.time.min)), end
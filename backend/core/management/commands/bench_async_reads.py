@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from core.dashboard import invalidate_dashboard_cache
+from core.models import User, Patient, Doctor, Appointment, Bed
+
+BENCH_PREFIX = 'bench-async'
+DEFAULT_PATHS = ['/api/dashboard/', '/api/beds/?page_size=100']
+
+
+def _summary(latencies, errors, seconds):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / seconds, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+    }
+
+
+def _serve_wsgi(path, token, concurrency, requests, threads, cold):
+    """``concurrency`` clients against a threaded WSGI server with ``threads`` workers."""
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+    url = urlsplit(path)
+    # A server's worker threads take queued requests in arrival order
+    workers = ThreadPoolExecutor(max_workers=threads)
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def one():
+        if cold:
+            invalidate_dashboard_cache()
+        statuses = []
+        body = handler({
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': url.path, 'QUERY_STRING': url.query,
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+            'HTTP_AUTHORIZATION': f'Token {token}', 'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+        }, lambda status, headers, exc_info=None: statuses.append(status))
+        b''.join(body)
+        body.close()
+        return statuses[0]
+
+    def client():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            started = time.perf_counter()
+            status = workers.submit(one).result()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                errors[0] += not status.startswith('200')
+
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    workers.shutdown()
+    return _summary(latencies, errors[0], time.perf_counter() - started)
+
+
+def _serve_asgi(path, token, concurrency, requests, cold):
+    """``concurrency`` clients against one ASGI event loop, as one uvicorn worker runs it."""
+    from django.core.handlers.asgi import ASGIHandler
+
+    handler = ASGIHandler()
+    url = urlsplit(path)
+    latencies, errors = [], [0]
+
+    async def one():
+        if cold:
+            invalidate_dashboard_cache()
+        sent = asyncio.Event()
+        messages = []
+
+        async def receive():
+            if not messages:
+                messages.append(None)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Nothing more to read; the client never disconnects
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body'):
+                sent.set()
+
+        await handler({
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': url.path, 'raw_path': url.path.encode(), 'query_string': url.query.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'authorization', f'Token {token}'.encode())],
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }, receive, send)
+        await sent.wait()
+        return next(m for m in messages if m and m['type'] == 'http.response.start')['status']
+
+    async def client(remaining):
+        while remaining:
+            remaining.pop()
+            started = time.perf_counter()
+            status = await one()
+            latencies.append(time.perf_counter() - started)
+            errors[0] += status != 200
+
+    async def run():
+        remaining = list(range(requests))
+        await asyncio.gather(*(client(remaining) for _ in range(concurrency)))
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    return _summary(latencies, errors[0], time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares requests/s and p99 latency of read endpoints served the WSGI way (a thread pool) '
+        'and the ASGI way (one event loop with ASYNC_READS), each in its own process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths', help=f'Endpoint to load (repeatable), default {DEFAULT_PATHS}.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Clients with a request in flight.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and mode.')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads, and ASYNC_DB_THREADS under ASGI.')
+        parser.add_argument('--cold', action='store_true', help='Invalidate the dashboard cache before every request.')
+        parser.add_argument('--seed', type=int, default=0, help='Scratch patients to add first, each with a bed and an appointment.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark rows afterwards.')
+        parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+        parser.add_argument('--token', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        if options['serve']:
+            return self.serve(options['serve'], paths[0], options)
+
+        name = f'{BENCH_PREFIX}-{int(time.time())}'
+        user = User.objects.create(username=name, role='admin')
+        token = Token.objects.create(user=user)
+        self.seed(name, options['seed'])
+        try:
+            for path in paths:
+                self.stdout.write(f'{path}: {options["concurrency"]} clients, {options["requests"]} requests, {options["threads"]} threads')
+                for mode in ('wsgi', 'asgi'):
+                    result = self.run_child(mode, path, token.key, options)
+                    self.stdout.write(
+                        f'  {mode}: {result["rps"]:8.1f} req/s  p50 {result["p50_ms"]:7.2f}ms  '
+                        f'p99 {result["p99_ms"]:7.2f}ms  errors {result["errors"]}'
+                    )
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+                Bed.objects.filter(ward__startswith=BENCH_PREFIX).delete()
+
+    def seed(self, name, count):
+        if not count:
+            return
+        users = User.objects.bulk_create([User(username=f'{name}-{n}', role='patient') for n in range(count + 1)])
+        doctor = Doctor.objects.create(user=users.pop(), license_number=name[-20:], specialty='General', department=name)
+        patients = Patient.objects.bulk_create([Patient(user=user, medical_id=f'BA{n:06d}{name[-6:]}') for n, user in enumerate(users)])
+        Bed.objects.bulk_create([
+            Bed(bed_number=f'B{name[-4:]}{n:05d}', ward=name, status='occupied', patient=patient) for n, patient in enumerate(patients)
+        ])
+        Appointment.objects.bulk_create([
+            Appointment(patient=patient, doctor=doctor, appointment_date=doctor.user.date_joined) for patient in patients
+        ])
+
+    def run_child(self, mode, path, token, options):
+        # URLs are resolved once per process, so each mode gets a fresh one
+        env = {**os.environ, 'HOSPITAL_ASYNC_READS': '1' if mode == 'asgi' else '0', 'HOSPITAL_ASYNC_DB_THREADS': str(options['threads'])}
+        command = [
+            sys.executable, sys.argv[0], 'bench_async_reads', '--serve', mode, '--path', path, '--token', token,
+            '--concurrency', str(options['concurrency']), '--requests', str(options['requests']),
+            '--threads', str(options['threads']),
+        ] + (['--cold'] if options['cold'] else [])
+        child = subprocess.run(command, env=env, capture_output=True, text=True)
+        if child.returncode:
+            raise CommandError(child.stderr)
+        return json.loads(child.stdout.strip().splitlines()[-1])
+
+    def serve(self, mode, path, options):
+        if mode == 'wsgi':
+            result = _serve_wsgi(path, options['token'], options['concurrency'], options['requests'], options['threads'], options['cold'])
+        else:
+            result = _serve_asgi(path, options['token'], options['concurrency'], options['requests'], options['cold'])
+        self.stdout.write(json.dumps(result))
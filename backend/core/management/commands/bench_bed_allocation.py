@@ -0,0 +1,95 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, OperationalError, connections
+
+from core.beds import allocate_bed
+from core.models import User, Patient, Bed
+
+BENCH_PREFIX = 'bench-beds'
+
+
+def _admit(patient_ids, ward, queue):
+    # Every forked worker needs its own database connection.
+    connections.close_all()
+    claimed, full, lock_errors = [], 0, 0
+    for patient_id in patient_ids:
+        try:
+            bed = allocate_bed(Patient(pk=patient_id), [ward], any_ward=False)
+        except (IntegrityError, OperationalError):
+            lock_errors += 1
+            continue
+        if bed is None:
+            full += 1
+        else:
+            claimed.append(bed.id)
+    connections.close_all()
+    queue.put((claimed, full, lock_errors))
+
+
+class Command(BaseCommand):
+    help = 'Admits patients from N parallel processes into one ward and reports double bookings and throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--patients', type=int, default=50, help='Admissions attempted by each worker.')
+        parser.add_argument('--beds', type=int, default=300, help='Beds in the benchmark ward (at most 9999).')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark rows afterwards.')
+
+    def handle(self, *args, **options):
+        workers, per_worker, bed_count = options['workers'], options['patients'], options['beds']
+        # bed_number is capped at 10 characters: a 5 digit run id + 4 digit bed
+        run = int(time.time()) % 100000
+        ward = f'{BENCH_PREFIX}-{run:05d}'
+        Bed.objects.bulk_create([
+            Bed(bed_number=f'Z{run:05d}{n:04d}', ward=ward, status='available')
+            for n in range(bed_count)
+        ])
+        users = User.objects.bulk_create([
+            User(username=f'{ward}-{n}', role='patient') for n in range(workers * per_worker)
+        ])
+        patients = Patient.objects.bulk_create([
+            Patient(user=user, medical_id=user.username) for user in users
+        ])
+        patient_ids = [patient.id for patient in patients]
+
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [
+            context.Process(target=_admit, args=(patient_ids[n::workers], ward, queue))
+            for n in range(workers)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        claimed = [bed_id for r in results for bed_id in r[0]]
+        full = sum(r[1] for r in results)
+        lock_errors = sum(r[2] for r in results)
+        beds = Bed.objects.filter(ward=ward)
+        occupied = beds.filter(status='occupied', patient__isnull=False).count()
+        double_booked = len(claimed) - len(set(claimed))
+
+        self.stdout.write(f'workers:            {workers} x {per_worker} admissions')
+        self.stdout.write(f'beds in ward:       {bed_count}')
+        self.stdout.write(f'beds allocated:     {len(claimed)}')
+        self.stdout.write(f'ward full:          {full}')
+        self.stdout.write(f'lock errors:        {lock_errors}')
+        self.stdout.write(f'double bookings:    {double_booked}')
+        self.stdout.write(f'occupied beds:      {occupied}')
+        self.stdout.write(f'elapsed:            {elapsed:.2f}s ({len(claimed) / elapsed:.0f} allocations/s)')
+
+        if not options['keep']:
+            beds.delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        if double_booked or occupied != len(claimed):
+            self.stderr.write(self.style.ERROR('Beds were double booked'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No double bookings'))
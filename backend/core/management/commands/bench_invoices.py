@@ -0,0 +1,87 @@
+import multiprocessing
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, OperationalError, connections
+from django.utils import timezone
+
+from core.models import User, Patient, Billing
+
+BENCH_USERNAME = 'bench-invoices'
+
+
+def _create_bills(patient_id, count, description, queue):
+    # Every forked worker needs its own database connection.
+    connections.close_all()
+    created = conflicts = lock_errors = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        try:
+            Billing(
+                patient_id=patient_id,
+                description=description,
+                due_date=timezone.now().date(),
+                doctor_fee=Decimal('500.00'),
+                tax_rate=Decimal('18.00'),
+                total_amount=0,
+            ).save()
+            created += 1
+        except IntegrityError:
+            conflicts += 1
+        except OperationalError:
+            lock_errors += 1
+    connections.close_all()
+    queue.put((created, conflicts, lock_errors, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = 'Creates bills from N parallel processes and reports invoice number conflicts and throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--bills', type=int, default=200, help='Bills created by each worker.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark bills afterwards.')
+
+    def handle(self, *args, **options):
+        workers, per_worker = options['workers'], options['bills']
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME, defaults={'role': 'patient'})
+        patient, _ = Patient.objects.get_or_create(user=user, defaults={'medical_id': BENCH_USERNAME})
+        description = f'invoice benchmark {timezone.now().isoformat()}'
+
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [
+            context.Process(target=_create_bills, args=(patient.id, per_worker, description, queue))
+            for _ in range(workers)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        created = sum(r[0] for r in results)
+        conflicts = sum(r[1] for r in results)
+        lock_errors = sum(r[2] for r in results)
+        bills = Billing.objects.filter(patient=patient, description=description)
+        distinct = bills.values('invoice_number').distinct().count()
+
+        self.stdout.write(f'workers:            {workers} x {per_worker} bills')
+        self.stdout.write(f'bills created:      {created}')
+        self.stdout.write(f'unique conflicts:   {conflicts}')
+        self.stdout.write(f'lock errors:        {lock_errors}')
+        self.stdout.write(f'distinct invoices:  {distinct}')
+        self.stdout.write(f'elapsed:            {elapsed:.2f}s ({created / elapsed:.0f} bills/s)')
+
+        if not options['keep']:
+            bills.delete()
+            user.delete()
+
+        if conflicts or distinct != created:
+            self.stderr.write(self.style.ERROR('Invoice numbers collided'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No invoice number conflicts'))
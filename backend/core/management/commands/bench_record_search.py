@@ -0,0 +1,120 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import User, Patient, Doctor, MedicalRecord
+from core.search import fts_enabled, search_records
+
+BENCH_USERNAME = 'bench-search'
+CLINICAL_TERMS = (
+    'hypertension diabetes asthma bronchitis pneumonia migraine fracture sprain anemia arrhythmia '
+    'gastritis appendicitis dermatitis sinusitis tonsillitis influenza covid tuberculosis malaria '
+    'dengue typhoid jaundice hepatitis cirrhosis nephritis cystitis arthritis osteoporosis scoliosis '
+    'tendinitis glaucoma cataract conjunctivitis otitis vertigo epilepsy neuropathy depression anxiety '
+    'insomnia obesity hypothyroidism hyperthyroidism angina infarction stroke embolism thrombosis '
+    'paracetamol ibuprofen amoxicillin azithromycin metformin insulin amlodipine atorvastatin '
+    'salbutamol omeprazole pantoprazole cetirizine prednisolone physiotherapy dressing suturing '
+    'nebulization hydration rest diet follow review chronic acute mild severe bilateral left right'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Fills scratch patients with synthetic medical records and times full-text searches over them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=200000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--patients', type=int, default=1000, help='Records are spread over this many patients.')
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark records afterwards.')
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError('The database has no FTS5 search table.')
+        rng = random.Random(42)
+        # Rare synthetic terms widen the vocabulary so selectivity looks like real notes
+        vocabulary = CLINICAL_TERMS + [f'finding{n}' for n in range(20000)]
+
+        prefix = f'{BENCH_USERNAME}-{int(time.time())}'
+        users = User.objects.bulk_create(
+            [User(username=f'{prefix}-p{n}', role='patient') for n in range(options['patients'])]
+            + [User(username=f'{prefix}-d{n}', role='doctor') for n in range(options['doctors'])]
+        )
+        patients = Patient.objects.bulk_create([
+            Patient(user=user, medical_id=user.username[-20:]) for user in users[:options['patients']]
+        ])
+        doctors = Doctor.objects.bulk_create([
+            Doctor(user=user, license_number=user.username[-20:], specialty='Benchmark', department='Benchmark')
+            for user in users[options['patients']:]
+        ])
+
+        def text(words):
+            return ' '.join(rng.choice(CLINICAL_TERMS if rng.random() < 0.7 else vocabulary) for _ in range(words))
+
+        started = time.perf_counter()
+        remaining = options['records']
+        while remaining > 0:
+            batch = min(options['batch_size'], remaining)
+            with transaction.atomic():
+                MedicalRecord.objects.bulk_create([
+                    MedicalRecord(
+                        patient=rng.choice(patients), doctor=rng.choice(doctors),
+                        diagnosis=text(4), treatment=text(10), notes=text(20),
+                    )
+                    for _ in range(batch)
+                ])
+            remaining -= batch
+        load_elapsed = time.perf_counter() - started
+        total = MedicalRecord.objects.count()
+
+        queries = [
+            ' '.join(rng.sample(CLINICAL_TERMS, rng.choice((1, 2, 2, 3))))
+            if rng.random() < 0.8 else rng.choice(vocabulary[len(CLINICAL_TERMS):])
+            for _ in range(options['queries'])
+        ]
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search_records(query, limit=20)
+            timings.append((time.perf_counter() - started) * 1000)
+        recent = []
+        for query in queries:
+            started = time.perf_counter()
+            search_records(query, limit=20, order='recent')
+            recent.append((time.perf_counter() - started) * 1000)
+        filtered = []
+        for query in queries:
+            started = time.perf_counter()
+            if rng.random() < 0.5:
+                search_records(query, patient=rng.choice(patients).id, limit=20)
+            else:
+                search_records(query, doctor=rng.choice(doctors).id, limit=20)
+            filtered.append((time.perf_counter() - started) * 1000)
+
+        def percentile(values, share):
+            return sorted(values)[min(len(values) - 1, int(len(values) * share))]
+
+        self.stdout.write(f'records inserted:   {options["records"]} in {load_elapsed:.1f}s (index kept in sync by triggers)')
+        self.stdout.write(f'records in table:   {total}')
+        self.stdout.write(f'queries:            {len(timings)}')
+        self.stdout.write(f'median:             {statistics.median(timings):.1f} ms')
+        self.stdout.write(f'p95:                {percentile(timings, 0.95):.1f} ms')
+        self.stdout.write(f'max:                {max(timings):.1f} ms')
+        self.stdout.write(f'recent median:      {statistics.median(recent):.1f} ms (order=recent, no bm25)')
+        self.stdout.write(f'recent p95:         {percentile(recent, 0.95):.1f} ms')
+        self.stdout.write(f'filtered median:    {statistics.median(filtered):.1f} ms (by patient or doctor)')
+        self.stdout.write(f'filtered p95:       {percentile(filtered, 0.95):.1f} ms')
+
+        if not options['keep']:
+            # Raw delete skips loading every record into the collector;
+            # the FTS triggers still drop the index entries.
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    'DELETE FROM core_medicalrecord WHERE patient_id IN (%s)' % ', '.join(['%s'] * len(patients)),
+                    [patient.id for patient in patients],
+                )
+            User.objects.filter(username__startswith=prefix).delete()
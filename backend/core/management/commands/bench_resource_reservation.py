@@ -0,0 +1,96 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from core.models import User, Patient, Resource, EmergencyResponse, ResourceReservation
+from core.resources import ResourceUnavailable, reserve_resources
+
+BENCH_PREFIX = 'bench-resources'
+
+
+def _reserve(emergency_ids, resource_id, units, queue):
+    # Every forked worker needs its own database connection.
+    connections.close_all()
+    reserved, short, lock_errors = 0, 0, 0
+    for emergency_id in emergency_ids:
+        try:
+            reserve_resources([(emergency_id, resource_id, units)])
+        except ResourceUnavailable:
+            short += 1
+        except OperationalError:
+            lock_errors += 1
+        else:
+            reserved += units
+    connections.close_all()
+    queue.put((reserved, short, lock_errors))
+
+
+class Command(BaseCommand):
+    help = 'Reserves one pool of ventilators from N parallel processes and reports over-allocation and throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=20, help='Reservations attempted by each worker.')
+        parser.add_argument('--units', type=int, default=1, help='Ventilators asked for by each reservation.')
+        parser.add_argument('--ventilators', type=int, default=100, help='Ventilators in the pool.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark rows afterwards.')
+
+    def handle(self, *args, **options):
+        workers, per_worker, units, pool = (
+            options['workers'], options['requests'], options['units'], options['ventilators']
+        )
+        name = f'{BENCH_PREFIX}-{int(time.time())}'
+        resource = Resource.objects.create(
+            name=name, category='equipment', total_quantity=pool, available_quantity=pool, location=name
+        )
+        user = User.objects.create(username=name, role='patient')
+        patient = Patient.objects.create(user=user, medical_id=name[-20:])
+        emergencies = EmergencyResponse.objects.bulk_create([
+            EmergencyResponse(patient=patient, description=name, priority='critical')
+            for _ in range(workers * per_worker)
+        ])
+        emergency_ids = [emergency.id for emergency in emergencies]
+
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [
+            context.Process(target=_reserve, args=(emergency_ids[n::workers], resource.id, units, queue))
+            for n in range(workers)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        reserved = sum(r[0] for r in results)
+        short = sum(r[1] for r in results)
+        lock_errors = sum(r[2] for r in results)
+        resource.refresh_from_db()
+        held = sum(ResourceReservation.objects.filter(resource=resource).values_list('quantity', flat=True))
+        attempts = workers * per_worker
+
+        self.stdout.write(f'workers:            {workers} x {per_worker} reservations of {units}')
+        self.stdout.write(f'ventilators:        {pool}')
+        self.stdout.write(f'units reserved:     {reserved}')
+        self.stdout.write(f'refused (short):    {short}')
+        self.stdout.write(f'lock errors:        {lock_errors}')
+        self.stdout.write(f'available after:    {resource.available_quantity}')
+        self.stdout.write(f'held by ledger:     {held}')
+        self.stdout.write(f'elapsed:            {elapsed:.2f}s ({attempts / elapsed:.0f} requests/s)')
+
+        over_allocated = reserved > pool or held != reserved or resource.available_quantity != pool - reserved
+
+        if not options['keep']:
+            resource.delete()
+            user.delete()
+
+        if over_allocated:
+            self.stderr.write(self.style.ERROR('Ventilators were over-allocated'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No over-allocation'))
@@ -0,0 +1,203 @@
+import argparse
+import copy
+import io
+import json
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.authtoken.models import Token
+
+from core.beds import release_bed
+from core.models import User, Patient, Bed, Billing
+
+BENCH_PREFIX = 'bench-writes'
+MODES = ['default', 'tuned', 'serialized']
+
+
+def _configure(mode):
+    """Puts this process's connections in ``mode`` before the first one opens."""
+    database = connections['default'].settings_dict
+    if mode == 'default':
+        # Django's stock SQLite connection: rollback journal, deferred
+        # transactions, 5s busy timeout, a new connection per request
+        database['OPTIONS'] = {}
+        database['CONN_MAX_AGE'] = 0
+    else:
+        # The opt-in profile, whether or not HOSPITAL_SQLITE_TUNED is set
+        database.update(copy.deepcopy(settings.SQLITE_TUNED_DATABASE))
+    settings.SERIALIZE_WRITES = mode == 'serialized'
+
+
+def _journal_mode(mode):
+    connections.close_all()
+    database = sqlite3.connect(connections['default'].settings_dict['NAME'])
+    database.execute(f'PRAGMA journal_mode={mode}')
+    database.close()
+
+
+def _serve(token, ward, patient_ids, iterations):
+    """
+    One thread per patient, each a worker thread of a threaded WSGI server
+    taking requests back to back: bill the patient, allocate them a bed
+    in ``ward`` and release it again.
+    """
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+    lock = threading.Lock()
+    latencies, counts = [], {'ok': 0, 'lock_errors': 0, 'errors': 0}
+
+    def request(path, payload):
+        body = json.dumps(payload).encode()
+        statuses = []
+        started = time.perf_counter()
+        response = handler({
+            'REQUEST_METHOD': 'POST', 'PATH_INFO': path, 'QUERY_STRING': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+            'HTTP_AUTHORIZATION': f'Token {token}', 'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body), 'wsgi.url_scheme': 'http',
+        }, lambda status, headers, exc_info=None: statuses.append(status))
+        content = b''.join(response)
+        response.close()
+        elapsed = time.perf_counter() - started
+        ok = statuses[0][0] == '2'
+        with lock:
+            latencies.append(elapsed)
+            if ok:
+                counts['ok'] += 1
+            elif b'database is locked' in content:
+                counts['lock_errors'] += 1
+            else:
+                counts['errors'] += 1
+        return json.loads(content) if ok else None
+
+    def client(patient_id):
+        today = time.strftime('%Y-%m-%d')
+        for _ in range(iterations):
+            request('/api/billings/', {
+                'patient': patient_id, 'doctor_fee': 500, 'description': ward, 'due_date': today,
+            })
+            bed = request('/api/beds/allocate/', {'patient_id': patient_id, 'ward': ward, 'any_ward': False})
+            if bed:
+                request(f'/api/beds/{bed["id"]}/release_bed/', {})
+
+    # Ready once Django is loaded; the parent starts every process at once
+    sys.stdout.write('ready\n')
+    sys.stdout.flush()
+    sys.stdin.readline()
+    started = time.time()
+    clients = [threading.Thread(target=client, args=(patient_id,)) for patient_id in patient_ids]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return {**counts, 'started': started, 'finished': time.time(), 'latencies': latencies}
+
+
+class Command(BaseCommand):
+    help = (
+        'Bills patients and allocates and releases beds through the API from parallel processes and threads, '
+        'and reports requests/s, p99 latency and "database is locked" errors with Django\'s stock SQLite '
+        'connection (default), the HOSPITAL_SQLITE_TUNED profile in settings (tuned) and the tuned profile with SERIALIZE_WRITES '
+        '(serialized).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Server processes.')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads per process.')
+        parser.add_argument('--iterations', type=int, default=20, help='Bill, allocate and release rounds per thread.')
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES, help=f'Mode to run (repeatable), default all of {MODES}.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark rows afterwards.')
+        parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+        parser.add_argument('--token', help=argparse.SUPPRESS)
+        parser.add_argument('--ward', help=argparse.SUPPRESS)
+        parser.add_argument('--patients', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['serve']:
+            _configure(options['serve'])
+            patient_ids = [int(patient_id) for patient_id in options['patients'].split(',')]
+            result = _serve(options['token'], options['ward'], patient_ids, options['iterations'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        processes, threads = options['processes'], options['threads']
+        name = f'{BENCH_PREFIX}-{int(time.time())}'
+        admin = User.objects.create(username=name, role='admin')
+        token = Token.objects.create(user=admin)
+        users = User.objects.bulk_create([User(username=f'{name}-{n}', role='patient') for n in range(processes * threads)])
+        patients = Patient.objects.bulk_create([Patient(user=user, medical_id=f'BW{n:05d}{name[-8:]}') for n, user in enumerate(users)])
+        # One bed per thread, so allocations only fail on lock errors
+        Bed.objects.bulk_create([Bed(bed_number=f'W{name[-4:]}{n:05d}', ward=name) for n in range(processes * threads)])
+        patient_ids = [patient.id for patient in patients]
+
+        self.stdout.write(
+            f'{processes} processes x {threads} threads x {options["iterations"]} rounds '
+            f'(bill, allocate, release)'
+        )
+        try:
+            for mode in options['modes'] or MODES:
+                result = self.run_mode(mode, token.key, name, patient_ids, options)
+                self.stdout.write(
+                    f'  {mode:>10}: {result["rps"]:7.1f} req/s  p50 {result["p50_ms"]:7.2f}ms  '
+                    f'p99 {result["p99_ms"]:8.2f}ms  lock errors {result["lock_errors"]}  other errors {result["errors"]}'
+                )
+        finally:
+            if not options['keep']:
+                Billing.objects.filter(description=name).delete()
+                User.objects.filter(username__startswith=name).delete()
+                Bed.objects.filter(ward=name).delete()
+            if not settings.SQLITE_TUNED:
+                # The tuned runs switched the file to WAL
+                _journal_mode('DELETE')
+
+    def run_mode(self, mode, token, ward, patient_ids, options):
+        # Beds a failed release left occupied in the previous mode
+        for bed in Bed.objects.filter(ward=ward, patient__isnull=False):
+            release_bed(bed)
+        connections.close_all()
+        if mode == 'default':
+            # WAL is a property of the database file; undo it for the stock run
+            _journal_mode('DELETE')
+
+        threads = options['threads']
+        children = [
+            subprocess.Popen(
+                [
+                    sys.executable, sys.argv[0], 'bench_sqlite_writes', '--serve', mode, '--token', token,
+                    '--ward', ward, '--iterations', str(options['iterations']),
+                    '--patients', ','.join(str(patient_id) for patient_id in patient_ids[n * threads:(n + 1) * threads]),
+                ],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            )
+            for n in range(options['processes'])
+        ]
+        for child in children:
+            if child.stdout.readline().strip() != 'ready':
+                raise CommandError(child.communicate()[1])
+        for child in children:
+            child.stdin.write('go\n')
+            child.stdin.flush()
+        results = []
+        for child in children:
+            stdout, stderr = child.communicate()
+            if child.returncode:
+                raise CommandError(stderr)
+            results.append(json.loads(stdout.strip().splitlines()[-1]))
+
+        latencies = sorted(latency for result in results for latency in result['latencies'])
+        seconds = max(result['finished'] for result in results) - min(result['started'] for result in results)
+        return {
+            'rps': len(latencies) / seconds,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            'lock_errors': sum(result['lock_errors'] for result in results),
+            'errors': sum(result['errors'] for result in results),
+        }
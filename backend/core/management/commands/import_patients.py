@@ -0,0 +1,49 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.patient_import import PatientImporter, read_records
+
+
+class Command(BaseCommand):
+    help = 'Streams patients from a CSV or NDJSON file into User, Patient and Token rows in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Processes used to hash passwords.',
+        )
+        parser.add_argument('--no-tokens', action='store_true', help='Do not create API tokens.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'ndjson'):
+            raise CommandError('Pass --format csv or --format ndjson')
+
+        importer = PatientImporter(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            create_tokens=not options['no_tokens'],
+            progress=self.report,
+        )
+        with open(path, 'rb') as stream:
+            importer.run(read_records(stream, fmt))
+
+        for skipped in importer.skipped[:20]:
+            self.stderr.write(f"row {skipped['row']}: {skipped['error']}")
+        if len(importer.skipped) > 20:
+            self.stderr.write(f'... and {len(importer.skipped) - 20} more skipped rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.imported} patients, skipped {len(importer.skipped)}, '
+            f'in {importer.elapsed:.1f}s ({importer.rate:.0f} rows/s)'
+        ))
+
+    def report(self, importer):
+        self.stdout.write(
+            f'{importer.imported} imported, {len(importer.skipped)} skipped, '
+            f'{importer.elapsed:.1f}s, {importer.rate:.0f} rows/s'
+        )
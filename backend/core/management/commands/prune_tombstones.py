@@ -0,0 +1,16 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.changes import TOMBSTONE_DAYS
+from core.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Deletes change feed tombstones older than the feed accepts cursors for.'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=TOMBSTONE_DAYS)
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} tombstones older than {TOMBSTONE_DAYS} days deleted'))
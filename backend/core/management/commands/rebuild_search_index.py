@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the medical record full-text index from the records and prescriptions tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError('The database has no FTS5 search table; search falls back to LIKE queries.')
+        started = time.perf_counter()
+
+        def progress(indexed):
+            self.stdout.write(f'{indexed} records indexed')
+
+        indexed = rebuild_index(options['batch_size'], progress if options['verbosity'] > 1 else None)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} records in {elapsed:.1f}s'))
@@ -0,0 +1,48 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.models import Billing, Payment
+from core.revenue import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds any day of the revenue rollup that no longer matches its bills and payments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Check this many days up to today.')
+        parser.add_argument('--from', dest='date_from', help='Check from this date instead (YYYY-MM-DD).')
+        parser.add_argument('--all', action='store_true', help='Check from the first bill or payment; use once to backfill.')
+
+    def handle(self, *args, **options):
+        end = timezone.localdate()
+        if options['all']:
+            first = [
+                timezone.localdate(value) for value in (
+                    Billing.objects.aggregate(first=Min('created_at'))['first'],
+                    Payment.objects.aggregate(first=Min('payment_date'))['first'],
+                ) if value
+            ]
+            if not first:
+                self.stdout.write('No bills or payments yet.')
+                return
+            start = min(first)
+        elif options['date_from']:
+            start = parse_date(options['date_from'])
+            if start is None:
+                raise CommandError(f'Invalid date: {options["date_from"]}')
+        else:
+            start = end - datetime.timedelta(days=options['days'] - 1)
+
+        started = time.perf_counter()
+        rebuilt = reconcile(start, end)
+        for day in rebuilt:
+            self.stdout.write(f'rebuilt {day}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(rebuilt)} of {(end - start).days + 1} days rebuilt ({start} to {end}) '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies the SQLite database to the read replica snapshot (HOSPITAL_REPLICA_DB) with the online '
+        'backup API. Writers carry on during the copy; readers switch to the new snapshot on their next request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Snapshot path, default HOSPITAL_REPLICA_DB.')
+        parser.add_argument(
+            '--every', type=int, default=0,
+            help='Keep running and refresh again every N seconds instead of exiting.',
+        )
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.REPLICA_SNAPSHOT
+        if not output:
+            raise CommandError('Set HOSPITAL_REPLICA_DB or pass --output')
+        if connection.vendor != 'sqlite':
+            raise CommandError('Snapshots are only taken of SQLite databases; use the database\'s own replication')
+        while True:
+            self.refresh(output)
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def refresh(self, output):
+        started = time.perf_counter()
+        connection.ensure_connection()
+        partial = f'{output}.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        snapshot = sqlite3.connect(partial)
+        try:
+            # One step, so the copy is a single consistent read of the database
+            connection.connection.backup(snapshot)
+            # Read-only connections cannot open a WAL database without its -shm file
+            snapshot.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            snapshot.close()
+        # Open connections keep reading the old file until they close
+        os.replace(partial, output)
+        self.stdout.write(self.style.SUCCESS(
+            f'{output}: {os.path.getsize(output) / 2 ** 20:.1f} MiB in {(time.perf_counter() - started) * 1000:.0f}ms'
+        ))
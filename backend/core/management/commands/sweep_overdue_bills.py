@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.sweeper import sweep_overdue_bills
+
+
+class Command(BaseCommand):
+    help = 'Marks pending bills past their due date as overdue, in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between batches.')
+        parser.add_argument(
+            '--every', type=int, default=0,
+            help='Keep running and sweep again every N seconds instead of exiting.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.sweep(options['batch_size'], options['pause'])
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def sweep(self, batch_size, pause):
+        total_rows, total_seconds, batches = 0, 0.0, 0
+        for rows, seconds in sweep_overdue_bills(batch_size=batch_size, pause=pause):
+            batches += 1
+            total_rows += rows
+            total_seconds += seconds
+            self.stdout.write(f'batch {batches}: {rows} bills marked overdue in {seconds * 1000:.1f}ms')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total_rows} bills marked overdue in {batches} batches ({total_seconds * 1000:.1f}ms)'
+        ))
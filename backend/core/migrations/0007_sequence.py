@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+def seed_invoice_sequence(apps, schema_editor):
+    # Start past every invoice number the old "last id + 1" scheme issued.
+    Billing = apps.get_model('core', 'Billing')
+    Sequence = apps.get_model('core', 'Sequence')
+    highest = Billing.objects.aggregate(models.Max('id'))['id__max'] or 0
+    for invoice_number in Billing.objects.values_list('invoice_number', flat=True).iterator():
+        suffix = invoice_number.rsplit('-', 1)[-1]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    Sequence.objects.update_or_create(name='invoice', defaults={'next_value': highest + 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_appointment_billing_record_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(seed_invoice_sequence, migrations.RunPython.noop),
+    ]
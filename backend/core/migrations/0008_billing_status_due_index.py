@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billing',
+            index=models.Index(fields=['status', 'due_date'], name='bill_status_due_idx'),
+        ),
+    ]
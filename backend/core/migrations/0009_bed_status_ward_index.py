@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_billing_status_due_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bed',
+            index=models.Index(fields=['status', 'ward'], name='bed_status_ward_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-18 18:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_current_stays(apps, schema_editor):
+    # Beds occupied before the history existed get an open stay from now on.
+    Bed = apps.get_model('core', 'Bed')
+    BedAssignment = apps.get_model('core', 'BedAssignment')
+    BedAssignment.objects.bulk_create([
+        BedAssignment(bed_id=bed_id, patient_id=patient_id)
+        for bed_id, patient_id in Bed.objects.filter(patient__isnull=False).values_list('id', 'patient_id')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_bed_status_ward_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BedAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assigned_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bed_assignments', to='core.appointment')),
+                ('bed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='core.bed')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bed_assignments', to='core.patient')),
+            ],
+            options={
+                'ordering': ['-assigned_at'],
+                'indexes': [models.Index(fields=['bed', 'assigned_at'], name='bedassign_bed_assigned_idx'), models.Index(fields=['patient', 'assigned_at'], name='bedassign_patient_idx'), models.Index(fields=['released_at'], name='bedassign_released_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('released_at__isnull', True)), fields=('bed',), name='bedassign_one_open_per_bed')],
+            },
+        ),
+        migrations.RunPython(open_current_stays, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 6.0 on 2026-10-18 19:05
+
+from django.db import migrations
+
+# Concatenated "medicine dosage instructions" of the prescriptions on record X
+PRESCRIPTIONS = '''COALESCE((
+    SELECT group_concat(m.name || ' ' || p.dosage || ' ' || p.instructions, ' ')
+    FROM core_prescription p JOIN core_medicine m ON m.id = p.medicine_id
+    WHERE p.medical_record_id = {record}
+), '')'''
+
+# Patient and doctor as tokens, so filters intersect posting lists inside FTS
+SCOPE = "'p' || {row}.patient_id || ' d' || {row}.doctor_id"
+
+CREATE = [
+    "CREATE VIRTUAL TABLE core_medicalrecord_fts USING fts5("
+    "diagnosis, treatment, notes, prescriptions, scope, tokenize = 'porter unicode61 remove_diacritics 2')",
+
+    "CREATE TRIGGER core_medicalrecord_fts_insert AFTER INSERT ON core_medicalrecord BEGIN "
+    "INSERT INTO core_medicalrecord_fts (rowid, diagnosis, treatment, notes, prescriptions, scope) "
+    f"VALUES (new.id, new.diagnosis, new.treatment, new.notes, '', {SCOPE.format(row='new')}); END",
+
+    "CREATE TRIGGER core_medicalrecord_fts_update "
+    "AFTER UPDATE OF diagnosis, treatment, notes, patient_id, doctor_id ON core_medicalrecord BEGIN "
+    "UPDATE core_medicalrecord_fts SET diagnosis = new.diagnosis, treatment = new.treatment, notes = new.notes, "
+    f"scope = {SCOPE.format(row='new')} WHERE rowid = new.id; END",
+
+    "CREATE TRIGGER core_medicalrecord_fts_delete AFTER DELETE ON core_medicalrecord BEGIN "
+    "DELETE FROM core_medicalrecord_fts WHERE rowid = old.id; END",
+
+    "CREATE TRIGGER core_prescription_fts_insert AFTER INSERT ON core_prescription BEGIN "
+    f"UPDATE core_medicalrecord_fts SET prescriptions = {PRESCRIPTIONS.format(record='new.medical_record_id')} "
+    "WHERE rowid = new.medical_record_id; END",
+
+    "CREATE TRIGGER core_prescription_fts_update AFTER UPDATE ON core_prescription BEGIN "
+    f"UPDATE core_medicalrecord_fts SET prescriptions = {PRESCRIPTIONS.format(record='new.medical_record_id')} "
+    "WHERE rowid = new.medical_record_id; "
+    f"UPDATE core_medicalrecord_fts SET prescriptions = {PRESCRIPTIONS.format(record='old.medical_record_id')} "
+    "WHERE rowid = old.medical_record_id AND old.medical_record_id != new.medical_record_id; END",
+
+    "CREATE TRIGGER core_prescription_fts_delete AFTER DELETE ON core_prescription BEGIN "
+    f"UPDATE core_medicalrecord_fts SET prescriptions = {PRESCRIPTIONS.format(record='old.medical_record_id')} "
+    "WHERE rowid = old.medical_record_id; END",
+
+    "CREATE TRIGGER core_medicine_fts_update AFTER UPDATE OF name ON core_medicine BEGIN "
+    f"UPDATE core_medicalrecord_fts SET prescriptions = {PRESCRIPTIONS.format(record='core_medicalrecord_fts.rowid')} "
+    "WHERE rowid IN (SELECT medical_record_id FROM core_prescription WHERE medicine_id = new.id); END",
+
+    "INSERT INTO core_medicalrecord_fts (rowid, diagnosis, treatment, notes, prescriptions, scope) "
+    f"SELECT r.id, r.diagnosis, r.treatment, r.notes, {PRESCRIPTIONS.format(record='r.id')}, {SCOPE.format(row='r')} "
+    "FROM core_medicalrecord r",
+]
+
+DROP = [
+    'DROP TRIGGER IF EXISTS core_medicine_fts_update',
+    'DROP TRIGGER IF EXISTS core_prescription_fts_delete',
+    'DROP TRIGGER IF EXISTS core_prescription_fts_update',
+    'DROP TRIGGER IF EXISTS core_prescription_fts_insert',
+    'DROP TRIGGER IF EXISTS core_medicalrecord_fts_delete',
+    'DROP TRIGGER IF EXISTS core_medicalrecord_fts_update',
+    'DROP TRIGGER IF EXISTS core_medicalrecord_fts_insert',
+    'DROP TABLE IF EXISTS core_medicalrecord_fts',
+]
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_search_index(apps, schema_editor):
+    # Other databases, or SQLite without FTS5, fall back to LIKE search.
+    if fts5_available(schema_editor):
+        for statement in CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_doctor_schedule'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
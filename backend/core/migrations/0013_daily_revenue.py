@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 19:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_medicalrecord_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bill_type', models.CharField(choices=[('consultation', 'Consultation'), ('treatment', 'Treatment'), ('medicine', 'Medicine'), ('room', 'Room Charges'), ('surgery', 'Surgery'), ('emergency', 'Emergency'), ('other', 'Other')], max_length=20)),
+                ('payment_method', models.CharField(blank=True, choices=[('cash', 'Cash'), ('card', 'Credit/Debit Card'), ('upi', 'UPI'), ('bank_transfer', 'Bank Transfer'), ('insurance', 'Insurance')], max_length=20)),
+                ('bills', models.IntegerField(default=0)),
+                ('billed_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tax_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payments', models.IntegerField(default=0)),
+                ('collected_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='billing',
+            index=models.Index(fields=['created_at'], name='bill_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailyrevenue',
+            name='doctor',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.doctor'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyrevenue',
+            index=models.Index(fields=['day'], name='revenue_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenue',
+            constraint=models.UniqueConstraint(condition=models.Q(('doctor__isnull', False)), fields=('day', 'bill_type', 'doctor', 'payment_method'), name='revenue_day_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenue',
+            constraint=models.UniqueConstraint(condition=models.Q(('doctor__isnull', True)), fields=('day', 'bill_type', 'payment_method'), name='revenue_day_key_no_doctor'),
+        ),
+    ]
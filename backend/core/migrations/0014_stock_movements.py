@@ -0,0 +1,63 @@
+# Generated by Django 6.0 on 2026-10-18 19:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_opening_stock(apps, schema_editor):
+    # Stock on hand before the ledger existed becomes an opening adjustment.
+    Inventory = apps.get_model('core', 'Inventory')
+    StockMovement = apps.get_model('core', 'StockMovement')
+    StockMovement.objects.bulk_create([
+        StockMovement(item_id=item_id, kind='adjust', change=quantity, balance=quantity, notes='Opening balance')
+        for item_id, quantity in Inventory.objects.filter(quantity__gt=0).values_list('id', 'quantity')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_daily_revenue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('receipt', 'Receipt'), ('dispense', 'Dispense'), ('adjust', 'Adjustment'), ('expire', 'Expired')], max_length=20)),
+                ('change', models.IntegerField()),
+                ('balance', models.IntegerField(help_text='Stock on hand after this movement')),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('quantity__lte', models.F('minimum_threshold'))), fields=['id'], name='inventory_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['expiry_date'], name='inventory_expiry_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='core.inventory'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['item', 'created_at'], name='stockmove_item_created_idx'),
+        ),
+        migrations.RunPython(record_opening_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 19:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_stock_movements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('reserved_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+                ('emergency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.emergencyresponse')),
+                ('reserved_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.resource')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['emergency', 'released_at'], name='resreserve_emergency_idx')],
+            },
+        ),
+    ]
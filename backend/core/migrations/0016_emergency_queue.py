@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 19:44
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+PRIORITY_RANKS = {'critical': 1, 'high': 2, 'medium': 3, 'low': 4}
+
+
+def rank_existing(apps, schema_editor):
+    EmergencyResponse = apps.get_model('core', 'EmergencyResponse')
+    for priority, rank in PRIORITY_RANKS.items():
+        EmergencyResponse.objects.filter(priority=priority).update(priority_rank=rank)
+    # Rows predating the column were last touched when created or resolved
+    EmergencyResponse.objects.update(updated_at=Coalesce('resolved_at', 'created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_resource_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyresponse',
+            name='priority_rank',
+            field=models.PositiveSmallIntegerField(default=3, editable=False),
+        ),
+        migrations.AddField(
+            model_name='emergencyresponse',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyresponse',
+            index=models.Index(fields=['status', 'priority_rank', 'created_at'], name='emergency_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyresponse',
+            index=models.Index(fields=['updated_at'], name='emergency_updated_idx'),
+        ),
+        migrations.RunPython(rank_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-18 20:37
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def default_empty_slots(apps, schema_editor):
+    # Zero-minute slots were accepted before; give them the default length.
+    Doctor = apps.get_model('core', 'Doctor')
+    Doctor.objects.filter(slot_minutes=0).update(slot_minutes=30)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(default_empty_slots, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='doctor',
+            name='slot_minutes',
+            field=models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddConstraint(
+            model_name='doctor',
+            constraint=models.CheckConstraint(condition=models.Q(('slot_minutes__gte', 1)), name='doctor_slot_minutes_positive'),
+        ),
+    ]
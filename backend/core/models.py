@@ -1,3 +1,6 @@
+import datetime
+
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
@@ -14,6 +17,11 @@ class User(AbstractUser):
     address = models.TextField(blank=True)
     date_of_birth = models.DateField(null=True, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['role'], name='user_role_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.role})"
 
@@ -36,6 +44,17 @@ class Doctor(models.Model):
     specialty = models.CharField(max_length=100)
     department = models.CharField(max_length=100)
     available = models.BooleanField(default=True)
+    # Scheduling: slot length, daily hours (local time) and weekdays worked, Monday = 0
+    slot_minutes = models.PositiveSmallIntegerField(default=30, validators=[MinValueValidator(1)])
+    work_start = models.TimeField(default=datetime.time(9, 0))
+    work_end = models.TimeField(default=datetime.time(17, 0))
+    working_days = models.CharField(max_length=7, default='01234')
+
+    class Meta:
+        constraints = [
+            # A zero-length slot would never advance the slot search
+            models.CheckConstraint(condition=models.Q(slot_minutes__gte=1), name='doctor_slot_minutes_positive'),
+        ]
 
     def __str__(self):
         return f"Dr. {self.user.first_name} {self.user.last_name} - {self.specialty}"
@@ -55,6 +74,17 @@ class Appointment(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'appointment_date'], name='appt_patient_date_idx'),
+            models.Index(fields=['doctor', 'appointment_date'], name='appt_doctor_date_idx'),
+            # The list's (appointment_date, id) order, unfiltered, by date range or by status
+            models.Index(fields=['appointment_date'], name='appt_date_idx'),
+            models.Index(fields=['status', 'appointment_date'], name='appt_status_date_idx'),
+            models.Index(fields=['updated_at'], name='appt_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Appointment: {self.patient} with {self.doctor} on {self.appointment_date}"
@@ -69,6 +99,12 @@ class MedicalRecord(models.Model):
     record_date = models.DateTimeField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'record_date'], name='record_patient_date_idx'),
+            models.Index(fields=['doctor', 'record_date'], name='record_doctor_date_idx'),
+        ]
+
     def __str__(self):
         return f"Record for {self.patient} - {self.diagnosis}"
 
@@ -82,10 +118,47 @@ class Bed(models.Model):
     ward = models.CharField(max_length=50)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
     patient = models.OneToOneField(Patient, on_delete=models.SET_NULL, null=True, blank=True, related_name='bed')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'ward'], name='bed_status_ward_idx'),
+            models.Index(fields=['ward'], name='bed_ward_idx'),
+            models.Index(fields=['updated_at'], name='bed_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Bed {self.bed_number} - {self.ward}"
 
+class BedAssignment(models.Model):
+    """One stay of a patient in a bed; ``released_at`` stays empty while it is open."""
+    bed = models.ForeignKey(Bed, on_delete=models.CASCADE, related_name='assignments')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='bed_assignments')
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='bed_assignments')
+    assigned_at = models.DateTimeField(default=timezone.now)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-assigned_at']
+        constraints = [
+            # Also the index release uses to find the open stay of a bed
+            models.UniqueConstraint(
+                fields=['bed'], condition=models.Q(released_at__isnull=True), name='bedassign_one_open_per_bed'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['bed', 'assigned_at'], name='bedassign_bed_assigned_idx'),
+            models.Index(fields=['patient', 'assigned_at'], name='bedassign_patient_idx'),
+            models.Index(fields=['released_at'], name='bedassign_released_idx'),
+        ]
+
+    @property
+    def length_of_stay(self):
+        return (self.released_at or timezone.now()) - self.assigned_at
+
+    def __str__(self):
+        return f"{self.patient} in {self.bed}"
+
 class Resource(models.Model):
     name = models.CharField(max_length=100)
     category = models.CharField(max_length=50)
@@ -115,6 +188,17 @@ class Prescription(models.Model):
     def __str__(self):
         return f"{self.medicine.name} - {self.quantity} units for {self.medical_record.patient}"
 
+class Sequence(models.Model):
+    """
+    Named counter: blocks of numbers handed out by core.sequences, and the
+    per-model versions ETags are built from (core.conditional).
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
 class BillMedicine(models.Model):
     bill = models.ForeignKey('Billing', on_delete=models.CASCADE, related_name='medicines')
     medicine_name = models.CharField(max_length=100)
@@ -142,6 +226,11 @@ class Payment(models.Model):
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ]
+
 class Billing(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -196,13 +285,25 @@ class Billing(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'status'], name='bill_patient_status_idx'),
+            models.Index(fields=['patient', 'created_at'], name='bill_patient_created_idx'),
+            models.Index(fields=['status', 'due_date'], name='bill_status_due_idx'),
+            models.Index(fields=['created_at'], name='bill_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         # Auto-generate invoice number
         if not self.invoice_number:
-            last_bill = Billing.objects.order_by('-id').first()
-            next_number = (last_bill.id + 1) if last_bill else 1
-            self.invoice_number = f"INV-{next_number:06d}"
+            from .sequences import new_invoice_number
+            self.invoice_number = new_invoice_number()
 
+        self.calculate_totals()
+        super().save(*args, **kwargs)
+
+    def calculate_totals(self):
+        """Fills in the derived amounts and status in memory, without saving."""
         # Calculate totals
         self.subtotal = self.doctor_fee + self.room_charge + self.medicine_total
         self.tax_amount = (self.subtotal * self.tax_rate) / 100
@@ -210,6 +311,8 @@ class Billing(models.Model):
         self.pending_amount = self.total_amount - self.paid_amount
 
         # Update status based on payments
+        if self.status == 'cancelled':
+            return
         if self.pending_amount <= 0:
             self.status = 'paid'
             if not self.paid_date:
@@ -219,11 +322,49 @@ class Billing(models.Model):
         elif self.due_date < timezone.now().date():
             self.status = 'overdue'
 
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return f"Invoice {self.invoice_number} - {self.patient} - ₹{self.total_amount}"
 
+class DailyRevenue(models.Model):
+    """
+    Per-day totals of bills raised and payments taken, kept current by
+    ``core.revenue`` as bills and payments are written. Bills land in rows
+    with a blank ``payment_method``; payments in rows for their method.
+    """
+    day = models.DateField()
+    bill_type = models.CharField(max_length=20, choices=Billing.BILL_TYPE_CHOICES)
+    # The doctor of the bill's appointment. No database constraint, so a
+    # deleted doctor leaves old totals in place until reconciliation.
+    doctor = models.ForeignKey(
+        Doctor, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHOD_CHOICES, blank=True)
+
+    bills = models.IntegerField(default=0)
+    billed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payments = models.IntegerField(default=0)
+    collected_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'bill_type', 'doctor', 'payment_method'],
+                condition=models.Q(doctor__isnull=False), name='revenue_day_key',
+            ),
+            models.UniqueConstraint(
+                fields=['day', 'bill_type', 'payment_method'],
+                condition=models.Q(doctor__isnull=True), name='revenue_day_key_no_doctor',
+            ),
+        ]
+        # The partial unique indexes above cannot serve plain date ranges
+        indexes = [
+            models.Index(fields=['day'], name='revenue_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.bill_type} {self.payment_method or 'billed'}"
+
 class Inventory(models.Model):
     name = models.CharField(max_length=100)
     category = models.CharField(max_length=50)
@@ -232,6 +373,17 @@ class Inventory(models.Model):
     supplier = models.CharField(max_length=100, blank=True)
     expiry_date = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Partial index holding only the low-stock rows in cursor order,
+            # which SQLite uses for the ``quantity <= minimum_threshold`` filter
+            models.Index(
+                fields=['id'], condition=models.Q(quantity__lte=models.F('minimum_threshold')),
+                name='inventory_low_stock_idx',
+            ),
+            models.Index(fields=['expiry_date'], name='inventory_expiry_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - Qty: {self.quantity}"
 
@@ -239,11 +391,44 @@ class Inventory(models.Model):
     def is_low_stock(self):
         return self.quantity <= self.minimum_threshold
 
+class StockMovement(models.Model):
+    """
+    One change to an item's stock. ``change`` is signed: receipts add,
+    dispenses and expiries take away, adjustments go either way.
+    """
+    KIND_CHOICES = [
+        ('receipt', 'Receipt'),
+        ('dispense', 'Dispense'),
+        ('adjust', 'Adjustment'),
+        ('expire', 'Expired'),
+    ]
+
+    item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    change = models.IntegerField()
+    balance = models.IntegerField(help_text='Stock on hand after this movement')
+    reference = models.CharField(max_length=100, blank=True)
+    notes = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['item', 'created_at'], name='stockmove_item_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.change:+d} {self.item.name}"
+
 class EmergencyResponse(models.Model):
     STATUS_CHOICES = [
         ('active', 'Active'),
         ('resolved', 'Resolved'),
     ]
+    # Most severe first when sorted ascending
+    PRIORITY_RANKS = {'critical': 1, 'high': 2, 'medium': 3, 'low': 4}
+
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='emergencies')
     description = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
@@ -253,10 +438,62 @@ class EmergencyResponse(models.Model):
         ('high', 'High'),
         ('critical', 'Critical'),
     ], default='medium')
+    priority_rank = models.PositiveSmallIntegerField(default=3, editable=False)
     resources_allocated = models.ManyToManyField(Resource, blank=True)
     staff_assigned = models.ManyToManyField(User, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     resolved_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'priority_rank', 'created_at'], name='emergency_queue_idx'),
+            models.Index(fields=['updated_at'], name='emergency_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.priority_rank = self.PRIORITY_RANKS.get(self.priority, self.PRIORITY_RANKS['medium'])
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'priority' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'priority_rank'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Emergency: {self.patient} - {self.priority}"
+
+class ResourceReservation(models.Model):
+    """
+    Units of a ``Resource`` held by an emergency. While ``released_at`` is
+    empty they are taken out of the resource's ``available_quantity``.
+    """
+    emergency = models.ForeignKey(EmergencyResponse, on_delete=models.CASCADE, related_name='reservations')
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    reserved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    reserved_at = models.DateTimeField(default=timezone.now)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['emergency', 'released_at'], name='resreserve_emergency_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.resource.name} for {self.emergency}"
+
+class Tombstone(models.Model):
+    """
+    Marks a deleted row so change feeds can tell clients to drop it.
+    ``model`` is the deleted row's ``app_label.model_name``.
+    """
+    model = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at}"
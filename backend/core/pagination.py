@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination used by every router-registered viewset.
+
+    Each viewset declares a stable ``cursor_ordering`` such as
+    ``('appointment_date', 'id')`` so the next page is fetched with a
+    ``WHERE`` on the leading column instead of an ``OFFSET``, keeping page
+    latency flat as the table grows.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-id',)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering:
+            if isinstance(ordering, str):
+                return (ordering,)
+            return tuple(ordering)
+        return super().get_ordering(request, queryset, view)
+
+
+class ReferenceTablePagination(BasePagination):
+    """
+    Opt-out for small reference tables (doctors, resources) which are
+    always returned whole, but wrapped in the same envelope as
+    ``KeysetPagination`` so clients can read ``results`` everywhere.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return list(queryset)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', None),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,229 @@
+import csv
+import io
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from rest_framework.authtoken.models import Token
+
+from .conditional import bump_versions
+from .dashboard import invalidate_dashboard_cache
+from .models import User, Patient
+from .sequences import SequenceAllocator
+
+USER_FIELDS = ('email', 'first_name', 'last_name', 'phone', 'address')
+PATIENT_FIELDS = ('blood_group', 'allergies', 'emergency_contact', 'emergency_phone')
+
+# Imported patients without a medical_id get one from this counter. The
+# "MRN" prefix keeps them apart from the "P<user id>" ids made at signup.
+medical_ids = SequenceAllocator('medical_id', block_size=1000)
+
+
+class UnreadableRecord(str):
+    """Yielded by ``read_records()`` for a line it could not parse, so the row is skipped with its number."""
+
+
+def read_records(stream, fmt):
+    """
+    Yields one dict per patient from a binary or text stream holding CSV
+    (with a header row) or NDJSON, without loading the whole file.
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield UnreadableRecord(f'invalid JSON: {e}')
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def _clean(record):
+    """
+    ``record`` with every imported field as checked text (the date of birth
+    parsed), or a ``ValueError`` naming the first bad field. Lengths and
+    formats are those of the model fields, so ``bulk_create()`` cannot fail
+    on one row and take its batch down.
+    """
+    if isinstance(record, UnreadableRecord):
+        raise ValueError(record)
+    if not isinstance(record, dict):
+        raise ValueError('expected an object')
+    cleaned = {}
+    for model, names in ((User, ('username',) + USER_FIELDS), (Patient, ('medical_id',) + PATIENT_FIELDS)):
+        for name in names:
+            value = record.get(name)
+            if isinstance(value, (dict, list, bool)):
+                raise ValueError(f'{name} must be text')
+            value = '' if value is None else str(value).strip()
+            if value:
+                try:
+                    model._meta.get_field(name).run_validators(value)
+                except ValidationError as e:
+                    raise ValueError(f'{name}: {" ".join(e.messages)}')
+            cleaned[name] = value
+    if not cleaned['username']:
+        raise ValueError('username is required')
+    raw_date = record.get('date_of_birth') or ''
+    try:
+        cleaned['date_of_birth'] = parse_date(raw_date) if isinstance(raw_date, str) else None
+    except ValueError:
+        cleaned['date_of_birth'] = None
+    if raw_date and cleaned['date_of_birth'] is None:
+        raise ValueError(f'invalid date_of_birth {raw_date}')
+    password = record.get('password')
+    cleaned['password'] = password if isinstance(password, str) else ''
+    return cleaned
+
+
+class PatientImporter:
+    """
+    Creates ``User``, ``Patient`` and ``Token`` rows for a stream of
+    records with ``bulk_create``, one transaction per batch.
+
+    Duplicate checks are one ``IN`` query per batch rather than a probe per
+    row, and passwords are hashed across a process pool when ``workers``
+    is above one. Records without a password get an unusable one, which
+    costs nothing to "hash". Rows that fail validation are left out and
+    listed in ``skipped`` with their row number.
+    """
+
+    def __init__(self, batch_size=1000, workers=1, create_tokens=True, progress=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.create_tokens = create_tokens
+        self.progress = progress
+        self.imported = 0
+        self.skipped = []
+        self.started = None
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started if self.started else 0.0
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.imported / elapsed if elapsed else 0.0
+
+    def run(self, records):
+        self.started = time.perf_counter()
+        records = iter(records)
+        pool = None
+        if self.workers > 1:
+            pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        try:
+            row_number = 0
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                numbered = list(enumerate(batch, start=row_number + 1))
+                row_number += len(batch)
+                self._import_batch(numbered, pool)
+                if self.progress:
+                    self.progress(self)
+        finally:
+            if pool:
+                pool.shutdown()
+        if self.imported:
+            invalidate_dashboard_cache()
+        return self
+
+    def _skip(self, row, reason):
+        self.skipped.append({'row': row, 'error': reason})
+
+    def _new_medical_ids(self, count, explicit):
+        """
+        ``count`` generated medical ids, passing over any already taken or
+        given ``explicit``ly in the batch. An explicit id in a later batch
+        that matches one generated here is skipped as already existing.
+        """
+        ids = []
+        while len(ids) < count:
+            fresh = [f'MRN{number:07d}' for number in medical_ids.reserve(count - len(ids))]
+            taken = explicit | set(Patient.objects.filter(medical_id__in=fresh).values_list('medical_id', flat=True))
+            ids += [medical_id for medical_id in fresh if medical_id not in taken]
+        return ids
+
+    def _import_batch(self, numbered, pool):
+        # Drop rows that are invalid or clash with each other or the database
+        valid, usernames, ids = [], set(), set()
+        for row, record in numbered:
+            try:
+                record = _clean(record)
+            except ValueError as e:
+                self._skip(row, str(e))
+                continue
+            username, medical_id = record['username'], record['medical_id']
+            if username in usernames:
+                self._skip(row, f'duplicate username {username} in file')
+            elif medical_id and medical_id in ids:
+                self._skip(row, f'duplicate medical_id {medical_id} in file')
+            else:
+                usernames.add(username)
+                if medical_id:
+                    ids.add(medical_id)
+                valid.append((row, record, username, medical_id))
+
+        taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        taken_ids = set(Patient.objects.filter(medical_id__in=ids).values_list('medical_id', flat=True))
+        rows = []
+        for row, record, username, medical_id in valid:
+            if username in taken_usernames:
+                self._skip(row, f'username {username} already exists')
+            elif medical_id in taken_ids:
+                self._skip(row, f'medical_id {medical_id} already exists')
+            else:
+                rows.append((record, username, medical_id))
+        if not rows:
+            return
+
+        raw_passwords = [record['password'] for record, _, _ in rows]
+        to_hash = [password for password in raw_passwords if password]
+        if pool and len(to_hash) > 1:
+            hashed = iter(pool.map(make_password, to_hash, chunksize=max(1, len(to_hash) // (self.workers * 4))))
+        else:
+            hashed = iter(map(make_password, to_hash))
+
+        users, patients = [], []
+        for (record, username, medical_id), raw in zip(rows, raw_passwords):
+            users.append(User(
+                username=username,
+                password=next(hashed) if raw else make_password(None),
+                role='patient',
+                date_of_birth=record['date_of_birth'],
+                **{field: record[field] for field in USER_FIELDS},
+            ))
+            patients.append(Patient(
+                medical_id=medical_id,
+                **{field: record[field] for field in PATIENT_FIELDS},
+            ))
+
+        generated = [patient for patient in patients if not patient.medical_id]
+        if generated:
+            explicit = {patient.medical_id for patient in patients if patient.medical_id}
+            for patient, medical_id in zip(generated, self._new_medical_ids(len(generated), explicit)):
+                patient.medical_id = medical_id
+
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            for user, patient in zip(users, patients):
+                patient.user = user
+            Patient.objects.bulk_create(patients)
+            if self.create_tokens:
+                Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+            # bulk_create() sends no post_save signals
+            bump_versions(User, Patient)
+        self.imported += len(users)
@@ -0,0 +1,58 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import revenue
+from .dashboard import invalidate_dashboard_cache
+from .models import Billing, Payment
+
+
+class Overpayment(Exception):
+    """Some payments came to more than their bill had pending; nothing was recorded."""
+
+    def __init__(self, bill_ids):
+        self.bill_ids = bill_ids
+        super().__init__(f'Payments exceed the pending amount of bill {", ".join(str(pk) for pk in bill_ids)}')
+
+
+def record_payments(payments):
+    """
+    Inserts ``Payment`` rows (dicts of model fields) and rolls them up into
+    their bills. Each bill gets one ``UPDATE`` that adds to ``paid_amount``
+    in SQL, matching only while the bill has that much pending, so
+    concurrent cashiers posting against the same bill can neither
+    overwrite each other nor pay it past zero. If any bill would be
+    overpaid, raises ``Overpayment`` and nothing is recorded. Returns the
+    saved payments.
+    """
+    payments = [Payment(**data) for data in payments]
+    totals = defaultdict(Decimal)
+    for payment in payments:
+        totals[payment.bill_id] += payment.amount
+
+    now = timezone.now()
+    with transaction.atomic():
+        overpaid = []
+        for bill_id in sorted(totals):
+            amount = totals[bill_id]
+            # Every right-hand side below sees the row as it was before the
+            # update, so "settled" compares against the old pending amount.
+            settled = Q(pending_amount__lte=amount)
+            if not Billing.objects.filter(pk=bill_id, pending_amount__gte=amount).update(
+                paid_amount=F('paid_amount') + amount,
+                pending_amount=F('pending_amount') - amount,
+                status=Case(When(settled, then=Value('paid')), default=Value('partially_paid')),
+                paid_date=Case(When(settled, then=Coalesce(F('paid_date'), Value(now))), default=F('paid_date')),
+                updated_at=now,
+            ):
+                overpaid.append(bill_id)
+        if overpaid:
+            raise Overpayment(overpaid)
+        Payment.objects.bulk_create(payments)
+        revenue.add_payments(payments)
+    invalidate_dashboard_cache()
+    return payments
@@ -0,0 +1,134 @@
+import contextvars
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+# True while the running handler may read from the replica
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def reading_replica():
+    return bool(settings.REPLICA_DATABASE and _replica_reads.get())
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(user):
+    """Sends ``user``'s reads to the primary until the replica has caught up with their write."""
+    cache.set(_pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(_pin_key(user.pk)) is not None
+
+
+def start_replica_reads(user):
+    """
+    Sends this context's reads to the replica, unless none is configured
+    or ``user`` is pinned to the primary. Returns the token to hand to
+    ``stop_replica_reads()``, or None.
+    """
+    if not settings.REPLICA_DATABASE or is_pinned(user):
+        return None
+    return _replica_reads.set(True)
+
+
+def stop_replica_reads(token):
+    if token is not None:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def replica_reads(user):
+    token = start_replica_reads(user)
+    try:
+        yield
+    finally:
+        stop_replica_reads(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Routes reads to ``REPLICA_DATABASE`` inside ``replica_reads()`` only,
+    and never from within a transaction or once the handler has written,
+    so a handler always reads its own writes. Everything else stays on
+    ``default``.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_replica() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return settings.REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        _replica_reads.set(False)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != settings.REPLICA_DATABASE
+
+
+class ReplicaReadsMixin:
+    """
+    Runs ``replica_actions`` (every safe request on a view without
+    actions) against the replica. Authentication and permission checks run
+    first, on the primary, so a token issued a moment ago still works.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Not in finalize_response(), which an unhandled error skips: a
+            # worker thread would carry on reading the replica
+            stop_replica_reads(self._replica_token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        action = getattr(self, 'action', None)
+        if request.method in SAFE_METHODS and (action is None or action in self.replica_actions):
+            self._replica_token = start_replica_reads(request.user)
+
+
+@sync_and_async_middleware
+def replica_pin_middleware(get_response):
+    """
+    Pins a user who just wrote (an unsafe request that succeeded) to the
+    primary for ``REPLICA_PIN_SECONDS``. Their next reads then see the
+    write even if they would otherwise go to a replica that has not
+    caught up.
+    """
+    def wrote(request, response):
+        user = getattr(request, 'user', None)
+        return (
+            settings.REPLICA_DATABASE and request.method not in SAFE_METHODS
+            and response.status_code < 400 and user is not None and user.is_authenticated
+        )
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            if wrote(request, response):
+                await cache.aset(_pin_key(request.user.pk), True, settings.REPLICA_PIN_SECONDS)
+            return response
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            response = get_response(request)
+            if wrote(request, response):
+                pin_to_primary(request.user)
+            return response
+    return middleware
@@ -0,0 +1,77 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import EmergencyResponse, Resource, ResourceReservation
+
+
+class ResourceUnavailable(Exception):
+    """Not enough units of some resources were free; nothing was reserved."""
+
+    def __init__(self, resource_ids):
+        self.resource_ids = resource_ids
+        super().__init__(f'Not enough units available of resource {", ".join(str(pk) for pk in resource_ids)}')
+
+
+def reserve_resources(allocations, user=None):
+    """
+    Reserves ``allocations``, ``(emergency_id, resource_id, quantity)``
+    tuples, in one transaction and links the resources to their
+    emergencies. Returns the new ``ResourceReservation`` rows.
+
+    Each resource gets one ``UPDATE`` taking its total in SQL, matching only
+    while that many units are free, so competing commanders can never
+    over-allocate. If any resource is short, raises ``ResourceUnavailable``
+    and nothing is reserved.
+    """
+    wanted = defaultdict(int)
+    for _, resource_id, quantity in allocations:
+        wanted[resource_id] += quantity
+
+    with transaction.atomic():
+        short = [
+            resource_id for resource_id in sorted(wanted)
+            if not Resource.objects.filter(pk=resource_id, available_quantity__gte=wanted[resource_id]).update(
+                available_quantity=F('available_quantity') - wanted[resource_id]
+            )
+        ]
+        if short:
+            raise ResourceUnavailable(short)
+        reservations = ResourceReservation.objects.bulk_create([
+            ResourceReservation(emergency_id=emergency_id, resource_id=resource_id, quantity=quantity, reserved_by=user)
+            for emergency_id, resource_id, quantity in allocations
+        ])
+        EmergencyResponse.resources_allocated.through.objects.bulk_create([
+            EmergencyResponse.resources_allocated.through(emergencyresponse_id=emergency_id, resource_id=resource_id)
+            for emergency_id, resource_id in {(emergency_id, resource_id) for emergency_id, resource_id, _ in allocations}
+        ], ignore_conflicts=True)
+        # update() skips auto_now; the change feeds must see the new reservations
+        EmergencyResponse.objects.filter(
+            pk__in={emergency_id for emergency_id, _, _ in allocations}
+        ).update(updated_at=timezone.now())
+    return reservations
+
+
+def release_resources(emergency):
+    """
+    Closes the emergency's open reservations and returns their units. The
+    close is a single ``UPDATE``, so a second concurrent release finds
+    nothing left to return. Returns the number of units released.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        closed = ResourceReservation.objects.filter(emergency=emergency, released_at__isnull=True).update(released_at=now)
+        if not closed:
+            return 0
+        held = (
+            ResourceReservation.objects.filter(emergency=emergency, released_at=now)
+            .values('resource_id').annotate(units=Sum('quantity')).order_by('resource_id')
+        )
+        released = 0
+        for row in held:
+            Resource.objects.filter(pk=row['resource_id']).update(available_quantity=F('available_quantity') + row['units'])
+            released += row['units']
+        EmergencyResponse.objects.filter(pk=emergency.pk).update(updated_at=now)
+    return released
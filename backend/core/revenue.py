@@ -0,0 +1,258 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncYear
+from django.utils import timezone
+
+from .models import Appointment, Billing, DailyRevenue, Payment
+from .writes import serialized_writes
+
+# Bills in these states are not revenue and drop out of the rollup
+VOID_STATUSES = ('cancelled',)
+MEASURES = ('bills', 'billed_amount', 'tax_amount', 'payments', 'collected_amount')
+CENT = Decimal('0.01')
+PERIODS = {'day': F('day'), 'month': TruncMonth('day'), 'year': TruncYear('day')}
+GROUPS = {'bill_type': 'bill_type', 'doctor': 'doctor_id', 'payment_method': 'payment_method'}
+RECONCILE_BATCH_DAYS = 500
+
+
+def _zero():
+    return [0, Decimal('0.00'), Decimal('0.00'), 0, Decimal('0.00')]
+
+
+def _day(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def bill_totals(bills):
+    """
+    Rollup contributions of ``bills``, dicts with ``created_at``,
+    ``bill_type``, ``doctor_id``, ``status``, ``total_amount`` and
+    ``tax_amount``, keyed by ``(day, bill_type, doctor_id, '')``.
+    """
+    totals = defaultdict(_zero)
+    for bill in bills:
+        if bill['status'] in VOID_STATUSES:
+            continue
+        row = totals[(_day(bill['created_at']), bill['bill_type'], bill['doctor_id'], '')]
+        row[0] += 1
+        row[1] += Decimal(bill['total_amount']).quantize(CENT)
+        row[2] += Decimal(bill['tax_amount']).quantize(CENT)
+    return totals
+
+
+def payment_totals(payments):
+    """
+    Rollup contributions of ``payments``, dicts with ``payment_date``,
+    ``payment_method``, ``amount`` and their bill's ``bill_type`` and
+    ``doctor_id``.
+    """
+    totals = defaultdict(_zero)
+    for payment in payments:
+        row = totals[(_day(payment['payment_date']), payment['bill_type'], payment['doctor_id'], payment['payment_method'])]
+        row[3] += 1
+        row[4] += Decimal(payment['amount']).quantize(CENT)
+    return totals
+
+
+def _bill_values(bills):
+    return bills.values(
+        'created_at', 'bill_type', 'status', 'total_amount', 'tax_amount', doctor_id=F('appointment__doctor_id')
+    )
+
+
+def _payment_values(payments):
+    return payments.values(
+        'payment_date', 'payment_method', 'amount',
+        bill_type=F('bill__bill_type'), doctor_id=F('bill__appointment__doctor_id'),
+    )
+
+
+def contribution(instance, with_payments=True):
+    """
+    What a saved bill or payment currently adds to the rollup, read back
+    from the database. A bill's includes its payments, which move with it
+    when its type or appointment changes.
+    """
+    if isinstance(instance, Payment):
+        return payment_totals(_payment_values(Payment.objects.filter(pk=instance.pk)))
+    totals = bill_totals(_bill_values(Billing.objects.filter(pk=instance.pk)))
+    if with_payments:
+        totals.update(payment_totals(_payment_values(Payment.objects.filter(bill_id=instance.pk))))
+    return totals
+
+
+def appointment_contribution(appointment_id):
+    """
+    What the bills of an appointment, and their payments, add to the
+    rollup. It is keyed on the appointment's doctor, so this moves when
+    the appointment is given to another doctor.
+    """
+    totals = bill_totals(_bill_values(Billing.objects.filter(appointment_id=appointment_id)))
+    totals.update(payment_totals(_payment_values(Payment.objects.filter(bill__appointment_id=appointment_id))))
+    return totals
+
+
+def apply(totals, subtract=None):
+    """
+    Adds ``totals`` minus ``subtract`` to the rollup rows. Each row gets one
+    ``UPDATE`` adding the difference in SQL, so concurrent writers to the
+    same day cannot overwrite each other.
+    """
+    subtract = subtract or {}
+    deltas = {}
+    for key in set(totals) | set(subtract):
+        delta = [new - old for new, old in zip(totals.get(key, _zero()), subtract.get(key, _zero()))]
+        if any(delta):
+            deltas[key] = delta
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        DailyRevenue.objects.bulk_create([
+            DailyRevenue(day=day, bill_type=bill_type, doctor_id=doctor_id, payment_method=method)
+            for day, bill_type, doctor_id, method in deltas
+        ], ignore_conflicts=True)
+        for (day, bill_type, doctor_id, method), delta in deltas.items():
+            DailyRevenue.objects.filter(
+                day=day, bill_type=bill_type, doctor_id=doctor_id, payment_method=method
+            ).update(**{measure: F(measure) + value for measure, value in zip(MEASURES, delta) if value})
+
+
+def _doctor_ids(appointment_ids):
+    if not appointment_ids:
+        return {}
+    return dict(Appointment.objects.filter(pk__in=appointment_ids).values_list('id', 'doctor_id'))
+
+
+def add_bills(bills):
+    """Adds bulk-created ``Billing`` instances, which send no signals, to the rollup."""
+    doctors = _doctor_ids({bill.appointment_id for bill in bills if bill.appointment_id})
+    apply(bill_totals(
+        {
+            'created_at': bill.created_at, 'bill_type': bill.bill_type, 'status': bill.status,
+            'total_amount': bill.total_amount, 'tax_amount': bill.tax_amount,
+            'doctor_id': doctors.get(bill.appointment_id),
+        }
+        for bill in bills
+    ))
+
+
+def add_payments(payments):
+    """Adds bulk-created ``Payment`` instances, which send no signals, to the rollup."""
+    bills = {
+        bill_id: (bill_type, doctor_id)
+        for bill_id, bill_type, doctor_id in Billing.objects.filter(
+            pk__in={payment.bill_id for payment in payments}
+        ).values_list('id', 'bill_type', 'appointment__doctor_id')
+    }
+    apply(payment_totals(
+        {
+            'payment_date': payment.payment_date, 'payment_method': payment.payment_method,
+            'amount': payment.amount, 'bill_type': bills[payment.bill_id][0], 'doctor_id': bills[payment.bill_id][1],
+        }
+        for payment in payments
+    ))
+
+
+def source_totals(start, end):
+    """Rollup rows for local days ``start`` to ``end`` recomputed from bills and payments."""
+    lower = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))
+    upper = timezone.make_aware(datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min))
+    totals = defaultdict(_zero)
+    bills = (
+        Billing.objects.filter(created_at__gte=lower, created_at__lt=upper).exclude(status__in=VOID_STATUSES)
+        .values('bill_type', day=TruncDate('created_at'), doctor_id=F('appointment__doctor_id'))
+        .annotate(count=Count('id'), billed=Sum('total_amount'), tax=Sum('tax_amount'))
+        .order_by()
+    )
+    # SQLite sums decimals as floats, so round back to cents
+    for row in bills:
+        totals[(row['day'], row['bill_type'], row['doctor_id'], '')][:3] = [
+            row['count'], row['billed'].quantize(CENT), row['tax'].quantize(CENT),
+        ]
+    payments = (
+        Payment.objects.filter(payment_date__gte=lower, payment_date__lt=upper)
+        .values(
+            'payment_method', day=TruncDate('payment_date'),
+            bill_type=F('bill__bill_type'), doctor_id=F('bill__appointment__doctor_id'),
+        )
+        .annotate(count=Count('id'), collected=Sum('amount'))
+        .order_by()
+    )
+    for row in payments:
+        totals[(row['day'], row['bill_type'], row['doctor_id'], row['payment_method'])][3:] = [
+            row['count'], row['collected'].quantize(CENT),
+        ]
+    return totals
+
+
+def _by_day(totals):
+    days = defaultdict(dict)
+    for key, row in totals.items():
+        if any(row):
+            days[key[0]][key] = tuple(row)
+    return days
+
+
+def reconcile(start, end):
+    """
+    Compares the rollup for days ``start`` to ``end`` with a fresh
+    aggregate of bills and payments and rewrites every day that differs,
+    e.g. after ``update()`` calls, raw SQL or deleted doctors; saved bills,
+    payments and appointment reassignments are kept in step by signals.
+    Returns the rebuilt days.
+
+    Each ``RECONCILE_BATCH_DAYS`` window is aggregated and rewritten in one
+    transaction under the write lock, so a payment posted meanwhile is
+    either in both the totals and the rows they replace or in neither.
+    """
+    drifted = []
+    while start <= end:
+        window_end = min(end, start + datetime.timedelta(days=RECONCILE_BATCH_DAYS - 1))
+        with serialized_writes(), transaction.atomic():
+            drifted += _reconcile_window(start, window_end)
+        start = window_end + datetime.timedelta(days=1)
+    return drifted
+
+
+def _reconcile_window(start, end):
+    expected = source_totals(start, end)
+    current = {}
+    for row in DailyRevenue.objects.filter(day__range=(start, end)).values(
+        'day', 'bill_type', 'doctor_id', 'payment_method', *MEASURES
+    ):
+        current[(row['day'], row['bill_type'], row['doctor_id'], row['payment_method'])] = [row[m] for m in MEASURES]
+
+    expected_days, current_days = _by_day(expected), _by_day(current)
+    drifted = sorted(
+        day for day in set(expected_days) | set(current_days) if expected_days.get(day) != current_days.get(day)
+    )
+    if drifted:
+        days = set(drifted)
+        DailyRevenue.objects.filter(day__in=days).delete()
+        DailyRevenue.objects.bulk_create([
+            DailyRevenue(
+                day=day, bill_type=bill_type, doctor_id=doctor_id, payment_method=method,
+                **dict(zip(MEASURES, row)),
+            )
+            for (day, bill_type, doctor_id, method), row in expected.items()
+            if day in days and any(row)
+        ], batch_size=1000)
+    return drifted
+
+
+def revenue_report(rollups, period='month', group_by=()):
+    """
+    Totals of the ``DailyRevenue`` queryset ``rollups`` per ``period`` (day,
+    month or year) and per ``group_by`` dimensions, as one aggregate query.
+    """
+    fields = ['period', *(GROUPS[group] for group in group_by)]
+    return list(
+        rollups.annotate(period=PERIODS[period]).values(*fields)
+        .annotate(**{measure: Sum(measure) for measure in MEASURES})
+        .order_by(*fields)
+    )
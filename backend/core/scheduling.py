@@ -0,0 +1,96 @@
+import bisect
+import datetime
+import heapq
+from itertools import islice
+
+from django.db.models import FilteredRelation, Q
+from django.utils import timezone
+
+from .models import Appointment
+
+# Appointments in these states no longer hold their slot
+RELEASED_STATUSES = ('cancelled',)
+MAX_SEARCH_DAYS = 90
+
+
+def conflicting_appointments(doctor, start, exclude=None):
+    """
+    Appointments of ``doctor`` overlapping a slot starting at ``start``.
+    Every appointment lasts one slot, so that is anything starting less
+    than a slot either side: a range scan on ``appt_doctor_date_idx``.
+    """
+    slot = datetime.timedelta(minutes=doctor.slot_minutes)
+    conflicts = Appointment.objects.filter(
+        doctor=doctor, appointment_date__gt=start - slot, appointment_date__lt=start + slot
+    ).exclude(status__in=RELEASED_STATUSES)
+    if exclude is not None and exclude.pk:
+        conflicts = conflicts.exclude(pk=exclude.pk)
+    return conflicts
+
+
+def _working_slots(doctor, start, end):
+    """Yields the slot start times of ``doctor`` in ``[start, end)``, in order."""
+    slot = datetime.timedelta(minutes=doctor['slot_minutes'])
+    days = {int(day) for day in doctor['working_days'] if day.isdigit()}
+    day = timezone.localtime(start).date()
+    while timezone.make_aware(datetime.datetime.combine(day, datetime.time.min)) < end:
+        if day.weekday() in days:
+            slot_start = timezone.make_aware(datetime.datetime.combine(day, doctor['work_start']))
+            day_end = timezone.make_aware(datetime.datetime.combine(day, doctor['work_end']))
+            while slot_start + slot <= day_end and slot_start < end:
+                if slot_start >= start:
+                    yield slot_start
+                slot_start += slot
+        day += datetime.timedelta(days=1)
+
+
+def _free_slots(doctor, booked, start, end):
+    slot = datetime.timedelta(minutes=doctor['slot_minutes'])
+    for slot_start in _working_slots(doctor, start, end):
+        # First booking starting after slot_start - slot; a clash if it
+        # also starts before the slot ends.
+        i = bisect.bisect_right(booked, slot_start - slot)
+        if i == len(booked) or booked[i] >= slot_start + slot:
+            yield slot_start, doctor['id'], slot_start + slot
+
+
+def free_slots(doctors, start, count, days=14):
+    """
+    The next ``count`` open slots from ``start`` across ``doctors`` (a
+    ``Doctor`` queryset), earliest first, looking ``days`` ahead.
+
+    Doctors and their bookings inside the window come back in a single
+    query: the bookings are a filtered ``LEFT JOIN`` that only reads the
+    window from the ``(doctor, appointment_date)`` index, so years of past
+    appointments cost nothing.
+    """
+    end = start + datetime.timedelta(days=min(days, MAX_SEARCH_DAYS))
+    rows = doctors.annotate(
+        booked=FilteredRelation('appointments', condition=Q(
+            appointments__appointment_date__gt=start - datetime.timedelta(days=1),
+            appointments__appointment_date__lt=end,
+        ) & ~Q(appointments__status__in=RELEASED_STATUSES)),
+    ).values(
+        'id', 'slot_minutes', 'work_start', 'work_end', 'working_days',
+        'user__first_name', 'user__last_name', 'booked__appointment_date',
+    ).order_by('id', 'booked__appointment_date')
+
+    doctor_rows, bookings = {}, {}
+    for row in rows:
+        doctor_rows.setdefault(row['id'], row)
+        booked = bookings.setdefault(row['id'], [])
+        if row['booked__appointment_date'] is not None:
+            booked.append(row['booked__appointment_date'])
+
+    merged = heapq.merge(*(
+        _free_slots(doctor, bookings[doctor_id], start, end) for doctor_id, doctor in doctor_rows.items()
+    ))
+    return [
+        {
+            'doctor': doctor_id,
+            'doctor_name': f"Dr. {doctor_rows[doctor_id]['user__first_name']} {doctor_rows[doctor_id]['user__last_name']}".strip(),
+            'start': slot_start,
+            'end': slot_end,
+        }
+        for slot_start, doctor_id, slot_end in islice(merged, count)
+    ]
@@ -0,0 +1,167 @@
+import re
+
+from django.db import connection, connections, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import MedicalRecord
+
+# FTS5 table over diagnosis, treatment, notes and the record's prescriptions,
+# created and kept in sync by SQL triggers in migration 0012. Its ``scope``
+# column holds "p<patient id> d<doctor id>" so filters stay inside FTS.
+FTS_TABLE = 'core_medicalrecord_fts'
+TEXT_COLUMNS = '{diagnosis treatment notes prescriptions}'
+MAX_RESULTS = 100
+# Only the newest matches are ranked. A term found in half the records
+# would otherwise score every one of them before returning the top 20.
+# bm25 still reads each term's full posting list once for its document
+# frequency, so order='recent' is the fastest path for very common words.
+RANK_WINDOW = 1000
+
+PRESCRIPTION_TEXT = '''
+    COALESCE((
+        SELECT group_concat(m.name || ' ' || p.dosage || ' ' || p.instructions, ' ')
+        FROM core_prescription p JOIN core_medicine m ON m.id = p.medicine_id
+        WHERE p.medical_record_id = r.id
+    ), '')
+'''
+SCOPE_TEXT = "'p' || r.patient_id || ' d' || r.doctor_id"
+
+_fts_enabled = None
+
+
+def fts_enabled():
+    """True when the database has the FTS table, i.e. SQLite built with FTS5."""
+    global _fts_enabled
+    if _fts_enabled is None:
+        _fts_enabled = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _fts_enabled
+
+
+def match_expression(text):
+    """
+    Turns free text into a safe FTS5 query over the text columns in which
+    every word must match (after stemming). Returns None when there is
+    nothing to search for.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    terms = ' '.join(f'"{word}"' for word in words)
+    return f'{TEXT_COLUMNS} : ({terms})'
+
+
+def search_records(text, patient=None, doctor=None, limit=20, order='rank'):
+    """
+    Hits for ``text`` as ``(record_id, rank, snippet)`` tuples. With
+    ``order='rank'`` they are sorted best first by FTS5's bm25 (lower is
+    better), weighting diagnosis over treatment over notes and
+    prescriptions, among the newest ``RANK_WINDOW`` matching records. With
+    ``order='recent'`` they are the newest matches and ``rank`` is None.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    limit = min(limit, MAX_RESULTS)
+
+    if not fts_enabled():
+        return [(pk, None, None) for pk in _fallback(text, patient, doctor)[:limit]]
+    if order not in ('rank', 'recent'):
+        raise ValueError(f'Unknown search order: {order}')
+
+    query = expression
+    if patient is not None:
+        query += f' AND scope : "p{int(patient)}"'
+    if doctor is not None:
+        query += f' AND scope : "d{int(doctor)}"'
+
+    # The FTS table has no model, so route by the records it indexes
+    with connections[router.db_for_read(MedicalRecord)].cursor() as cursor:
+        if order == 'recent':
+            cursor.execute(
+                f'SELECT rowid, NULL FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s',
+                [query, limit],
+            )
+        else:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT 1 OFFSET %s',
+                [query, RANK_WINDOW - 1],
+            )
+            row = cursor.fetchone()
+            oldest = row[0] if row else 0
+            cursor.execute(
+                f'SELECT rowid, bm25({FTS_TABLE}, 4.0, 2.0, 1.0, 1.0, 0.0) AS rank FROM {FTS_TABLE}'
+                f' WHERE {FTS_TABLE} MATCH %s AND rowid >= %s ORDER BY rank LIMIT %s',
+                [query, oldest, limit],
+            )
+        ranked = cursor.fetchall()
+
+        # Snippets only for the hits returned; the rowid lookup makes each
+        # one cheap, whereas snippet() in the ranking query would run for
+        # the whole window.
+        hits = []
+        for record_id, rank in ranked:
+            cursor.execute(
+                f"SELECT snippet({FTS_TABLE}, -1, '[', ']', '...', 12) FROM {FTS_TABLE}"
+                f' WHERE {FTS_TABLE} MATCH %s AND rowid = %s',
+                [expression, record_id],
+            )
+            hits.append((record_id, rank, cursor.fetchone()[0]))
+    return hits
+
+
+def filter_records(queryset, text):
+    """Narrows a ``MedicalRecord`` queryset to rows matching ``text``, for the admin."""
+    expression = match_expression(text)
+    if expression is None:
+        return queryset.none()
+    if not fts_enabled():
+        return queryset.filter(_text_q(text))
+    return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression]))
+
+
+def _text_q(text):
+    q = Q()
+    for word in re.findall(r'\w+', text):
+        q &= Q(diagnosis__icontains=word) | Q(treatment__icontains=word) | Q(notes__icontains=word)
+    return q
+
+
+def _fallback(text, patient, doctor):
+    records = MedicalRecord.objects.filter(_text_q(text)).order_by('-record_date')
+    if patient is not None:
+        records = records.filter(patient_id=patient)
+    if doctor is not None:
+        records = records.filter(doctor_id=doctor)
+    return list(records.values_list('id', flat=True)[:MAX_RESULTS])
+
+
+def rebuild_index(batch_size=10000, progress=None):
+    """
+    Repopulates the FTS table from scratch in id-ordered batches and
+    merges its segments. Returns the number of records indexed.
+    """
+    indexed = 0
+    last_id = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        while True:
+            cursor.execute(
+                'SELECT max(id) FROM (SELECT id FROM core_medicalrecord WHERE id > %s ORDER BY id LIMIT %s)',
+                [last_id, batch_size],
+            )
+            upper = cursor.fetchone()[0]
+            if upper is None:
+                break
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, diagnosis, treatment, notes, prescriptions, scope)'
+                f' SELECT r.id, r.diagnosis, r.treatment, r.notes, {PRESCRIPTION_TEXT}, {SCOPE_TEXT}'
+                f' FROM core_medicalrecord r WHERE r.id > %s AND r.id <= %s',
+                [last_id, upper],
+            )
+            indexed += cursor.rowcount
+            last_id = upper
+            if progress:
+                progress(indexed)
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
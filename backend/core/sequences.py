@@ -0,0 +1,88 @@
+import os
+import threading
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import Sequence
+
+
+class SequenceAllocator:
+    """
+    Hands out collision-free numbers from a ``Sequence`` row without a
+    read-before-insert on the hot path.
+
+    Each process reserves ``block_size`` numbers at a time with a single
+    SQL-side ``next_value = next_value + block_size`` and then serves them
+    from memory. Numbers left in a block when a process exits are never
+    reused, so the sequence has gaps but no duplicates.
+
+    Blocks are only reserved, and kept, outside a transaction. Inside one,
+    a rollback would undo the reservation while this process still served
+    the block, so ``next()`` then takes a single number in the caller's
+    transaction instead. Draw numbers before ``atomic()`` to stay on the
+    in-memory path.
+    """
+
+    def __init__(self, name, block_size=50):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = 0
+        self._end = 0
+
+    def next(self):
+        with self._lock:
+            # A forked worker must not keep serving its parent's block.
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            if self._next >= self._end:
+                if connection.in_atomic_block:
+                    return self._reserve_block(1)[0]
+                self._next, self._end = self._reserve_block(self.block_size)
+            value = self._next
+            self._next += 1
+            return value
+
+    def reserve(self, count):
+        """
+        Reserves ``count`` consecutive numbers with one increment and
+        returns them as a ``range``, for bulk inserts. Inside a transaction
+        the reservation commits or rolls back with it.
+        """
+        start, end = self._reserve_block(count)
+        return range(start, end)
+
+    def reset(self):
+        """Drops the in-memory block, e.g. after the sequence is reseeded."""
+        with self._lock:
+            self._pid = None
+            self._next = self._end = 0
+
+    def _reserve_block(self, size):
+        with transaction.atomic():
+            updated = Sequence.objects.filter(name=self.name).update(
+                next_value=F('next_value') + size
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        Sequence.objects.create(name=self.name, next_value=1 + size)
+                except IntegrityError:
+                    # Another process created the row first, take a block from it.
+                    Sequence.objects.filter(name=self.name).update(
+                        next_value=F('next_value') + size
+                    )
+            # The UPDATE above holds the row (or database) write lock until
+            # commit, so this read sees our own increment.
+            end = Sequence.objects.values_list('next_value', flat=True).get(name=self.name)
+        return end - size, end
+
+
+invoice_numbers = SequenceAllocator('invoice')
+
+
+def new_invoice_number():
+    return f"INV-{invoice_numbers.next():06d}"
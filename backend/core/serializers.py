@@ -1,5 +1,45 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import User, Patient, Doctor, Appointment, MedicalRecord, Prescription, Bed, Resource, Medicine, BillMedicine, Payment, Billing, Inventory, EmergencyResponse
+from .models import User, Patient, Doctor, Appointment, MedicalRecord, Prescription, Bed, BedAssignment, Resource, Medicine, BillMedicine, Payment, Billing, Inventory, StockMovement, EmergencyResponse, ResourceReservation
+from .scheduling import RELEASED_STATUSES, conflicting_appointments
+from .writes import serialized_writes
+
+class PreloadedRelatedField(serializers.PrimaryKeyRelatedField):
+    """``PrimaryKeyRelatedField`` looking ids up in ``objects``, rows read up front."""
+
+    def __init__(self, objects, **kwargs):
+        self.objects = objects
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.objects[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+def preload_related(serializer, rows):
+    """
+    Reads the rows that the writable primary key fields of ``serializer``
+    refer to in ``rows`` with one query per field, so validating a bulk
+    payload with ``many=True`` does not look each one up separately.
+    """
+    for name, field in list(serializer.fields.items()):
+        if type(field) is not serializers.PrimaryKeyRelatedField or field.read_only:
+            continue
+        ids = set()
+        for row in rows:
+            try:
+                ids.add(int(row.get(name)))
+            except (TypeError, ValueError):
+                continue
+        serializer.fields[name] = PreloadedRelatedField(
+            field.get_queryset().in_bulk(ids), queryset=field.queryset,
+            required=field.required, allow_null=field.allow_null,
+        )
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -38,6 +78,31 @@ class AppointmentSerializer(serializers.ModelSerializer):
         model = Appointment
         fields = '__all__'
 
+    def save(self, **kwargs):
+        # The slot check and the write share one transaction under the write
+        # lock, and the doctor's row is locked where the database supports
+        # it, so two bookings of the same slot cannot both pass the check.
+        with serialized_writes(), transaction.atomic():
+            self.check_slot({**self.validated_data, **kwargs})
+            return super().save(**kwargs)
+
+    def check_slot(self, attrs):
+        # Only re-check the slot when the booking itself changes, so editing
+        # notes on an old double booking still works.
+        if not {'doctor', 'appointment_date', 'status'} & attrs.keys():
+            return
+        instance = self.instance
+        doctor = attrs.get('doctor', getattr(instance, 'doctor', None))
+        start = attrs.get('appointment_date', getattr(instance, 'appointment_date', None))
+        state = attrs.get('status', getattr(instance, 'status', 'scheduled'))
+        if doctor and start and state not in RELEASED_STATUSES:
+            Doctor.objects.select_for_update().values_list('pk', flat=True).get(pk=doctor.pk)
+            clash = conflicting_appointments(doctor, start, exclude=instance).first()
+            if clash:
+                raise serializers.ValidationError({
+                    'appointment_date': f'{doctor} already has an appointment at {clash.appointment_date:%Y-%m-%d %H:%M}.'
+                })
+
     def get_patient_name(self, obj):
         user = obj.patient.user
         full_name = user.get_full_name()
@@ -76,6 +141,19 @@ class BedSerializer(serializers.ModelSerializer):
         model = Bed
         fields = '__all__'
 
+class BedAssignmentSerializer(serializers.ModelSerializer):
+    bed_number = serializers.CharField(source='bed.bed_number', read_only=True)
+    ward = serializers.CharField(source='bed.ward', read_only=True)
+    patient_name = serializers.CharField(source='patient.user.get_full_name', read_only=True)
+    length_of_stay_hours = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BedAssignment
+        fields = '__all__'
+
+    def get_length_of_stay_hours(self, obj):
+        return round(obj.length_of_stay.total_seconds() / 3600, 2)
+
 class ResourceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Resource
@@ -91,6 +169,22 @@ class PaymentSerializer(serializers.ModelSerializer):
         model = Payment
         fields = ['id', 'amount', 'payment_method', 'transaction_id', 'payment_date', 'notes', 'created_at']
 
+class PaymentEntrySerializer(PaymentSerializer):
+    """Payment as posted by a cashier, against a bill."""
+
+    class Meta(PaymentSerializer.Meta):
+        fields = ['bill'] + PaymentSerializer.Meta.fields
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('Payment amount must be positive.')
+        return value
+
+    def validate_bill(self, value):
+        if value.status == 'cancelled':
+            raise serializers.ValidationError('Cannot take payments against a cancelled bill.')
+        return value
+
 class BillingSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.user.get_full_name', read_only=True)
     medicines = BillMedicineSerializer(many=True, read_only=True)
@@ -99,6 +193,8 @@ class BillingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Billing
         fields = '__all__'
+        # Only payments (and the mark_paid and cancel actions) move these
+        read_only_fields = ['paid_amount', 'pending_amount', 'status']
         extra_kwargs = {
             'paid_date': {'required': False, 'allow_null': True},
             'total_amount': {'required': False},
@@ -109,14 +205,73 @@ class InventorySerializer(serializers.ModelSerializer):
         model = Inventory
         fields = '__all__'
 
+    def validate_quantity(self, value):
+        if self.instance is not None and value != self.instance.quantity:
+            raise serializers.ValidationError('Stock changes are posted to /api/inventory/movements/.')
+        return value
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    item_name = serializers.CharField(source='item.name', read_only=True)
+
+    class Meta:
+        model = StockMovement
+        fields = '__all__'
+
+class StockMovementEntrySerializer(serializers.ModelSerializer):
+    """
+    A movement as posted: ``quantity`` is positive, and signed only for
+    adjustments.
+    """
+    quantity = serializers.IntegerField()
+
+    class Meta:
+        model = StockMovement
+        fields = ['item', 'kind', 'quantity', 'reference', 'notes']
+
+    def validate(self, attrs):
+        if attrs['kind'] == 'adjust':
+            if attrs['quantity'] == 0:
+                raise serializers.ValidationError({'quantity': 'An adjustment cannot be zero.'})
+        elif attrs['quantity'] <= 0:
+            raise serializers.ValidationError({'quantity': 'Quantity must be positive.'})
+        return attrs
+
+class ResourceReservationSerializer(serializers.ModelSerializer):
+    resource_name = serializers.CharField(source='resource.name', read_only=True)
+
+    class Meta:
+        model = ResourceReservation
+        fields = '__all__'
+        read_only_fields = ['reserved_by', 'reserved_at', 'released_at']
+
+    def validate_quantity(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('Quantity must be positive.')
+        return value
+
+    def validate_emergency(self, value):
+        if value.status != 'active':
+            raise serializers.ValidationError('Resources can only be allocated to active emergencies.')
+        return value
+
+class ResourceRequestSerializer(ResourceReservationSerializer):
+    """Units of a resource asked for while reporting an emergency."""
+
+    class Meta(ResourceReservationSerializer.Meta):
+        fields = ['resource', 'quantity']
+        extra_kwargs = {'quantity': {'required': False, 'default': 1}}
+
 class EmergencyResponseSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.user.get_full_name', read_only=True)
     resources_allocated_names = serializers.SerializerMethodField()
     staff_assigned_names = serializers.SerializerMethodField()
+    reservations = ResourceReservationSerializer(many=True, read_only=True)
 
     class Meta:
         model = EmergencyResponse
         fields = '__all__'
+        # Set through reservations, which take the units out of stock
+        read_only_fields = ['resources_allocated']
 
     def get_resources_allocated_names(self, obj):
         return [resource.name for resource in obj.resources_allocated.all()]
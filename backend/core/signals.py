@@ -0,0 +1,101 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import revenue
+from .authentication import invalidate_token
+from .conditional import bump_versions
+from .dashboard import invalidate_dashboard_cache
+from .models import User, Patient, Doctor, Appointment, MedicalRecord, Bed, Billing, Payment, Inventory, EmergencyResponse, Tombstone
+from .resources import release_resources
+
+DASHBOARD_MODELS = (Patient, Doctor, Appointment, MedicalRecord, Bed, Billing, Inventory, EmergencyResponse)
+# Models whose version counters ETags are built from (core.conditional)
+VERSIONED_MODELS = (User, Patient, Doctor, Bed)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_dashboard(sender, **kwargs):
+    if sender in DASHBOARD_MODELS:
+        invalidate_dashboard_cache()
+    elif sender is User and (kwargs.get('created') or 'created' not in kwargs):
+        # Only new or deleted users move the staff count; logins also save
+        # the user (last_login) and must not flush every dashboard.
+        invalidate_dashboard_cache()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_model_version(sender, **kwargs):
+    if sender not in VERSIONED_MODELS:
+        return
+    # A login only stamps last_login, which no listed payload shows
+    if sender is User and kwargs.get('update_fields') == {'last_login'}:
+        return
+    bump_versions(sender)
+
+
+@receiver(post_delete, sender=Bed)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_delete, sender=EmergencyResponse)
+def record_tombstone(sender, instance, **kwargs):
+    # Lets the change feeds (core.changes) report the deletion
+    Tombstone.objects.create(model=sender._meta.label_lower, object_id=instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    # Password changes, deactivation and role edits all go through save()
+    for key in Token.objects.filter(user_id=instance.pk).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(pre_save, sender=Billing)
+@receiver(pre_save, sender=Payment)
+def snapshot_revenue(sender, instance, raw=False, **kwargs):
+    instance._revenue_before = revenue.contribution(instance) if instance.pk and not raw else {}
+
+
+@receiver(post_save, sender=Billing)
+@receiver(post_save, sender=Payment)
+def update_revenue(sender, instance, raw=False, **kwargs):
+    if not raw:
+        revenue.apply(revenue.contribution(instance), subtract=instance.__dict__.pop('_revenue_before', {}))
+
+
+@receiver(pre_save, sender=Appointment)
+def snapshot_appointment_revenue(sender, instance, raw=False, **kwargs):
+    # Its bills are rolled up under its doctor; only a reassignment moves them
+    instance._revenue_before = None
+    if instance.pk and not raw:
+        doctor_id = Appointment.objects.filter(pk=instance.pk).values_list('doctor_id', flat=True).first()
+        if doctor_id is not None and doctor_id != instance.doctor_id:
+            instance._revenue_before = revenue.appointment_contribution(instance.pk)
+
+
+@receiver(post_save, sender=Appointment)
+def move_appointment_revenue(sender, instance, raw=False, **kwargs):
+    before = instance.__dict__.pop('_revenue_before', None)
+    if before is not None:
+        revenue.apply(revenue.appointment_contribution(instance.pk), subtract=before)
+
+
+@receiver(pre_delete, sender=Billing)
+@receiver(pre_delete, sender=Payment)
+def remove_revenue(sender, instance, **kwargs):
+    # Runs inside the delete's transaction. A deleted bill's payments are
+    # collected too and send their own signal, so the bill leaves them out.
+    revenue.apply({}, subtract=revenue.contribution(instance, with_payments=False))
+
+
+@receiver(pre_delete, sender=EmergencyResponse)
+def release_emergency_resources(sender, instance, **kwargs):
+    # The reservations are deleted with the emergency; hand their units back first
+    release_resources(instance)
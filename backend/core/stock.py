@@ -0,0 +1,77 @@
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .dashboard import invalidate_dashboard_cache
+from .models import Inventory, StockMovement
+
+# Kinds posted with a positive quantity that take stock away
+OUTBOUND_KINDS = ('dispense', 'expire')
+
+
+class InsufficientStock(Exception):
+    """Movements would take items below zero; none of them were applied."""
+
+    def __init__(self, item_ids):
+        self.item_ids = item_ids
+        super().__init__(f'Not enough stock for item {", ".join(str(item_id) for item_id in item_ids)}')
+
+
+def signed_change(kind, quantity):
+    return -quantity if kind in OUTBOUND_KINDS else quantity
+
+
+def record_movements(movements, user=None):
+    """
+    Applies ``movements`` (dicts with ``item``, ``kind``, ``quantity`` and
+    optionally ``reference`` and ``notes``) in one transaction and writes
+    them to the ledger. Returns the saved ``StockMovement`` rows.
+
+    Each item gets one ``UPDATE`` adding its net change in SQL, matching
+    only while enough stock is left, so concurrent dispenses never read and
+    write back a stale quantity. If any item would go below zero, raises
+    ``InsufficientStock`` and nothing is applied.
+    """
+    entries = [
+        StockMovement(
+            item=data['item'], kind=data['kind'], change=signed_change(data['kind'], data['quantity']),
+            reference=data.get('reference', ''), notes=data.get('notes', ''), created_by=user,
+        )
+        for data in movements
+    ]
+    net = defaultdict(int)
+    for entry in entries:
+        net[entry.item_id] += entry.change
+
+    with transaction.atomic():
+        short = []
+        for item_id in sorted(net):
+            items = Inventory.objects.filter(pk=item_id)
+            if net[item_id] < 0:
+                items = items.filter(quantity__gte=-net[item_id])
+            if not items.update(quantity=F('quantity') + net[item_id]):
+                short.append(item_id)
+        if short:
+            raise InsufficientStock(short)
+
+        # Walk back from the new stock levels to each movement's balance
+        balances = dict(Inventory.objects.filter(pk__in=net).values_list('id', 'quantity'))
+        for entry in reversed(entries):
+            entry.balance = balances[entry.item_id]
+            balances[entry.item_id] -= entry.change
+        StockMovement.objects.bulk_create(entries)
+    # update() sends no post_save signals; low stock counts changed
+    invalidate_dashboard_cache()
+    return entries
+
+
+def expiring_items(days):
+    """
+    Items still in stock that expire within ``days`` days, or already
+    have: a range scan on ``inventory_expiry_idx``.
+    """
+    cutoff = timezone.localdate() + datetime.timedelta(days=days)
+    return Inventory.objects.filter(expiry_date__lte=cutoff, quantity__gt=0)
@@ -0,0 +1,41 @@
+import time
+
+from django.utils import timezone
+
+from .dashboard import invalidate_dashboard_cache
+from .models import Billing
+
+
+def sweep_overdue_bills(batch_size=500, pause=0.0):
+    """
+    Flips pending bills past their due date to ``overdue``.
+
+    Work is done in batches of at most ``batch_size`` rows, each a short
+    ``UPDATE ... WHERE id IN (...)`` picked through the ``(status,
+    due_date)`` index, so no single statement holds the SQLite write lock
+    for long. ``pause`` seconds are slept between batches to let other
+    writers in. Yields ``(rows_updated, seconds)`` per batch.
+    """
+    today = timezone.now().date()
+    touched = False
+    while True:
+        started = time.perf_counter()
+        ids = list(
+            Billing.objects.filter(status='pending', due_date__lt=today)
+            .order_by('due_date', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        rows = Billing.objects.filter(id__in=ids, status='pending').update(
+            status='overdue', updated_at=timezone.now()
+        )
+        touched = touched or rows > 0
+        yield rows, time.perf_counter() - started
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    if touched:
+        # update() sends no post_save signals
+        invalidate_dashboard_cache()
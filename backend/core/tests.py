@@ -1,3 +1,1399 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import re
+import unittest
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+
+from . import board, changes, dashboard, exports, revenue
+from .aio import pooled
+from .conditional import conditional_stats
+from .filters import ScopedFilterBackend
+from .authentication import TokenCache, token_cache
+from .models import (
+    User, Patient, Doctor, Appointment, MedicalRecord, Prescription, Bed, BedAssignment, Resource,
+    Medicine, BillMedicine, Payment, Billing, DailyRevenue, Inventory, EmergencyResponse, Tombstone
+)
+from .beds import allocate_bed, release_bed
+from .replicas import PrimaryReplicaRouter, ReplicaReadsMixin, is_pinned, pin_to_primary, replica_pin_middleware, replica_reads
+from .sequences import SequenceAllocator
+from .stock import expiring_items
+from .sweeper import sweep_overdue_bills
+from .writes import SerializedWritesMixin, _write_lock
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every list and detail endpoint must run a fixed number of queries no
+    matter how many rows it returns. A serializer that starts touching an
+    unjoined relation per row will blow the budget and fail here.
+    """
+
+    # endpoint -> (list budget, detail budget); patients, doctors and beds
+    # also read their ETag versions
+    BUDGETS = {
+        'users': (1, 1),
+        'patients': (2, 2),
+        'doctors': (2, 2),
+        'appointments': (1, 1),
+        'medical-records': (3, 3),
+        'prescriptions': (1, 1),
+        'beds': (2, 2),
+        'resources': (1, 1),
+        'billings': (3, 3),
+        'inventory': (1, 1),
+        'emergencies': (4, 4),
+    }
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='admin123', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.medicine = Medicine.objects.create(name='Paracetamol', unit_price=Decimal('2.50'))
+        self.resource = Resource.objects.create(
+            name='Ventilator', category='equipment', total_quantity=5, available_quantity=5, location='ICU'
+        )
+        self.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            n = self.rows = self.rows + 1
+            patient_user = User.objects.create_user(f'patient{n}', first_name='Pat', last_name=str(n), role='patient')
+            doctor_user = User.objects.create_user(f'doctor{n}', first_name='Doc', last_name=str(n), role='doctor')
+            patient = Patient.objects.create(user=patient_user, medical_id=f'P{n:04d}')
+            doctor = Doctor.objects.create(
+                user=doctor_user, license_number=f'D{n:04d}', specialty='General Medicine', department='General'
+            )
+            appointment = Appointment.objects.create(
+                patient=patient, doctor=doctor, appointment_date=timezone.now() + datetime.timedelta(days=n)
+            )
+            record = MedicalRecord.objects.create(
+                patient=patient, doctor=doctor, appointment=appointment, diagnosis='Flu', treatment='Rest'
+            )
+            for _ in range(2):
+                Prescription.objects.create(
+                    medical_record=record, medicine=self.medicine, quantity=10, dosage='1 tablet', duration='5 days'
+                )
+            Bed.objects.create(bed_number=f'B{n}', ward='General', status='occupied', patient=patient)
+            Resource.objects.create(
+                name=f'Monitor {n}', category='equipment', total_quantity=2, available_quantity=2, location='ICU'
+            )
+            bill = Billing.objects.create(
+                patient=patient, appointment=appointment, doctor_fee=Decimal('500'), tax_rate=Decimal('18.00'), total_amount=0,
+                description='Consultation', due_date=timezone.now().date()
+            )
+            BillMedicine.objects.create(
+                bill=bill, medicine_name='Paracetamol', quantity=2, unit_price=Decimal('2.50'), total_price=Decimal('5.00')
+            )
+            Payment.objects.create(bill=bill, amount=Decimal('100'))
+            Inventory.objects.create(name=f'Gloves {n}', category='consumable', quantity=100)
+            emergency = EmergencyResponse.objects.create(patient=patient, description='Chest pain')
+            emergency.resources_allocated.add(self.resource)
+            emergency.staff_assigned.add(doctor_user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(ctx.captured_queries)
+
+    def test_list_endpoints_stay_within_budget(self):
+        self.add_rows(2)
+        small = {name: self.count_queries(f'/api/{name}/') for name in self.BUDGETS}
+        self.add_rows(10)
+        for name, (budget, _) in self.BUDGETS.items():
+            with self.subTest(endpoint=name):
+                queries = self.count_queries(f'/api/{name}/')
+                self.assertLessEqual(queries, budget)
+                self.assertEqual(queries, small[name], 'query count grew with row count')
+
+    def test_detail_endpoints_stay_within_budget(self):
+        self.add_rows(3)
+        for name, (_, budget) in self.BUDGETS.items():
+            with self.subTest(endpoint=name):
+                list_response = self.client.get(f'/api/{name}/')
+                pk = list_response.data['results'][0]['id']
+                self.assertLessEqual(self.count_queries(f'/api/{name}/{pk}/'), budget)
+
+
+class PaginationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', role='admin'))
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        Bed.objects.bulk_create([Bed(bed_number=f'B{n:03d}', ward='General') for n in range(55)])
+
+    def walk(self, url, **params):
+        pages, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_keyset_pages_follow_the_cursor_ordering(self):
+        pages = self.walk('/api/beds/')
+        self.assertEqual([len(page) for page in pages], [50, 5])
+        ids = sum(pages, [])
+        self.assertEqual(ids, sorted(Bed.objects.values_list('id', flat=True)))
+
+        pages = self.walk('/api/beds/', page_size=20, ward='General')
+        self.assertEqual([len(page) for page in pages], [20, 20, 15])
+        self.assertEqual(sum(pages, []), ids)
+        self.assertEqual(len(self.client.get('/api/beds/', {'page_size': 1000}).data['results']), 55)
+
+        for n in range(3):
+            Billing.objects.create(
+                patient=self.patient, doctor_fee=Decimal(n), tax_rate=Decimal('0'), due_date=timezone.localdate(),
+                created_at=timezone.now() - datetime.timedelta(days=n),
+            )
+        # Newest first
+        pages = self.walk('/api/billings/', page_size=2)
+        self.assertEqual(sum(pages, []), list(Billing.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+        self.assertEqual([len(page) for page in pages], [2, 1])
+
+    def test_reference_tables_come_whole_in_the_same_envelope(self):
+        Resource.objects.bulk_create([
+            Resource(name=f'Monitor {n}', category='equipment', total_quantity=1, available_quantity=1, location='ICU')
+            for n in range(60)
+        ])
+        response = self.client.get('/api/resources/', {'page_size': 10})
+        self.assertEqual((response.data['next'], response.data['previous']), (None, None))
+        self.assertEqual(len(response.data['results']), 60)
+
+    def test_scoped_lookups_replace_client_side_search(self):
+        self.assertEqual(
+            [row['id'] for row in self.client.get('/api/patients/', {'user': self.patient.user_id}).data['results']],
+            [self.patient.id],
+        )
+        self.assertEqual(self.client.get('/api/patients/', {'id': 'x'}).status_code, 400)
+        bed = Bed.objects.get(bed_number='B054')
+        Bed.objects.filter(pk=bed.pk).update(status='occupied', patient=self.patient)
+        response = self.client.get('/api/beds/', {'patient': self.patient.id, 'status': 'occupied'})
+        self.assertEqual([row['id'] for row in response.data['results']], [bed.id])
+
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual([row['id'] for row in self.client.get('/api/beds/', {'mine': 'true'}).data['results']], [bed.id])
+
+
+class ScopedFilterTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', role='admin'))
+        self.doctors = [
+            Doctor.objects.create(
+                user=User.objects.create_user(f'doctor{n}', role='doctor'),
+                license_number=f'D000{n}', specialty='General Medicine', department='General',
+            )
+            for n in range(2)
+        ]
+        self.patients = [
+            Patient.objects.create(user=User.objects.create_user(f'patient{n}', role='patient'), medical_id=f'P000{n}')
+            for n in range(2)
+        ]
+        def at(day, hour, minute=0):
+            return timezone.make_aware(datetime.datetime(2026, 3, day, hour, minute))
+
+        self.appointments = [
+            Appointment.objects.create(patient=self.patients[0], doctor=self.doctors[0], appointment_date=at(1, 9)),
+            Appointment.objects.create(patient=self.patients[0], doctor=self.doctors[1], appointment_date=at(2, 23, 30), status='completed'),
+            Appointment.objects.create(patient=self.patients[1], doctor=self.doctors[0], appointment_date=at(3, 0)),
+        ]
+
+    def listed(self, expected_status=200, **params):
+        response = self.client.get('/api/appointments/', params)
+        self.assertEqual(response.status_code, expected_status)
+        if expected_status != 200:
+            return response.data
+        ids = [appointment.id for appointment in self.appointments]
+        return [ids.index(row['id']) for row in response.data['results']]
+
+    def test_filter_params(self):
+        self.assertEqual(self.listed(patient=self.patients[0].id), [0, 1])
+        self.assertEqual(self.listed(doctor=f'{self.doctors[0].id}, {self.doctors[1].id}'), [0, 1, 2])
+        self.assertEqual(self.listed(doctor=self.doctors[0].id, status='scheduled'), [0, 2])
+        self.assertEqual(self.listed(status='scheduled,completed', patient=''), [0, 1, 2])
+        self.assertIn('patient', self.listed(400, patient='x'))
+        self.assertIn('doctor', self.listed(400, doctor=f'{self.doctors[0].id},x'))
+
+    def test_date_bounds_are_inclusive(self):
+        # A bare end date on a datetime field covers the whole day
+        self.assertEqual(self.listed(date_from='2026-03-02', date_to='2026-03-02'), [1])
+        self.assertEqual(self.listed(date_to='2026-03-02T23:30:00'), [0, 1])
+        self.assertEqual(self.listed(date_from='2026-03-02T23:30:00'), [1, 2])
+        self.assertEqual(self.listed(date_from='2026-03-03'), [2])
+        self.assertIn('date_to', self.listed(400, date_to='03/02/2026'))
+        self.assertIn('date_from', self.listed(400, date_from='2026-02-30'))
+
+        # On a date field, a datetime bound keeps its date
+        bills = [
+            Billing.objects.create(patient=self.patients[0], tax_rate=Decimal('0'), due_date=datetime.date(2026, 3, day))
+            for day in (1, 2)
+        ]
+        view = SimpleNamespace(date_filter_field='due_date')
+        request = Request(APIRequestFactory().get('/', {'date_from': '2026-03-02T18:00:00', 'date_to': '2026-03-02'}))
+        self.assertEqual(list(ScopedFilterBackend().filter_queryset(request, Billing.objects.all(), view)), [bills[1]])
+
+    def test_mine_is_scoped_per_role(self):
+        everything = [0, 1, 2]
+        self.assertEqual(self.listed(mine='true'), everything)
+
+        self.client.force_authenticate(self.patients[0].user)
+        self.assertEqual(self.listed(mine='true'), [0, 1])
+        self.assertEqual(self.listed(mine='false'), everything)
+
+        self.client.force_authenticate(self.doctors[0].user)
+        self.assertEqual(self.listed(mine='1'), [0, 2])
+        self.assertEqual(self.listed(mine='yes', patient=self.patients[1].id), [2])
+
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        self.assertEqual(self.listed(mine='true'), everything)
+
+        # A patient account without a patient profile has nothing of its own
+        self.client.force_authenticate(User.objects.create_user('unlinked', role='patient'))
+        self.assertEqual(self.listed(mine='true'), [])
+
+        # Bills reach their doctor through the appointment
+        bill = Billing.objects.create(
+            patient=self.patients[1], appointment=self.appointments[2], tax_rate=Decimal('0'), due_date=timezone.localdate(),
+        )
+        Billing.objects.create(patient=self.patients[0], appointment=self.appointments[1], tax_rate=Decimal('0'), due_date=timezone.localdate())
+        self.client.force_authenticate(self.doctors[0].user)
+        response = self.client.get('/api/billings/', {'mine': 'true'})
+        self.assertEqual([row['id'] for row in response.data['results']], [bill.id])
+
+
+class DashboardTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_user('admin', role='admin')
+        doctor_user = User.objects.create_user('doctor', role='doctor')
+        self.doctor = Doctor.objects.create(
+            user=doctor_user, license_number='D0001', specialty='General Medicine', department='General'
+        )
+        patient_user = User.objects.create_user('patient', role='patient')
+        self.patient = Patient.objects.create(user=patient_user, medical_id='P0001')
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_date=timezone.now())
+
+    def get_dashboard(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_one_query_per_table_then_cached(self):
+        # Patient, Doctor, User, Appointment, Bed, EmergencyResponse, Inventory, Billing
+        with self.assertNumQueries(8):
+            self.get_dashboard(self.admin)
+        with self.assertNumQueries(0):
+            self.get_dashboard(self.admin)
+        with self.assertNumQueries(1):  # one Appointment aggregate
+            self.get_dashboard(self.doctor.user)
+
+    def test_writes_invalidate_cached_payload(self):
+        self.assertEqual(self.get_dashboard(self.patient.user)['my_appointments'], 1)
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_date=timezone.now())
+        self.assertEqual(self.get_dashboard(self.patient.user)['my_appointments'], 2)
+        self.assertEqual(self.get_dashboard(self.doctor.user)['my_patients'], 1)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user('staff', password='staff123', role='staff')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeat_requests_skip_token_lookup(self):
+        self.client.get('/api/resources/')
+        with self.assertNumQueries(1):  # just the resources list
+            self.assertEqual(self.client.get('/api/resources/').status_code, 200)
+
+    def test_deactivation_and_logout_invalidate(self):
+        self.client.get('/api/resources/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/resources/').status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/resources/').status_code, 401)
+
+    def test_invalidation_reaches_other_processes_through_the_backend(self):
+        # One cache per worker process, sharing a backend
+        first, second = TokenCache(100, 60, cache), TokenCache(100, 60, cache)
+        self.addCleanup(cache.clear)
+        first.set(self.token.key, self.token)
+        self.assertEqual(second.get(self.token.key), self.token)
+        self.assertEqual(first.get(self.token.key), self.token)
+        second.delete(self.token.key)
+        self.assertIsNone(first.get(self.token.key))
+
+
+class BedAssignmentTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        doctor = Doctor.objects.create(
+            user=User.objects.create_user('doctor', role='doctor'),
+            license_number='D0001', specialty='General Medicine', department='General',
+        )
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        self.appointment = Appointment.objects.create(
+            patient=self.patient, doctor=doctor, appointment_date=timezone.now(),
+            notes='Chest pain\n(Bed assigned: ICU-1 - ICU)',
+        )
+        Bed.objects.create(bed_number='GEN-1', ward='General')
+        self.bed = Bed.objects.create(bed_number='ICU-1', ward='ICU')
+
+    def test_allocate_and_release_keep_history(self):
+        response = self.client.post(
+            '/api/beds/allocate/', {'patient_id': self.patient.id, 'ward': 'ICU', 'appointment_id': self.appointment.id}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['bed_number'], 'ICU-1')
+        stay = BedAssignment.objects.get(bed=self.bed, released_at__isnull=True)
+        self.assertEqual(stay.appointment, self.appointment)
+        self.assertEqual(self.client.post('/api/beds/allocate/', {'patient_id': self.patient.id}).status_code, 400)
+
+        BedAssignment.objects.filter(pk=stay.pk).update(assigned_at=timezone.now() - datetime.timedelta(hours=6))
+        # bed lookup, then one transaction closing the stay, the note and the
+        # bed and bumping the beds' ETag version
+        with self.assertNumQueries(7):
+            self.client.post(f'/api/beds/{self.bed.id}/release_bed/')
+
+        self.bed.refresh_from_db()
+        self.assertEqual((self.bed.status, self.bed.patient), ('available', None))
+        self.appointment.refresh_from_db()
+        self.assertIn('Bed released: ICU-1', self.appointment.notes)
+        report = self.client.get('/api/beds/length_of_stay/', {'ward': 'ICU'}).data
+        self.assertEqual((report['stays'], round(report['average_hours'])), (1, 6))
+
+    def test_allocate_skips_beds_it_cannot_claim(self):
+        # Marked available by a PATCH with its patient still in it
+        other = Patient.objects.create(user=User.objects.create_user('other', role='patient'), medical_id='P0002')
+        Bed.objects.filter(bed_number='GEN-1').update(patient=other)
+        # An open stay nobody closed
+        BedAssignment.objects.create(bed=self.bed, patient=other)
+        self.assertIsNone(allocate_bed(self.patient))
+
+        spare = Bed.objects.create(bed_number='ICU-2', ward='ICU')
+        response = self.client.post('/api/beds/allocate/', {'patient_id': self.patient.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['id'], spare.id)
+
+
+class SchedulingTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        self.doctors = [
+            Doctor.objects.create(
+                user=User.objects.create_user(f'doctor{n}', role='doctor'),
+                license_number=f'D000{n}', specialty='Cardiology', department='Cardiology',
+            )
+            for n in range(2)
+        ]
+        # A Monday, 09:00 UTC
+        self.monday = datetime.datetime(2026, 10, 19, 9, tzinfo=datetime.timezone.utc)
+
+    def book(self, doctor, start):
+        return self.client.post('/api/appointments/', {
+            'patient': self.patient.id, 'doctor': doctor.id, 'appointment_date': start.isoformat(),
+        })
+
+    def test_overlapping_booking_is_rejected(self):
+        doctor = self.doctors[0]
+        self.assertEqual(self.book(doctor, self.monday).status_code, 201)
+        self.assertEqual(self.book(doctor, self.monday + datetime.timedelta(minutes=15)).status_code, 400)
+        self.assertEqual(self.book(doctor, self.monday + datetime.timedelta(minutes=30)).status_code, 201)
+        self.assertEqual(self.book(self.doctors[1], self.monday).status_code, 201)
+
+    def test_free_slots_across_department_in_one_query(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctors[0], appointment_date=self.monday)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/appointments/free_slots/', {
+                'department': 'Cardiology', 'count': 3, 'from': self.monday.isoformat(),
+            })
+        slots = [(slot['doctor'], slot['start'].strftime('%H:%M')) for slot in response.data]
+        self.assertEqual(slots, [
+            (self.doctors[1].id, '09:00'), (self.doctors[0].id, '09:30'), (self.doctors[1].id, '09:30'),
+        ])
+
+    def test_slot_check_runs_with_the_write_under_the_lock(self):
+        doctor = self.doctors[0]
+        with override_settings(SERIALIZE_WRITES=True), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.book(doctor, self.monday).status_code, 201)
+        sql = [query['sql'] for query in queries.captured_queries]
+        begin = next(n for n, statement in enumerate(sql) if statement.startswith('SAVEPOINT'))
+        self.assertTrue(any('core_appointment' in statement and statement.startswith('SELECT') for statement in sql[begin:]))
+        self.assertTrue(any(statement.startswith('INSERT INTO "core_appointment"') for statement in sql[begin:]))
+        self.assertFalse(_write_lock._is_owned())
+
+    def test_bad_slot_parameters_are_rejected(self):
+        for params in ({'count': '0'}, {'count': '-1'}, {'days': '-1'}, {'from': '2026-13-01T00:00'}, {'from': 'soon'}):
+            response = self.client.get('/api/appointments/free_slots/', params)
+            self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'/api/doctors/{self.doctors[0].id}/', {'slot_minutes': 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('slot_minutes', response.data)
+
+
+class MedicalRecordSearchTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        self.doctor = Doctor.objects.create(
+            user=User.objects.create_user('doctor', role='doctor'),
+            license_number='D0001', specialty='General Medicine', department='General',
+        )
+        self.patients = [
+            Patient.objects.create(user=User.objects.create_user(f'patient{n}', role='patient'), medical_id=f'P000{n}')
+            for n in range(2)
+        ]
+        self.diabetic = MedicalRecord.objects.create(
+            patient=self.patients[0], doctor=self.doctor, diagnosis='Type 2 diabetes', treatment='Diet control',
+        )
+        self.hypertensive = MedicalRecord.objects.create(
+            patient=self.patients[1], doctor=self.doctor, diagnosis='Hypertension', treatment='Amlodipine',
+            notes='Family history of diabetes',
+        )
+
+    def search(self, **params):
+        response = self.client.get('/api/medical-records/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [hit['id'] for hit in response.data['results']]
+
+    def test_ranked_filtered_and_kept_in_sync(self):
+        # A diagnosis hit outranks a notes hit
+        self.assertEqual(self.search(q='diabetes'), [self.diabetic.id, self.hypertensive.id])
+        self.assertEqual(self.search(q='diabetes', patient=self.patients[1].id), [self.hypertensive.id])
+
+        medicine = Medicine.objects.create(name='Metformin', unit_price=Decimal('1.00'))
+        Prescription.objects.create(
+            medical_record=self.diabetic, medicine=medicine, quantity=30, dosage='500mg', duration='30 days'
+        )
+        self.assertEqual(self.search(q='metformin'), [self.diabetic.id])
+        self.diabetic.delete()
+        self.assertEqual(self.search(q='diabetes'), [self.hypertensive.id])
+
+    def test_limit_must_be_positive(self):
+        self.assertEqual(self.search(q='diabetes', limit=1), [self.diabetic.id])
+        for limit in ('0', '-1', 'all'):
+            response = self.client.get('/api/medical-records/search/', {'q': 'diabetes', 'limit': limit})
+            self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        self.patients = [
+            Patient.objects.create(
+                user=User.objects.create_user(f'patient{n}', first_name='Pat', last_name=str(n), role='patient'),
+                medical_id=f'P000{n}',
+            )
+            for n in range(2)
+        ]
+        for n, patient in enumerate(self.patients):
+            bill = Billing.objects.create(
+                patient=patient, bill_type='pharmacy', tax_rate=Decimal('18.00'), doctor_fee=Decimal(n * 500),
+                due_date=timezone.localdate() + datetime.timedelta(days=30),
+            )
+            BillMedicine.objects.create(
+                bill=bill, medicine_name='Paracetamol', quantity=2, unit_price=Decimal('2.50'), total_price=Decimal('5.00')
+            )
+
+    def export(self, fmt, **params):
+        response = self.client.get(f'/api/billings/export/{fmt}/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_and_ndjson_with_nested_rows_and_filters(self):
+        lines = self.export('csv').splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('invoice_number,patient_id,medical_id,patient_name'))
+        self.assertIn('Pat 0', lines[1])
+        self.assertIn('Paracetamol x2 = 5.00', lines[1])
+
+        rows = [json.loads(line) for line in self.export('ndjson', status='pending').splitlines()]
+        self.assertEqual([row['medical_id'] for row in rows], ['P0001'])
+        self.assertEqual(rows[0]['medicines'][0]['name'], 'Paracetamol')
+        self.assertEqual(rows[0]['payments'], [])
+
+        self.assertEqual(self.client.get('/api/billings/export/csv/', {'date_from': 'soon'}).status_code, 400)
+
+
+class BulkBillingTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        self.due = timezone.localdate().isoformat()
+
+    def bills(self, count, **extra):
+        return [
+            {
+                'patient': self.patient.id, 'doctor_fee': 100 + n, 'description': f'Visit {n}', 'due_date': self.due,
+                'medicines': [{'name': 'Paracetamol', 'quantity': 2, 'unit_price': '2.50'}], **extra,
+            }
+            for n in range(count)
+        ]
+
+    def post(self, bills):
+        return self.client.post('/api/billings/bulk/', bills, format='json')
+
+    def test_bills_and_medicines_are_created_together(self):
+        response = self.post({'bills': self.bills(3)})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(len({bill['invoice_number'] for bill in response.data['bills']}), 3)
+        bill = Billing.objects.get(description='Visit 1')
+        self.assertEqual((bill.medicine_total, bill.medicines.count()), (Decimal('5.00'), 1))
+        self.assertEqual(response.data['bills'][1]['total_amount'], str(bill.total_amount))
+
+    def test_an_invalid_bill_rejects_the_whole_batch(self):
+        bills = self.bills(3)
+        bills[1]['patient'] = 0
+        self.assertEqual(self.post(bills).status_code, 400)
+        for bad in ('not a bill', {**bills[0], 'medicines': 'Paracetamol'}, {**bills[0], 'medicines': [1]}):
+            with self.subTest(bad=bad):
+                response = self.post([bills[0], bad])
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response.data['error'].startswith('Bill 1:'))
+        bills[1]['patient'] = self.patient.id
+        bills[2]['medicines'] = [{'name': 'Paracetamol', 'quantity': 'two', 'unit_price': '2.50'}]
+        self.assertEqual(self.post(bills).status_code, 400)
+        self.assertFalse(Billing.objects.exists())
+        self.assertFalse(BillMedicine.objects.exists())
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def queries(count):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.post(self.bills(count)).status_code, 201)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries(2), queries(20))
+
+
+class PatientImportTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        Patient.objects.create(user=User.objects.create_user('taken', role='patient'), medical_id='P0001')
+
+    def upload(self, name, content):
+        response = self.client.post('/api/patients/import/', {'file': SimpleUploadedFile(name, content.encode())})
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['imported'], {row['row']: row['error'] for row in response.data['skipped']}
+
+    def test_csv_rows_are_validated_one_by_one(self):
+        imported, skipped = self.upload('patients.csv', '\n'.join([
+            'username,password,medical_id,first_name,blood_group,phone,date_of_birth',
+            'ann,secret123,LEG1,Ann,O+,555-0100,1990-04-01',
+            'ann,secret123,LEG2,Ann,,,',
+            'taken,,LEG3,,,,',
+            'bob,,P0001,,,,',
+            'cat,,LEG1,,,,',
+            ',,LEG4,,,,',
+            'dan,,,,ABCDEF,,',
+            'eve,,,,,,1990-02-30',
+            'has space,,,,,,',
+            'fay,,,,,0123456789012345,',
+            'gus,,,Gus,,,',
+        ]))
+        self.assertEqual(imported, 2)
+        self.assertTrue(skipped.pop(9).startswith('username: Enter a valid username.'))
+        self.assertEqual(skipped, {
+            2: 'duplicate username ann in file',
+            3: 'username taken already exists',
+            4: 'medical_id P0001 already exists',
+            5: 'duplicate medical_id LEG1 in file',
+            6: 'username is required',
+            7: 'blood_group: Ensure this value has at most 5 characters (it has 6).',
+            8: 'invalid date_of_birth 1990-02-30',
+            10: 'phone: Ensure this value has at most 15 characters (it has 16).',
+        })
+        ann = Patient.objects.get(medical_id='LEG1')
+        self.assertEqual((ann.user.first_name, ann.blood_group, str(ann.user.date_of_birth)), ('Ann', 'O+', '1990-04-01'))
+        self.assertTrue(ann.user.check_password('secret123'))
+        self.assertTrue(Patient.objects.get(user__username='gus').medical_id.startswith('MRN'))
+
+    def test_ndjson_bad_lines_are_skipped_and_generated_ids_avoid_explicit_ones(self):
+        imported, skipped = self.upload('patients.ndjson', '\n'.join([
+            '{"username": "ann", "phone": 5550100}',
+            '["not", "a", "patient"]',
+            '{"username": "bob",',
+            '{"username": ["bob"]}',
+            '',
+            '{"username": "cat"}',
+            '{"username": "dan", "medical_id": "MRN0000002"}',
+        ]))
+        self.assertEqual(imported, 3)
+        self.assertEqual(set(skipped), {2, 3, 4})
+        self.assertEqual(skipped[2], 'expected an object')
+        self.assertTrue(skipped[3].startswith('invalid JSON'))
+        self.assertEqual(skipped[4], 'username must be text')
+        ids = dict(Patient.objects.filter(user__username__in=['ann', 'cat', 'dan']).values_list('user__username', 'medical_id'))
+        self.assertEqual(len(set(ids.values())), 3)
+        self.assertEqual(ids['dan'], 'MRN0000002')
+        self.assertEqual(User.objects.get(username='ann').phone, '5550100')
+
+
+class OverdueSweepTests(TestCase):
+
+    def setUp(self):
+        patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        future = timezone.localdate() + datetime.timedelta(days=30)
+        bills = [
+            Billing.objects.create(patient=patient, doctor_fee=Decimal('100'), tax_rate=Decimal('0'), due_date=future)
+            for _ in range(8)
+        ]
+        self.overdue = [bill.pk for bill in bills[:5]]
+        # Five pending bills past due, one pending and not yet due, one paid
+        # and one partially paid past due
+        Billing.objects.filter(pk__in=[bill.pk for bill in bills if bill.pk != bills[5].pk]).update(
+            due_date=timezone.localdate() - datetime.timedelta(days=1)
+        )
+        Billing.objects.filter(pk=bills[6].pk).update(status='paid')
+        Billing.objects.filter(pk=bills[7].pk).update(status='partially_paid')
+
+    def test_only_pending_bills_past_due_flip_in_bounded_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            batches = [rows for rows, _ in sweep_overdue_bills(batch_size=2)]
+        self.assertEqual(batches, [2, 2, 1])
+        self.assertEqual(sorted(Billing.objects.filter(status='overdue').values_list('pk', flat=True)), self.overdue)
+        self.assertEqual(
+            sorted(Billing.objects.exclude(pk__in=self.overdue).values_list('status', flat=True)),
+            ['paid', 'partially_paid', 'pending'],
+        )
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "core_billing"')]
+        self.assertEqual(len(updates), 3)
+
+        # Nothing left to do
+        self.assertEqual(list(sweep_overdue_bills(batch_size=2)), [])
+
+    def test_command_reports_rows_touched(self):
+        out = io.StringIO()
+        call_command('sweep_overdue_bills', batch_size=3, pause=0, stdout=out)
+        self.assertIn('5 bills marked overdue in 2 batches', out.getvalue())
+        out = io.StringIO()
+        call_command('sweep_overdue_bills', batch_size=3, pause=0, stdout=out)
+        self.assertIn('0 bills marked overdue in 0 batches', out.getvalue())
+
+
+class PaymentTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        due = timezone.localdate() + datetime.timedelta(days=30)
+        self.bill, self.other = [
+            Billing.objects.create(patient=patient, doctor_fee=Decimal('100'), tax_rate=Decimal('0'), due_date=due)
+            for _ in range(2)
+        ]
+
+    def test_payments_roll_up_into_the_bill(self):
+        response = self.client.post('/api/payments/', {'bill': self.bill.id, 'amount': '40.00', 'payment_method': 'cash'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.bill.refresh_from_db()
+        self.assertEqual((self.bill.paid_amount, self.bill.pending_amount, self.bill.status), (Decimal('40'), Decimal('60'), 'partially_paid'))
+
+        response = self.client.post('/api/payments/', {'bill': self.bill.id, 'amount': '60.00', 'payment_method': 'upi'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.bill.refresh_from_db()
+        self.assertEqual((self.bill.pending_amount, self.bill.status), (Decimal('0'), 'paid'))
+        self.assertIsNotNone(self.bill.paid_date)
+
+    def test_overpayment_is_rejected(self):
+        response = self.client.post('/api/payments/', {'bill': self.bill.id, 'amount': '100.01', 'payment_method': 'cash'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['bills'], [self.bill.id])
+
+        # Together the bulk payments overpay one bill, so none are recorded
+        response = self.client.post('/api/payments/bulk/', [
+            {'bill': self.other.id, 'amount': '50.00', 'payment_method': 'cash'},
+            {'bill': self.bill.id, 'amount': '70.00', 'payment_method': 'cash'},
+            {'bill': self.bill.id, 'amount': '40.00', 'payment_method': 'upi'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['bills'], [self.bill.id])
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(
+            list(Billing.objects.values_list('pending_amount', 'status')),
+            [(Decimal('100'), 'pending'), (Decimal('100'), 'pending')],
+        )
+
+    def test_amounts_and_status_only_change_through_payments(self):
+        response = self.client.patch(
+            f'/api/billings/{self.bill.id}/',
+            {'paid_amount': '100.00', 'pending_amount': '0.00', 'status': 'paid', 'description': 'Checked'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.bill.refresh_from_db()
+        self.assertEqual(
+            (self.bill.paid_amount, self.bill.pending_amount, self.bill.status, self.bill.description),
+            (Decimal('0'), Decimal('100'), 'pending', 'Checked'),
+        )
+
+        self.assertEqual(self.client.post(f'/api/billings/{self.bill.id}/cancel/').status_code, 200)
+        self.bill.refresh_from_db()
+        self.assertEqual(self.bill.status, 'cancelled')
+        self.client.post('/api/payments/', {'bill': self.other.id, 'amount': '10.00', 'payment_method': 'cash'}, format='json')
+        self.assertEqual(self.client.post(f'/api/billings/{self.other.id}/cancel/').status_code, 400)
+
+    def test_mark_paid_settles_the_balance(self):
+        self.client.post('/api/payments/', {'bill': self.bill.id, 'amount': '30.00', 'payment_method': 'cash'}, format='json')
+        response = self.client.post(f'/api/billings/{self.bill.id}/mark_paid/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.bill.refresh_from_db()
+        self.assertEqual((self.bill.paid_amount, self.bill.pending_amount, self.bill.status), (Decimal('100'), Decimal('0'), 'paid'))
+        self.assertEqual(sorted(self.bill.payments.values_list('amount', flat=True)), [Decimal('30'), Decimal('70')])
+
+
+class RevenueRollupTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        self.doctor = Doctor.objects.create(
+            user=User.objects.create_user('doctor', role='doctor'),
+            license_number='D0001', specialty='General Medicine', department='General',
+        )
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_date=timezone.now())
+        self.due = (timezone.localdate() + datetime.timedelta(days=30)).isoformat()
+        response = self.client.post('/api/billings/', {
+            'patient': self.patient.id, 'appointment': appointment.id, 'doctor_fee': 1000,
+            'description': 'Consultation', 'due_date': self.due,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.bill = Billing.objects.get()
+
+    def report(self, **params):
+        response = self.client.get('/api/reports/revenue/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_rollup_follows_writes_and_reconciles(self):
+        self.client.post('/api/billings/bulk/', [
+            {'patient': self.patient.id, 'bill_type': 'room', 'room_charge': 500, 'description': 'Ward', 'due_date': self.due},
+        ], format='json')
+        self.client.post('/api/payments/bulk/', [
+            {'bill': self.bill.id, 'amount': '500.00', 'payment_method': 'upi'},
+            {'bill': self.bill.id, 'amount': '180.00', 'payment_method': 'cash'},
+        ], format='json')
+
+        month = timezone.localdate().replace(day=1)
+        self.assertEqual(self.report(), [{
+            'period': month, 'bills': 2, 'billed_amount': '1770.00', 'tax_amount': '270.00',
+            'payments': 2, 'collected_amount': '680.00',
+        }])
+        by_method = {row['payment_method']: row for row in self.report(group_by='payment_method')}
+        self.assertEqual(by_method['upi']['collected_amount'], '500.00')
+        self.assertEqual(self.report(period='year', doctor=self.doctor.id)[0]['billed_amount'], '1180.00')
+
+        # A cancelled bill drops out of the billed totals
+        room_bill = Billing.objects.get(bill_type='room')
+        self.client.post(f'/api/billings/{room_bill.id}/cancel/')
+        self.assertEqual(self.report()[0]['billed_amount'], '1180.00')
+        self.assertEqual(revenue.reconcile(timezone.localdate(), timezone.localdate()), [])
+
+        # update() bypasses the rollup until reconciliation rebuilds the day
+        Billing.objects.filter(pk=self.bill.pk).update(total_amount=Decimal('1000.00'))
+        self.assertEqual(revenue.reconcile(timezone.localdate(), timezone.localdate()), [timezone.localdate()])
+        self.assertEqual(self.report()[0]['billed_amount'], '1000.00')
+
+        # Deleting a bill takes its payments with it
+        self.bill.delete()
+        self.assertFalse(DailyRevenue.objects.exclude(bills=0, payments=0).exists())
+        self.assertEqual(self.client.get('/api/reports/revenue/', {'period': 'week'}).status_code, 400)
+
+    def test_reassigning_the_appointment_moves_its_revenue(self):
+        self.client.post('/api/payments/', {'bill': self.bill.id, 'amount': '100.00', 'payment_method': 'cash'}, format='json')
+        other = Doctor.objects.create(
+            user=User.objects.create_user('other', role='doctor'),
+            license_number='D0002', specialty='General Medicine', department='General',
+        )
+        appointment = self.bill.appointment
+        appointment.doctor = other
+        appointment.save()
+        appointment.notes = 'Follow-up'
+        appointment.save()
+
+        by_doctor = {row['doctor']: row for row in self.report(group_by='doctor')}
+        self.assertEqual((by_doctor[other.id]['billed_amount'], by_doctor[other.id]['collected_amount']), ('1180.00', '100.00'))
+        self.assertEqual((by_doctor[self.doctor.id]['bills'], by_doctor[self.doctor.id]['payments']), (0, 0))
+        self.assertEqual(revenue.reconcile(timezone.localdate(), timezone.localdate()), [])
+
+    def test_reconcile_reads_and_rewrites_in_one_transaction(self):
+        Billing.objects.filter(pk=self.bill.pk).update(total_amount=Decimal('1000.00'))
+        with override_settings(SERIALIZE_WRITES=True), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(revenue.reconcile(timezone.localdate(), timezone.localdate()), [timezone.localdate()])
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertTrue(sql[0].startswith('SAVEPOINT'))
+        self.assertTrue(sql[-1].startswith('RELEASE SAVEPOINT'))
+        self.assertFalse(_write_lock._is_owned())
+
+
+class StockLedgerTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        response = self.client.post('/api/inventory/', {
+            'name': 'Saline', 'category': 'fluids', 'quantity': 20, 'minimum_threshold': 10,
+            'expiry_date': (timezone.localdate() + datetime.timedelta(days=10)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.item = Inventory.objects.get()
+
+    def post_movements(self, *movements):
+        return self.client.post('/api/inventory/movements/', list(movements), format='json')
+
+    def test_movements_apply_in_sql_and_keep_a_ledger(self):
+        response = self.post_movements(
+            {'item': self.item.id, 'kind': 'dispense', 'quantity': 8},
+            {'item': self.item.id, 'kind': 'receipt', 'quantity': 5, 'reference': 'PO-1'},
+            {'item': self.item.id, 'kind': 'adjust', 'quantity': -2},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([movement['balance'] for movement in response.data['movements']], [12, 17, 15])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 15)
+
+        # Overdrawing rejects the whole batch
+        response = self.post_movements(
+            {'item': self.item.id, 'kind': 'receipt', 'quantity': 1},
+            {'item': self.item.id, 'kind': 'dispense', 'quantity': 100},
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['items'], [self.item.id])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 15)
+
+        history = self.client.get(f'/api/inventory/{self.item.id}/history/').data['results']
+        self.assertEqual([(m['kind'], m['change'], m['balance']) for m in history], [
+            ('receipt', 20, 20), ('dispense', -8, 12), ('receipt', 5, 17), ('adjust', -2, 15),
+        ])
+        response = self.client.patch(f'/api/inventory/{self.item.id}/', {'quantity': 99}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_low_stock_and_expiring_use_their_indexes(self):
+        self.post_movements({'item': self.item.id, 'kind': 'dispense', 'quantity': 15})
+        self.assertEqual(len(self.client.get('/api/inventory/low_stock/').data['results']), 1)
+        self.assertEqual(len(self.client.get('/api/inventory/expiring/', {'days': 5}).data['results']), 0)
+        self.assertEqual(len(self.client.get('/api/inventory/expiring/', {'days': 30}).data['results']), 1)
+        self.assertEqual(self.client.get('/api/inventory/expiring/', {'days': -100000000}).status_code, 200)
+        self.assertEqual(self.client.get('/api/inventory/expiring/', {'days': 'soon'}).status_code, 400)
+
+        low_stock = Inventory.objects.filter(quantity__lte=F('minimum_threshold')).order_by('id')
+        self.assertIn('inventory_low_stock_idx', low_stock.explain())
+        self.assertIn('inventory_expiry_idx', expiring_items(30).explain())
+
+
+class ResourceReservationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        self.ventilators = Resource.objects.create(
+            name='Ventilator', category='equipment', total_quantity=3, available_quantity=3, location='ICU'
+        )
+
+    def report(self, **data):
+        return self.client.post('/api/emergencies/', {
+            'patient': self.patient.id, 'description': 'Mass casualty', 'priority': 'critical', **data,
+        }, format='json')
+
+    def available(self):
+        self.ventilators.refresh_from_db()
+        return self.ventilators.available_quantity
+
+    def test_reserve_on_create_and_release_on_resolve(self):
+        response = self.report(resources=[{'resource': self.ventilators.id, 'quantity': 2}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['resources_allocated'], [self.ventilators.id])
+        self.assertEqual(response.data['reservations'][0]['quantity'], 2)
+        self.assertEqual(self.available(), 1)
+
+        # Short: the emergency is not created and nothing is taken
+        response = self.report(resources=[{'resource': self.ventilators.id, 'quantity': 2}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(EmergencyResponse.objects.count(), 1)
+        self.assertEqual(self.available(), 1)
+
+        second = self.report(resources_allocated=[self.ventilators.id]).data['id']
+        self.assertEqual(self.available(), 0)
+        first = EmergencyResponse.objects.exclude(pk=second).get()
+        response = self.client.post(f'/api/emergencies/{first.id}/resolve/')
+        self.assertEqual(response.data['units_released'], 2)
+        self.client.post(f'/api/emergencies/{first.id}/resolve/')
+        self.assertEqual(self.available(), 2)
+
+        EmergencyResponse.objects.get(pk=second).delete()
+        self.assertEqual(self.available(), 3)
+
+    def test_bulk_allocation_is_all_or_nothing(self):
+        emergencies = [self.report().data['id'] for _ in range(2)]
+        monitors = Resource.objects.create(
+            name='Monitor', category='equipment', total_quantity=1, available_quantity=1, location='ICU'
+        )
+        response = self.client.post('/api/emergencies/allocate/', [
+            {'emergency': emergencies[0], 'resource': self.ventilators.id, 'quantity': 2},
+            {'emergency': emergencies[1], 'resource': monitors.id, 'quantity': 2},
+        ], format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['resources'], [monitors.id])
+        self.assertEqual(self.available(), 3)
+
+        response = self.client.post('/api/emergencies/allocate/', {'allocations': [
+            {'emergency': emergency, 'resource': self.ventilators.id, 'quantity': 1} for emergency in emergencies
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.available(), 1)
+
+
+class EmergencyBoardTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        self.emergencies = {
+            priority: EmergencyResponse.objects.create(patient=self.patient, description=priority, priority=priority)
+            for priority in ('low', 'critical', 'medium', 'high')
+        }
+        EmergencyResponse.objects.create(patient=self.patient, description='done', priority='critical', status='resolved')
+        # Settled well before the board loads
+        EmergencyResponse.objects.update(updated_at=timezone.now() - datetime.timedelta(minutes=1))
+
+    def test_queue_orders_active_by_severity_over_its_index(self):
+        response = self.client.get('/api/emergencies/queue/')
+        self.assertEqual([row['priority'] for row in response.data['results']], ['critical', 'high', 'medium', 'low'])
+        self.assertIn('emergency_queue_idx', board.active_queue(EmergencyResponse.objects.all()).explain())
+        self.assertEqual([row['priority'] for row in self.client.get('/api/emergencies/queue/', {'limit': 2}).data['results']], ['critical', 'high'])
+        for limit in ('0', '-1', 'x'):
+            self.assertEqual(self.client.get('/api/emergencies/queue/', {'limit': limit}).status_code, 400)
+
+    def test_stream_pushes_only_changes_after_the_cursor(self):
+        since = board.parse_cursor(self.client.get('/api/emergencies/queue/').data['cursor'])
+        self.client.post(f"/api/emergencies/{self.emergencies['low'].id}/resolve/")
+        self.client.patch(f"/api/emergencies/{self.emergencies['medium'].id}/", {'priority': 'high'}, format='json')
+        new = EmergencyResponse.objects.create(patient=self.patient, description='new', priority='critical')
+
+        events = [
+            dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+            for chunk in board.event_stream(
+                EmergencyResponse.objects.all(), lambda rows: [{'id': row.id} for row in rows], since, max_seconds=0,
+            )
+        ][1:]
+        self.assertEqual([(event['event'], json.loads(event['data'])['id']) for event in events], [
+            ('resolved', self.emergencies['low'].id), ('updated', self.emergencies['medium'].id), ('created', new.id),
+        ])
+        self.assertEqual(EmergencyResponse.objects.get(pk=self.emergencies['medium'].id).priority_rank, 2)
+
+        response = self.client.get('/api/emergencies/stream/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(next(iter(response.streaming_content)), b'retry: 2000\n\n')
+        response.close()
+
+
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', role='staff'))
+        self.doctor = Doctor.objects.create(
+            user=User.objects.create_user('doctor', role='doctor'),
+            license_number='D0001', specialty='General Medicine', department='General',
+        )
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        self.beds = [Bed.objects.create(bed_number=f'ICU-{n}', ward='ICU') for n in range(3)]
+        self.other = Bed.objects.create(bed_number='GEN-1', ward='General')
+        Bed.objects.update(updated_at=timezone.now() - datetime.timedelta(minutes=1))
+
+    def test_ward_sync_returns_only_changes_and_deletions(self):
+        synced = self.client.get('/api/beds/changes/', {'ward': 'ICU'}).data
+        self.assertEqual([row['bed_number'] for row in synced['results']], ['ICU-0', 'ICU-1', 'ICU-2'])
+        self.assertEqual((synced['deleted'], synced['has_more']), ([], False))
+
+        self.client.post(f'/api/beds/{self.beds[1].id}/assign_patient/', {'patient_id': self.patient.id})
+        self.client.delete(f'/api/beds/{self.beds[2].id}/')
+        self.client.patch(f'/api/beds/{self.other.id}/', {'status': 'maintenance'}, format='json')
+
+        # bed rows, then tombstones
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/beds/changes/', {'ward': 'ICU', 'cursor': synced['cursor']})
+        self.assertEqual([(row['id'], row['status']) for row in response.data['results']], [(self.beds[1].id, 'occupied')])
+        self.assertEqual(response.data['deleted'], [self.beds[2].id])
+        self.assertTrue(Tombstone.objects.filter(model='core.bed', object_id=self.beds[2].id).exists())
+
+        self.assertEqual(self.client.get('/api/beds/changes/', {'cursor': 'soon'}).status_code, 400)
+        stale = board.make_cursor(timezone.now() - datetime.timedelta(days=changes.TOMBSTONE_DAYS + 1))
+        self.assertEqual(self.client.get('/api/beds/changes/', {'cursor': stale}).status_code, 410)
+
+    def test_pages_split_between_timestamps(self):
+        start = timezone.now() - datetime.timedelta(hours=1)
+        appointments = [
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_date=start + datetime.timedelta(days=n))
+            for n in range(5)
+        ]
+        # The second and third share a timestamp, so no page may end between them
+        for appointment, minutes in zip(appointments, (1, 2, 2, 3, 4)):
+            Appointment.objects.filter(pk=appointment.pk).update(updated_at=start + datetime.timedelta(minutes=minutes))
+        cancelled = appointments.pop().id
+        Appointment.objects.filter(pk=cancelled).delete()
+
+        cursor, pages, seen, deleted = board.make_cursor(start), [], [], []
+        while True:
+            page = self.client.get('/api/appointments/changes/', {'cursor': cursor, 'limit': 2}).data
+            pages.append(len(page['results']) + len(page['deleted']))
+            seen += [row['id'] for row in page['results']]
+            deleted += page['deleted']
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        self.assertEqual(seen, [appointment.id for appointment in appointments])
+        self.assertEqual(deleted, [cancelled])
+        self.assertEqual(pages, [1, 2, 2])
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='admin123', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        self.bed = Bed.objects.create(bed_number='ICU-1', ward='ICU')
+        conditional_stats.reset()
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_lists_answer_304_until_a_write(self):
+        response = self.client.get('/api/beds/')
+        etag = response['ETag']
+        # just the version lookup: no rows read, nothing serialized
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate('/api/beds/', etag).status_code, 304)
+        self.assertEqual(self.revalidate('/api/beds/', f'W/{etag}').status_code, 304)
+        self.client.login(username='admin', password='admin123')
+        self.assertEqual(self.revalidate('/api/beds/', etag).status_code, 304)
+        self.assertEqual(self.revalidate('/api/beds/?ward=ICU', etag).status_code, 200)
+
+        # update() in claim_bed, then a rename shown through patient_name
+        self.client.post(f'/api/beds/{self.bed.id}/assign_patient/', {'patient_id': self.patient.id})
+        response = self.revalidate('/api/beds/', etag)
+        self.assertEqual((response.status_code, response.data['results'][0]['status']), (200, 'occupied'))
+        etag = response['ETag']
+        User.objects.filter(pk=self.patient.user_id).get().save()
+        self.assertEqual(self.revalidate('/api/beds/', etag).status_code, 200)
+
+        stats = self.client.get('/api/conditional/stats/').data
+        self.assertEqual((stats['requests'], stats['not_modified']), (7, 3))
+        self.assertEqual(stats['endpoints']['bed-list']['hit_rate'], round(3 / 7, 4))
+
+    def test_dashboard_revalidates_against_its_payload(self):
+        etag = self.client.get('/api/dashboard/')['ETag']
+        self.assertEqual(self.revalidate('/api/dashboard/', etag).status_code, 304)
+        Bed.objects.create(bed_number='ICU-2', ward='ICU')
+        response = self.revalidate('/api/dashboard/', etag)
+        self.assertEqual((response.status_code, response.data['available_beds']), (200, 2))
+
+
+class AsyncReadTests(TransactionTestCase):
+    """The ASGI read paths; pool threads use their own connections, so rows must be committed."""
+    # Including the replica, if one is configured
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', role='admin')
+        self.token = Token.objects.create(user=self.admin)
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        Bed.objects.create(bed_number='ICU-1', ward='ICU', status='occupied', patient=self.patient)
+        Bed.objects.create(bed_number='ICU-2', ward='ICU')
+        self.emergency = EmergencyResponse.objects.create(patient=self.patient, description='Chest pain', priority='high')
+
+    def get(self, path, **headers):
+        return AsyncRequestFactory().get(path, headers={'Authorization': f'Token {self.token.key}', **headers})
+
+    async def test_async_dashboard_matches_sync_one(self):
+        from .views import AsyncDashboardView, DashboardView
+        expected = await pooled(DashboardView.as_view())(self.get('/api/dashboard/'))
+        await cache.aclear()
+        response = await AsyncDashboardView.as_view()(self.get('/api/dashboard/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        self.assertEqual((response['ETag'], json.loads(response.content)['occupied_beds']), (expected['ETag'], 1))
+
+        response = await AsyncDashboardView.as_view()(self.get('/api/dashboard/', **{'If-None-Match': expected['ETag']}))
+        self.assertEqual(response.status_code, 304)
+        response = await AsyncDashboardView.as_view()(AsyncRequestFactory().get('/api/dashboard/'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_pooled_list_and_async_stream(self):
+        from .views import BedViewSet
+        response = await pooled(BedViewSet.as_view({'get': 'list'}))(self.get('/api/beds/'))
+        self.assertTrue(response.is_rendered)
+        self.assertEqual([bed['bed_number'] for bed in json.loads(response.content)['results']], ['ICU-1', 'ICU-2'])
+
+        since = timezone.now() - datetime.timedelta(minutes=1)
+        events = [
+            chunk async for chunk in board.aevent_stream(
+                EmergencyResponse.objects.all(), lambda rows: [{'id': row.id} for row in rows], since, max_seconds=0,
+            )
+        ]
+        self.assertEqual(events[0], 'retry: 2000\n\n')
+        self.assertIn('event: created', events[1])
+        self.assertIn(f'"id": {self.emergency.id}', events[1])
+
+    async def test_export_streams_chunk_by_chunk(self):
+        from .views import BillingViewSet
+        for n in range(3):
+            await Billing.objects.acreate(
+                patient=self.patient, doctor_fee=Decimal(n), tax_rate=Decimal('0'),
+                description=f'bill {n}', due_date=timezone.localdate(),
+            )
+        view = pooled(BillingViewSet.as_view({'get': 'export'}))
+        with override_settings(ASYNC_READS=True), mock.patch.object(exports, 'EXPORT_CHUNK_SIZE', 2):
+            response = await view(self.get('/api/billings/export/csv/'), fmt='csv')
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+            lines = b''.join(chunks).decode().splitlines()
+            self.assertEqual(len(chunks), 2)
+            self.assertEqual([line.split(',')[0] for line in lines[1:]], [
+                bill.invoice_number async for bill in Billing.objects.order_by('created_at', 'id')
+            ])
+
+            response = await view(self.get('/api/billings/export/ndjson/?status=overdue'), fmt='ndjson')
+            self.assertEqual([chunk async for chunk in response.streaming_content], [])
+
+
+class SequenceAllocatorTests(TransactionTestCase):
+    """Real commits and rollbacks, which TestCase's outer transaction would hide."""
+
+    def test_rollback_does_not_leave_a_block_behind(self):
+        first = SequenceAllocator('test', block_size=5)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                first.next()
+                raise RuntimeError
+        second = SequenceAllocator('test', block_size=5)
+        numbers = [first.next() for _ in range(5)] + [second.next() for _ in range(5)] + list(second.reserve(3))
+        self.assertEqual(len(set(numbers)), len(numbers))
+
+    def test_blocks_are_only_cached_outside_a_transaction(self):
+        allocator = SequenceAllocator('test', block_size=5)
+        with transaction.atomic():
+            self.assertEqual([allocator.next(), allocator.next()], [1, 2])
+        self.assertEqual([allocator.next(), allocator.next()], [3, 4])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(allocator.next(), 5)
+        self.assertEqual(len(queries), 0)
+
+
+class SQLiteProfileTests(TestCase):
+    @unittest.skipIf(settings.SQLITE_TUNED, 'HOSPITAL_SQLITE_TUNED is set')
+    def test_profile_is_opt_in(self):
+        self.assertNotIn('init_command', connection.settings_dict['OPTIONS'])
+        self.assertEqual((connection.settings_dict['CONN_MAX_AGE'], connection.transaction_mode), (0, None))
+
+    def test_tuned_connections(self):
+        tuned = DatabaseWrapper({**connection.settings_dict, **settings.SQLITE_TUNED_DATABASE}, alias='tuned')
+        try:
+            with tuned.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous')
+                self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+                cursor.execute('PRAGMA cache_size')
+                self.assertEqual(cursor.fetchone()[0], -65536)
+            self.assertEqual(tuned.transaction_mode, 'IMMEDIATE')
+        finally:
+            tuned.close()
+
+    def test_unsafe_requests_hold_the_write_lock(self):
+        class Probe(SerializedWritesMixin, APIView):
+            permission_classes = []
+
+            def get(self, request):
+                return Response(_write_lock._is_owned())
+
+            def post(self, request):
+                return Response(_write_lock._is_owned())
+
+        factory = APIRequestFactory()
+        self.assertFalse(Probe.as_view()(factory.post('/')).data)
+        with override_settings(SERIALIZE_WRITES=True):
+            self.assertTrue(Probe.as_view()(factory.post('/')).data)
+            self.assertFalse(Probe.as_view()(factory.get('/')).data)
+        self.assertFalse(_write_lock._is_owned())
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def setUp(self):
+        self.user = User(pk=987654, username='reader')
+        self.addCleanup(cache.clear)
+
+    def test_reads_go_to_the_replica_until_the_handler_writes(self):
+        self.assertIsNone(self.router.db_for_read(Patient))
+        with replica_reads(self.user):
+            self.assertEqual(self.router.db_for_read(Patient), 'replica')
+            self.assertIsNone(self.router.db_for_write(Patient))
+            self.assertIsNone(self.router.db_for_read(Patient))
+        self.assertIsNone(self.router.db_for_read(Patient))
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+
+        pin_to_primary(self.user)
+        with replica_reads(self.user):
+            self.assertIsNone(self.router.db_for_read(Patient))
+        with override_settings(REPLICA_DATABASE=None), replica_reads(AnonymousUser()):
+            self.assertIsNone(self.router.db_for_read(Patient))
+
+    def test_safe_requests_read_the_replica_and_writers_are_pinned(self):
+        router = self.router
+
+        class Probe(ReplicaReadsMixin, APIView):
+            permission_classes = []
+
+            def get(self, request):
+                return Response(router.db_for_read(Patient))
+
+            def post(self, request):
+                return Response(router.db_for_read(Patient))
+
+        class Failing(ReplicaReadsMixin, APIView):
+            permission_classes = []
+
+            def get(self, request):
+                raise RuntimeError(router.db_for_read(Patient))
+
+        factory = APIRequestFactory()
+        self.assertEqual(Probe.as_view()(factory.get('/')).data, 'replica')
+        self.assertIsNone(Probe.as_view()(factory.post('/')).data)
+        self.assertIsNone(router.db_for_read(Patient))
+        with self.assertRaisesMessage(RuntimeError, 'replica'):
+            Failing.as_view()(factory.get('/'))
+        self.assertIsNone(router.db_for_read(Patient))
+
+        middleware = replica_pin_middleware(lambda request: HttpResponse(status=201))
+        for method in ('get', 'post'):
+            request = getattr(RequestFactory(), method)('/')
+            request.user = self.user
+            middleware(request)
+            self.assertEqual(is_pinned(self.user), method == 'post')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+class QueryPlanTests(TestCase):
+    """
+    Every statement the hot paths run is put through EXPLAIN QUERY PLAN.
+    The test fails on a full scan:
+    - a plain SCAN of a table;
+    - a SCAN of an index whose rows then have to be sorted.
+    A scan in index order that stops at the page LIMIT passes. Add an
+    index in the same change as a query that needs one.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', role='admin'))
+        self.doctor = Doctor.objects.create(
+            user=User.objects.create_user('doctor', role='doctor'),
+            license_number='D0001', specialty='General Medicine', department='General',
+        )
+        self.patient = Patient.objects.create(user=User.objects.create_user('patient', role='patient'), medical_id='P0001')
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_date=timezone.now())
+        Billing.objects.create(
+            patient=self.patient, doctor_fee=Decimal('500'), tax_rate=Decimal('18.00'), total_amount=0,
+            description='Consultation', due_date=timezone.now().date(),
+        )
+        Inventory.objects.create(name='Gloves', category='consumable', quantity=1, minimum_threshold=10)
+        EmergencyResponse.objects.create(patient=self.patient, description='Chest pain')
+        self.bed = Bed.objects.create(bed_number='ICU-1', ward='ICU')
+
+    def assertNoTableScans(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        statements = [
+            query['sql'] for query in queries.captured_queries if query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE'))
+        ]
+        self.assertTrue(statements)
+        for sql in statements:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            scans = [step for step in plan if step.startswith('SCAN ')]
+            if any(re.fullmatch(r'SCAN \w+', step) for step in scans) or (scans and 'USE TEMP B-TREE FOR ORDER BY' in plan):
+                self.fail(f'Full scan in:\n{sql}\n' + '\n'.join(plan))
+
+    def test_dashboard(self):
+        for query in [
+            *dashboard.patient_queries(self.patient), *dashboard.doctor_queries(self.doctor),
+            dashboard.admin_queries()[2], dashboard._active_emergencies, dashboard._pending_bills,
+        ]:
+            self.assertNoTableScans(query)
+
+    def test_release_bed_and_low_stock(self):
+        allocate_bed(self.patient, ['ICU'], False)
+        self.assertNoTableScans(lambda: release_bed(self.bed))
+        self.assertNoTableScans(lambda: self.client.get('/api/inventory/low_stock/'))
+
+    def test_filtered_lists(self):
+        today = timezone.now().date().isoformat()
+        for url in [
+            '/api/appointments/',
+            f'/api/appointments/?date_from={today}&date_to={today}',
+            '/api/appointments/?status=scheduled',
+            f'/api/appointments/?patient={self.patient.id}&status=scheduled,confirmed',
+            f'/api/appointments/?doctor={self.doctor.id}&date_from={today}',
+            '/api/billings/?status=pending',
+            f'/api/billings/?patient={self.patient.id}&status=pending',
+            '/api/beds/?ward=ICU',
+            '/api/emergencies/queue/',
+        ]:
+            with self.subTest(url=url):
+                self.assertNoTableScans(lambda: self.assertEqual(self.client.get(url).status_code, 200))
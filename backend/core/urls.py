@@ -1,10 +1,13 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     UserViewSet, PatientViewSet, DoctorViewSet, AppointmentViewSet,
-    MedicalRecordViewSet, PrescriptionViewSet, BedViewSet, ResourceViewSet, BillingViewSet,
-    InventoryViewSet, EmergencyResponseViewSet, LoginView, DashboardView
+    MedicalRecordViewSet, PrescriptionViewSet, BedViewSet, ResourceViewSet, BillingViewSet, PaymentViewSet,
+    InventoryViewSet, EmergencyResponseViewSet, LoginView, LogoutView, AuthCacheStatsView, ConditionalStatsView, RevenueReportView, DashboardView,
+    AsyncDashboardView
 )
+from .aio import pooled_patterns
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -16,11 +19,20 @@ router.register(r'prescriptions', PrescriptionViewSet)
 router.register(r'beds', BedViewSet)
 router.register(r'resources', ResourceViewSet)
 router.register(r'billings', BillingViewSet)
+router.register(r'payments', PaymentViewSet)
 router.register(r'inventory', InventoryViewSet)
 router.register(r'emergencies', EmergencyResponseViewSet)
 
 urlpatterns = [
     path('api/', include(router.urls)),
     path('api/login/', LoginView.as_view(), name='login'),
-    path('api/dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('api/logout/', LogoutView.as_view(), name='logout'),
+    path('api/auth-cache/stats/', AuthCacheStatsView.as_view(), name='auth-cache-stats'),
+    path('api/conditional/stats/', ConditionalStatsView.as_view(), name='conditional-stats'),
+    path('api/dashboard/', (AsyncDashboardView if settings.ASYNC_READS else DashboardView).as_view(), name='dashboard'),
+    path('api/reports/revenue/', RevenueReportView.as_view(), name='revenue-report'),
 ]
+
+if settings.ASYNC_READS:
+    # Sync views would otherwise all share Django's one thread for sync code
+    urlpatterns = pooled_patterns(urlpatterns)
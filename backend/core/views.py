@@ -1,23 +1,102 @@
-from rest_framework import viewsets, status
+from rest_framework import exceptions, mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
+from django.conf import settings
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
 from rest_framework.views import APIView
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views import View
+import csv
+import time
 from decimal import Decimal
-from .models import User, Patient, Doctor, Appointment, MedicalRecord, Prescription, Bed, Resource, Billing, BillMedicine, Inventory, EmergencyResponse
+from types import SimpleNamespace
+from .models import User, Patient, Doctor, Appointment, MedicalRecord, Prescription, Bed, BedAssignment, Resource, Billing, BillMedicine, Payment, DailyRevenue, Inventory, StockMovement, EmergencyResponse, ResourceReservation
+from . import board, dashboard, revenue
+from .aio import run_pooled
+from .authentication import QueryTokenAuthentication, token_cache
+from .beds import allocate_bed, claim_bed, length_of_stay, release_bed
+from .changes import ChangeFeedMixin
+from .conditional import ConditionalGetMixin, conditional_data_response, conditional_stats
+from .exports import ExportMixin, StreamingNegotiation
+from .filters import ScopedFilterBackend
+from .pagination import ReferenceTablePagination
+from .patient_import import PatientImporter, read_records
+from .payments import Overpayment, record_payments
+from .resources import ResourceUnavailable, release_resources, reserve_resources
+from .scheduling import free_slots
+from .search import search_records
+from .sequences import invoice_numbers, new_invoice_number
 from .serializers import (
     UserSerializer, PatientSerializer, DoctorSerializer, AppointmentSerializer,
-    MedicalRecordSerializer, PrescriptionSerializer, BedSerializer, ResourceSerializer, BillingSerializer,
-    InventorySerializer, EmergencyResponseSerializer
+    MedicalRecordSerializer, PrescriptionSerializer, BedSerializer, BedAssignmentSerializer, ResourceSerializer, BillingSerializer,
+    PaymentEntrySerializer, InventorySerializer, StockMovementSerializer, StockMovementEntrySerializer,
+    EmergencyResponseSerializer, ResourceReservationSerializer, ResourceRequestSerializer, preload_related
 )
+from .replicas import ReplicaReadsMixin, replica_reads
+from .stock import InsufficientStock, expiring_items, record_movements
+from .writes import SerializedWritesMixin
+
+BILL_DEFAULTS = {
+    'doctor_fee': 0,
+    'room_charge': 0,
+    'medicine_total': 0,
+    'bill_type': 'consultation',
+    'tax_rate': 18.00,
+    'insurance_applicable': False,
+    'insurance_amount': 0,
+    'discount_amount': 0,
+}
+BULK_BILL_LIMIT = 5000
+BULK_PAYMENT_LIMIT = 5000
+BULK_MOVEMENT_LIMIT = 5000
+MAX_EXPIRY_DAYS = 3650
+BULK_ALLOCATION_LIMIT = 1000
+# ScopedFilterBackend settings for the length-of-stay report
+LENGTH_OF_STAY_FILTERS = SimpleNamespace(
+    filter_params={'ward': 'bed__ward', 'patient': 'patient_id'},
+    date_filter_field='released_at',
+)
+# ... and for the revenue report over the daily rollups
+REVENUE_FILTERS = SimpleNamespace(
+    filter_params={'bill_type': 'bill_type', 'doctor': 'doctor_id', 'payment_method': 'payment_method'},
+    date_filter_field='day',
+)
+
+def build_bill_medicines(medicines):
+    """
+    Returns unsaved ``BillMedicine`` rows for the medicines payload of a
+    bill and their combined total. Rows missing a name, quantity or unit
+    price are skipped.
+    """
+    bill_medicines = []
+    medicine_total = Decimal('0.00')
+    for medicine in medicines:
+        if medicine.get('name') and medicine.get('quantity') and medicine.get('unit_price'):
+            quantity = Decimal(str(medicine['quantity']))
+            unit_price = Decimal(str(medicine['unit_price']))
+            med_total = quantity * unit_price
+            bill_medicines.append(BillMedicine(
+                medicine_name=medicine['name'],
+                quantity=int(medicine['quantity']),
+                unit_price=unit_price,
+                total_price=med_total
+            ))
+            medicine_total += med_total
+    return bill_medicines, medicine_total
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    cursor_ordering = ('id',)
 
     @action(detail=False, methods=['post'], permission_classes=[])
     def register(self, request):
@@ -59,21 +138,96 @@ class UserViewSet(viewsets.ModelViewSet):
                 return Response({'error': f'Failed to create user profile: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class PatientViewSet(viewsets.ModelViewSet):
-    queryset = Patient.objects.all()
+class PatientViewSet(ReplicaReadsMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Patient.objects.select_related('user')
     serializer_class = PatientSerializer
+    cursor_ordering = ('id',)
+    filter_backends = [ScopedFilterBackend]
+    filter_params = {'id': 'id', 'user': 'user_id'}
+    etag_models = (Patient, User)
     permission_classes = [IsAuthenticated]
 
-class DoctorViewSet(viewsets.ModelViewSet):
-    queryset = Doctor.objects.all()
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_patients(self, request):
+        """
+        Bulk onboarding from an uploaded CSV or NDJSON ``file``. Very large
+        migrations should use the ``import_patients`` management command,
+        which also hashes passwords across a process pool.
+        """
+        if request.user.role not in ('admin', 'staff'):
+            return Response({'error': 'Only admin and staff can import patients'}, status=status.HTTP_403_FORBIDDEN)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload a CSV or NDJSON file as "file"'}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        if fmt not in ('csv', 'ndjson'):
+            return Response({'error': 'format must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            importer = PatientImporter().run(read_records(upload, fmt))
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return Response({'error': f'Could not read file: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'imported': importer.imported,
+            'skipped': importer.skipped,
+            'seconds': round(importer.elapsed, 3),
+            'rows_per_second': round(importer.rate),
+        }, status=status.HTTP_201_CREATED)
+
+class DoctorViewSet(ReplicaReadsMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Doctor.objects.select_related('user')
     serializer_class = DoctorSerializer
+    pagination_class = ReferenceTablePagination
+    etag_models = (Doctor, User)
     permission_classes = [IsAuthenticated]
 
-class AppointmentViewSet(viewsets.ModelViewSet):
-    queryset = Appointment.objects.all()
+class AppointmentViewSet(SerializedWritesMixin, ReplicaReadsMixin, ChangeFeedMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = Appointment.objects.select_related('patient__user', 'doctor__user')
     serializer_class = AppointmentSerializer
+    cursor_ordering = ('appointment_date', 'id')
+    filter_backends = [ScopedFilterBackend]
+    filter_params = {'patient': 'patient_id', 'doctor': 'doctor_id', 'status': 'status'}
+    date_filter_field = 'appointment_date'
+    mine_lookups = {'patient': 'patient', 'doctor': 'doctor'}
+    export_dataset = 'appointments'
     permission_classes = [IsAuthenticated]
 
+    @action(detail=False, methods=['get'])
+    def free_slots(self, request):
+        """
+        The next ``count`` open slots (default 10, at most 100) across the
+        available doctors of ``department``, or the comma separated
+        ``doctor`` ids, starting at ``from`` (default now) and looking up to
+        ``days`` ahead.
+        """
+        params = request.query_params
+        doctors = Doctor.objects.filter(available=True)
+        if params.get('department'):
+            doctors = doctors.filter(department=params['department'])
+        try:
+            if params.get('doctor'):
+                doctors = doctors.filter(id__in=[int(v) for v in params['doctor'].split(',') if v.strip()])
+            count = min(int(params.get('count', 10)), 100)
+            days = int(params.get('days', 14))
+        except ValueError:
+            return Response({'error': 'doctor, count and days must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if count < 1:
+            return Response({'error': 'count must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        if days < 0:
+            return Response({'error': 'days must not be negative'}, status=status.HTTP_400_BAD_REQUEST)
+        start = timezone.now()
+        if params.get('from'):
+            try:
+                # Well formed but impossible dates raise rather than return None
+                start = parse_datetime(params['from'])
+            except ValueError:
+                start = None
+            if start is None:
+                return Response({'error': 'Invalid from datetime'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(start):
+                start = timezone.make_aware(start)
+        return Response(free_slots(doctors, start, count, days))
+
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
         appointment = self.get_object()
@@ -88,75 +242,201 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         appointment.save()
         return Response({'status': 'Appointment completed'})
 
-class MedicalRecordViewSet(viewsets.ModelViewSet):
-    queryset = MedicalRecord.objects.all()
+class MedicalRecordViewSet(ReplicaReadsMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = MedicalRecord.objects.select_related(
+        'patient__user', 'doctor__user'
+    ).prefetch_related('prescriptions__medicine')
     serializer_class = MedicalRecordSerializer
+    cursor_ordering = ('-created_at', '-id')
+    filter_backends = [ScopedFilterBackend]
+    filter_params = {'patient': 'patient_id', 'doctor': 'doctor_id', 'appointment': 'appointment_id'}
+    date_filter_field = 'record_date'
+    mine_lookups = {'patient': 'patient', 'doctor': 'doctor'}
+    export_dataset = 'medical-records'
+    replica_actions = ('list', 'retrieve', 'search')
     permission_classes = [IsAuthenticated]
 
-class PrescriptionViewSet(viewsets.ModelViewSet):
-    queryset = Prescription.objects.all()
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over diagnosis, treatment, notes and prescriptions.
+        ``q`` is required; ``patient``, ``doctor`` and ``mine=true`` narrow
+        the hits and ``limit`` caps them (default 20, at most 100).
+        ``order=recent`` returns the newest matches instead of the best.
+        """
+        params = request.query_params
+        text = params.get('q', '').strip()
+        if not text:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            patient = int(params['patient']) if params.get('patient') else None
+            doctor = int(params['doctor']) if params.get('doctor') else None
+            limit = int(params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'patient, doctor and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        if params.get('mine', '').lower() in ('true', '1', 'yes') and request.user.role in self.mine_lookups:
+            profile = getattr(request.user, f'{request.user.role}_profile', None)
+            if profile is None:
+                return Response({'results': []})
+            if request.user.role == 'patient':
+                patient = profile.id
+            else:
+                doctor = profile.id
+
+        order = params.get('order', 'rank')
+        if order not in ('rank', 'recent'):
+            return Response({'error': 'order must be rank or recent'}, status=status.HTTP_400_BAD_REQUEST)
+        hits = search_records(text, patient, doctor, limit, order)
+        records = MedicalRecord.objects.select_related('patient__user', 'doctor__user').in_bulk([hit[0] for hit in hits])
+        results = []
+        for record_id, rank, snippet in hits:
+            record = records[record_id]
+            results.append({
+                'id': record.id,
+                'patient': record.patient_id,
+                'patient_name': record.patient.user.get_full_name(),
+                'doctor': record.doctor_id,
+                'doctor_name': record.doctor.user.get_full_name(),
+                'record_date': record.record_date,
+                'diagnosis': record.diagnosis,
+                'rank': rank,
+                'snippet': snippet,
+            })
+        return Response({'results': results})
+
+class PrescriptionViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
+    queryset = Prescription.objects.select_related('medicine')
     serializer_class = PrescriptionSerializer
+    cursor_ordering = ('id',)
     permission_classes = [IsAuthenticated]
 
-class BedViewSet(viewsets.ModelViewSet):
-    queryset = Bed.objects.all()
+class BedViewSet(SerializedWritesMixin, ReplicaReadsMixin, ChangeFeedMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Bed.objects.select_related('patient__user')
     serializer_class = BedSerializer
+    cursor_ordering = ('id',)
+    filter_backends = [ScopedFilterBackend]
+    filter_params = {'ward': 'ward', 'status': 'status', 'patient': 'patient_id'}
+    mine_lookups = {'patient': 'patient'}
+    # Deleting a patient empties their bed without saving it
+    etag_models = (Bed, Patient, User)
+    replica_actions = ('list', 'retrieve', 'history', 'length_of_stay')
     permission_classes = [IsAuthenticated]
 
+    def get_appointment(self, request, patient):
+        """The optional ``appointment_id`` a bed is assigned for; must belong to ``patient``."""
+        appointment_id = request.data.get('appointment_id')
+        if not appointment_id:
+            return None
+        try:
+            return Appointment.objects.get(id=appointment_id, patient=patient)
+        except (Appointment.DoesNotExist, ValueError, TypeError):
+            raise ValidationError({'appointment_id': 'Appointment not found for this patient'})
+
     @action(detail=True, methods=['post'])
     def assign_patient(self, request, pk=None):
         bed = self.get_object()
         patient_id = request.data.get('patient_id')
         try:
             patient = Patient.objects.get(id=patient_id)
+        except (Patient.DoesNotExist, ValueError, TypeError):
+            return Response({'error': 'Patient not found'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Check if patient is already assigned to another bed
-            existing_bed = Bed.objects.filter(patient=patient, status='occupied').exclude(id=bed.id).first()
-            if existing_bed:
-                return Response({
-                    'error': f'Patient is already assigned to bed {existing_bed.bed_number} in {existing_bed.ward}. Please release that bed first.'
-                }, status=status.HTTP_400_BAD_REQUEST)
-
-            bed.patient = patient
-            bed.status = 'occupied'
-            bed.admission_date = timezone.now()
-            bed.save()
+        # Check if patient is already assigned to another bed
+        existing_bed = Bed.objects.filter(patient=patient).exclude(id=bed.id).first()
+        if existing_bed:
+            return Response({
+                'error': f'Patient is already assigned to bed {existing_bed.bed_number} in {existing_bed.ward}. Please release that bed first.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if bed.patient_id == patient.id:
             return Response({'status': 'Patient assigned to bed'})
-        except Patient.DoesNotExist:
+
+        appointment = self.get_appointment(request, patient)
+        try:
+            claimed = claim_bed(bed.id, patient, appointment)
+        except IntegrityError:
+            claimed = False
+        if not claimed:
+            return Response({'error': f'Bed {bed.bed_number} is no longer available'}, status=status.HTTP_409_CONFLICT)
+        dashboard.invalidate_dashboard_cache()
+        return Response({'status': 'Patient assigned to bed'})
+
+    @action(detail=False, methods=['post'])
+    def allocate(self, request):
+        """
+        Assigns the first free bed to a patient. ``ward`` is an optional
+        comma separated list of preferred wards; ``any_ward`` (default true)
+        falls back to the other wards once those are full.
+        """
+        patient_id = request.data.get('patient_id')
+        try:
+            patient = Patient.objects.get(id=patient_id)
+        except (Patient.DoesNotExist, ValueError, TypeError):
             return Response({'error': 'Patient not found'}, status=status.HTTP_404_NOT_FOUND)
 
+        existing_bed = Bed.objects.filter(patient=patient).first()
+        if existing_bed:
+            return Response({
+                'error': f'Patient is already assigned to bed {existing_bed.bed_number} in {existing_bed.ward}. Please release that bed first.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        wards = request.data.get('ward') or []
+        if isinstance(wards, str):
+            wards = [ward.strip() for ward in wards.split(',') if ward.strip()]
+        any_ward = str(request.data.get('any_ward', True)).lower() not in ('false', '0')
+        appointment = self.get_appointment(request, patient)
+        try:
+            bed = allocate_bed(patient, wards, any_ward, appointment)
+        except IntegrityError:
+            # Another request gave this patient a bed in the meantime
+            return Response({'error': 'Patient is already assigned to a bed'}, status=status.HTTP_400_BAD_REQUEST)
+        if bed is None:
+            return Response({'error': 'No beds available'}, status=status.HTTP_409_CONFLICT)
+        return Response(BedSerializer(bed).data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'])
     def release_bed(self, request, pk=None):
-        bed = self.get_object()
-
-        # Update any appointment notes that reference this bed
-        if bed.patient:
-            from .models import Appointment
-            appointments = Appointment.objects.filter(
-                patient=bed.patient,
-                notes__contains=f'Bed assigned: {bed.bed_number}'
-            )
-            for appointment in appointments:
-                appointment.notes = appointment.notes.replace(
-                    f'\n(Bed assigned: {bed.bed_number} - {bed.ward})',
-                    f'\n(Bed released: {bed.bed_number} - {bed.ward})'
-                )
-                appointment.save()
-
-        bed.patient = None
-        bed.status = 'available'
-        bed.admission_date = None
-        bed.save()
+        release_bed(self.get_object())
         return Response({'status': 'Bed released'})
 
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        assignments = BedAssignment.objects.filter(bed=self.get_object()).select_related(
+            'bed', 'patient__user'
+        )
+        return Response(BedAssignmentSerializer(assignments, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def length_of_stay(self, request):
+        """
+        Completed stays, optionally narrowed to ``ward``, ``patient`` and a
+        ``date_from``/``date_to`` range on the release date.
+        """
+        assignments = ScopedFilterBackend().filter_queryset(request, BedAssignment.objects.all(), LENGTH_OF_STAY_FILTERS)
+        return Response(length_of_stay(assignments))
+
 class ResourceViewSet(viewsets.ModelViewSet):
     queryset = Resource.objects.all()
     serializer_class = ResourceSerializer
+    pagination_class = ReferenceTablePagination
     permission_classes = [IsAuthenticated]
 
-class BillingViewSet(viewsets.ModelViewSet):
-    queryset = Billing.objects.all()
+class BillingViewSet(SerializedWritesMixin, ReplicaReadsMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = Billing.objects.select_related('patient__user').prefetch_related('medicines', 'payments')
     serializer_class = BillingSerializer
+    cursor_ordering = ('-created_at', '-id')
+    filter_backends = [ScopedFilterBackend]
+    filter_params = {
+        'patient': 'patient_id',
+        'doctor': 'appointment__doctor_id',
+        'appointment': 'appointment_id',
+        'status': 'status',
+        'bill_type': 'bill_type',
+    }
+    date_filter_field = 'created_at'
+    mine_lookups = {'patient': 'patient', 'doctor': 'appointment__doctor'}
+    export_dataset = 'billings'
     permission_classes = [IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
@@ -166,79 +446,371 @@ class BillingViewSet(viewsets.ModelViewSet):
         medicines = data.pop('medicines', [])
 
         # Set default values for new fields
-        data.setdefault('doctor_fee', 0)
-        data.setdefault('room_charge', 0)
-        data.setdefault('medicine_total', 0)
-        data.setdefault('bill_type', 'consultation')
-        data.setdefault('tax_rate', 18.00)
-        data.setdefault('insurance_applicable', False)
-        data.setdefault('insurance_amount', 0)
-        data.setdefault('discount_amount', 0)
+        for field, default in BILL_DEFAULTS.items():
+            data.setdefault(field, default)
 
         try:
-            # Create the bill
             serializer = self.get_serializer(data=data)
             serializer.is_valid(raise_exception=True)
-            bill = serializer.save()
-
-            # Create medicine records
-            medicine_total = Decimal('0.00')
-            for medicine in medicines:
-                if medicine.get('name') and medicine.get('quantity') and medicine.get('unit_price'):
-                    quantity = Decimal(str(medicine['quantity']))
-                    unit_price = Decimal(str(medicine['unit_price']))
-                    med_total = quantity * unit_price
-                    BillMedicine.objects.create(
-                        bill=bill,
-                        medicine_name=medicine['name'],
-                        quantity=int(medicine['quantity']),
-                        unit_price=unit_price,
-                        total_price=med_total
-                    )
-                    medicine_total += med_total
+            bill_medicines, medicine_total = build_bill_medicines(medicines)
 
-            # Update bill with correct medicine total
-            bill.medicine_total = medicine_total
-            bill.save()
+            # Numbered before the transaction, see SequenceAllocator
+            invoice_number = new_invoice_number()
+            # Create the bill with its final medicine total, then its line items
+            with transaction.atomic():
+                bill = serializer.save(medicine_total=medicine_total, invoice_number=invoice_number)
+                for bill_medicine in bill_medicines:
+                    bill_medicine.bill = bill
+                BillMedicine.objects.bulk_create(bill_medicines)
 
             return Response(BillingSerializer(bill).data, status=status.HTTP_201_CREATED)
         except Exception as e:
-            print(f"Error creating bill: {e}")
-            print(f"Request data: {data}")
-            print(f"Medicines data: {medicines}")
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates many bills with their medicines in one transaction. Accepts
+        a list of bills (or ``{"bills": [...]}``) shaped like ``create``.
+        """
+        bills_data = request.data.get('bills') if isinstance(request.data, dict) else request.data
+        if not isinstance(bills_data, list) or not bills_data:
+            return Response({'error': 'Expected a non-empty list of bills'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(bills_data) > BULK_BILL_LIMIT:
+            return Response({'error': f'At most {BULK_BILL_LIMIT} bills per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items, medicines_per_bill = [], []
+        for index, bill_data in enumerate(bills_data):
+            if not isinstance(bill_data, dict):
+                return Response({'error': f'Bill {index}: expected an object'}, status=status.HTTP_400_BAD_REQUEST)
+            bill_data = dict(bill_data)
+            medicines = bill_data.pop('medicines', None) or []
+            if not isinstance(medicines, list) or not all(isinstance(medicine, dict) for medicine in medicines):
+                return Response(
+                    {'error': f'Bill {index}: medicines must be a list of objects'}, status=status.HTTP_400_BAD_REQUEST
+                )
+            medicines_per_bill.append(medicines)
+            for field, default in BILL_DEFAULTS.items():
+                bill_data.setdefault(field, default)
+            items.append(bill_data)
+
+        serializer = self.get_serializer(data=items, many=True)
+        preload_related(serializer.child, items)
+        serializer.is_valid(raise_exception=True)
+
+        numbers = iter(invoice_numbers.reserve(len(items)))
+        bills, line_items = [], []
+        for index, (validated, medicines) in enumerate(zip(serializer.validated_data, medicines_per_bill)):
+            try:
+                bill_medicines, medicine_total = build_bill_medicines(medicines)
+            except (ArithmeticError, KeyError, TypeError, ValueError) as e:
+                return Response({'error': f'Bill {index}: invalid medicines: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+            bill = Billing(**validated)
+            bill.medicine_total = medicine_total
+            if not bill.invoice_number:
+                bill.invoice_number = f"INV-{next(numbers):06d}"
+            bill.calculate_totals()
+            bills.append(bill)
+            line_items.append(bill_medicines)
+
+        with transaction.atomic():
+            Billing.objects.bulk_create(bills, batch_size=500)
+            for bill, bill_medicines in zip(bills, line_items):
+                for bill_medicine in bill_medicines:
+                    bill_medicine.bill = bill
+            BillMedicine.objects.bulk_create(
+                [bill_medicine for bill_medicines in line_items for bill_medicine in bill_medicines],
+                batch_size=1000,
+            )
+            revenue.add_bills(bills)
+        # bulk_create() sends no post_save signals
+        dashboard.invalidate_dashboard_cache()
+
+        return Response({
+            'created': len(bills),
+            'bills': [
+                {
+                    'id': bill.id,
+                    'invoice_number': bill.invoice_number,
+                    'total_amount': str(bill.total_amount.quantize(Decimal('0.01'))),
+                }
+                for bill in bills
+            ],
+        }, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'])
     def mark_paid(self, request, pk=None):
         bill = self.get_object()
-        bill.status = 'paid'
-        bill.paid_date = timezone.now()
-        bill.save()
+        if bill.pending_amount > 0:
+            # Settle the outstanding balance as a payment so paid_amount adds up
+            try:
+                record_payments([{
+                    'bill': bill,
+                    'amount': bill.pending_amount,
+                    'payment_method': request.data.get('payment_method', 'cash'),
+                    'transaction_id': request.data.get('transaction_id', ''),
+                    'notes': 'Marked as paid',
+                }])
+            except Overpayment:
+                # Another payment landed since the bill was read
+                return Response({'error': 'Bill changed while marking it paid; try again'}, status=status.HTTP_409_CONFLICT)
+        else:
+            bill.status = 'paid'
+            bill.paid_date = bill.paid_date or timezone.now()
+            bill.save()
         return Response({'status': 'Bill marked as paid'})
 
-class InventoryViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        bill = self.get_object()
+        if bill.paid_amount > 0:
+            return Response({'error': 'Cannot cancel a bill that has payments'}, status=status.HTTP_400_BAD_REQUEST)
+        bill.status = 'cancelled'
+        bill.save()
+        return Response({'status': 'Bill cancelled'})
+
+class PaymentViewSet(SerializedWritesMixin, ReplicaReadsMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
+                     mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Payments are append-only: they are rolled up into their bill when
+    posted, so editing or deleting one would leave the bill out of step.
+    """
+    queryset = Payment.objects.all()
+    serializer_class = PaymentEntrySerializer
+    cursor_ordering = ('-created_at', '-id')
+    filter_backends = [ScopedFilterBackend]
+    filter_params = {'bill': 'bill_id', 'payment_method': 'payment_method'}
+    date_filter_field = 'payment_date'
+    mine_lookups = {'patient': 'bill__patient'}
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            payment, = record_payments([serializer.validated_data])
+        except Overpayment as e:
+            return Response({'error': str(e), 'bills': e.bill_ids}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(payment).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Posts a list of payments (or ``{"payments": [...]}``) in one transaction."""
+        payments_data = request.data.get('payments') if isinstance(request.data, dict) else request.data
+        if not isinstance(payments_data, list) or not payments_data:
+            return Response({'error': 'Expected a non-empty list of payments'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(payments_data) > BULK_PAYMENT_LIMIT:
+            return Response({'error': f'At most {BULK_PAYMENT_LIMIT} payments per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data=payments_data, many=True)
+        serializer.is_valid(raise_exception=True)
+        try:
+            payments = record_payments(serializer.validated_data)
+        except Overpayment as e:
+            return Response({'error': str(e), 'bills': e.bill_ids}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'created': len(payments),
+            'payments': [{'id': payment.id, 'bill': payment.bill_id} for payment in payments],
+        }, status=status.HTTP_201_CREATED)
+
+class InventoryViewSet(SerializedWritesMixin, ReplicaReadsMixin, viewsets.ModelViewSet):
+    """
+    Stock levels change only through movements, so ``quantity`` is
+    read-only after creation.
+    """
     queryset = Inventory.objects.all()
     serializer_class = InventorySerializer
+    cursor_ordering = ('id',)
+    replica_actions = ('list', 'retrieve', 'low_stock', 'expiring', 'history')
     permission_classes = [IsAuthenticated]
 
+    def perform_create(self, serializer):
+        item = serializer.save()
+        if item.quantity:
+            StockMovement.objects.create(
+                item=item, kind='receipt', change=item.quantity, balance=item.quantity,
+                notes='Opening stock', created_by=self.request.user,
+            )
+
     @action(detail=False)
     def low_stock(self, request):
         low_stock_items = Inventory.objects.filter(quantity__lte=models.F('minimum_threshold'))
-        serializer = self.get_serializer(low_stock_items, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(low_stock_items)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
-class EmergencyResponseViewSet(viewsets.ModelViewSet):
-    queryset = EmergencyResponse.objects.all()
+    @action(detail=False)
+    def expiring(self, request):
+        """Items in stock expiring within ``days`` (default 30) days, or already expired."""
+        try:
+            # Already expired items are always included, so a negative window adds nothing
+            days = max(min(int(request.query_params.get('days', 30)), MAX_EXPIRY_DAYS), 0)
+            items = expiring_items(days)
+        except (ValueError, OverflowError):
+            return Response({'error': 'days must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(items)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def movements(self, request):
+        """
+        Posts a list of stock movements (or ``{"movements": [...]}``) in one
+        transaction. If any item would go below zero nothing is applied.
+        """
+        movements_data = request.data.get('movements') if isinstance(request.data, dict) else request.data
+        if not isinstance(movements_data, list) or not movements_data:
+            return Response({'error': 'Expected a non-empty list of movements'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(movements_data) > BULK_MOVEMENT_LIMIT:
+            return Response({'error': f'At most {BULK_MOVEMENT_LIMIT} movements per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = StockMovementEntrySerializer(data=movements_data, many=True)
+        serializer.is_valid(raise_exception=True)
+        try:
+            movements = record_movements(serializer.validated_data, request.user)
+        except InsufficientStock as e:
+            return Response({'error': str(e), 'items': e.item_ids}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'created': len(movements),
+            'movements': [
+                {'id': movement.id, 'item': movement.item_id, 'balance': movement.balance} for movement in movements
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """The item's stock ledger, oldest first."""
+        page = self.paginate_queryset(StockMovement.objects.filter(item=self.get_object()).select_related('item'))
+        return self.get_paginated_response(StockMovementSerializer(page, many=True).data)
+
+class EmergencyResponseViewSet(SerializedWritesMixin, ChangeFeedMixin, viewsets.ModelViewSet):
+    queryset = EmergencyResponse.objects.select_related('patient__user').prefetch_related(
+        'resources_allocated', 'staff_assigned',
+        models.Prefetch('reservations', queryset=ResourceReservation.objects.select_related('resource')),
+    )
     serializer_class = EmergencyResponseSerializer
+    cursor_ordering = ('-created_at', '-id')
     permission_classes = [IsAuthenticated]
 
+    def create(self, request, *args, **kwargs):
+        """
+        Reports an emergency and reserves what it needs: ``resources`` as
+        ``[{"resource": id, "quantity": n}]``, or ``resources_allocated``
+        ids for one unit each. 409 if any resource is short, in which case
+        nothing is created.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        requested = request.data.get('resources')
+        if requested is None:
+            if hasattr(request.data, 'getlist'):
+                resource_ids = request.data.getlist('resources_allocated')
+            else:
+                resource_ids = request.data.get('resources_allocated') or []
+            requested = [{'resource': resource_id} for resource_id in resource_ids]
+        resources = ResourceRequestSerializer(data=requested, many=True)
+        resources.is_valid(raise_exception=True)
+
+        try:
+            with transaction.atomic():
+                emergency = serializer.save()
+                reserve_resources([
+                    (emergency.id, item['resource'].id, item['quantity']) for item in resources.validated_data
+                ], request.user)
+        except ResourceUnavailable as e:
+            return Response({'error': str(e), 'resources': e.resource_ids}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(self.get_queryset().get(pk=emergency.pk)).data, status=status.HTTP_201_CREATED)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            emergency = serializer.save()
+            if emergency.status == 'resolved':
+                release_resources(emergency)
+
+    @action(detail=False, methods=['post'])
+    def allocate(self, request):
+        """
+        Reserves resources for several active emergencies at once from a
+        list of ``{"emergency", "resource", "quantity"}`` (or
+        ``{"allocations": [...]}``). All or nothing: 409 with the short
+        ``resources`` if any cannot be met.
+        """
+        allocations_data = request.data.get('allocations') if isinstance(request.data, dict) else request.data
+        if not isinstance(allocations_data, list) or not allocations_data:
+            return Response({'error': 'Expected a non-empty list of allocations'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(allocations_data) > BULK_ALLOCATION_LIMIT:
+            return Response({'error': f'At most {BULK_ALLOCATION_LIMIT} allocations per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = ResourceReservationSerializer(data=allocations_data, many=True)
+        serializer.is_valid(raise_exception=True)
+        try:
+            reservations = reserve_resources([
+                (item['emergency'].id, item['resource'].id, item['quantity']) for item in serializer.validated_data
+            ], request.user)
+        except ResourceUnavailable as e:
+            return Response({'error': str(e), 'resources': e.resource_ids}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'created': len(reservations),
+            'reservations': [
+                {
+                    'id': reservation.id, 'emergency': reservation.emergency_id,
+                    'resource': reservation.resource_id, 'quantity': reservation.quantity,
+                }
+                for reservation in reservations
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def queue(self, request):
+        """
+        Active emergencies, most severe and then longest waiting first, with
+        the ``cursor`` to pass to ``stream/`` for changes after this snapshot.
+        """
+        cursor = board.make_cursor(timezone.now())
+        try:
+            limit = min(int(request.query_params.get('limit', board.MAX_QUEUE)), board.MAX_QUEUE)
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        emergencies = board.active_queue(self.get_queryset(), limit)
+        return Response({'cursor': cursor, 'results': self.get_serializer(emergencies, many=True).data})
+
+    @action(
+        detail=False, methods=['get'], content_negotiation_class=StreamingNegotiation,
+        authentication_classes=[*api_settings.DEFAULT_AUTHENTICATION_CLASSES, QueryTokenAuthentication],
+    )
+    def stream(self, request):
+        """
+        Server-Sent Events for emergencies created, updated or resolved after
+        ``cursor`` (the ``Last-Event-ID`` header on reconnect), or from now.
+        ``EventSource`` cannot send headers, so the token may be passed as
+        ``?token=``.
+        """
+        value = request.headers.get('Last-Event-ID') or request.query_params.get('cursor')
+        since = board.parse_cursor(value) if value else timezone.now()
+        if since is None:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        # Under ASGI the waits between reads hold no thread
+        stream = board.aevent_stream if settings.ASYNC_READS else board.event_stream
+        response = StreamingHttpResponse(
+            stream(self.get_queryset(), lambda rows: self.get_serializer(rows, many=True).data, since),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Tell nginx not to buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
     @action(detail=True, methods=['post'])
     def resolve(self, request, pk=None):
         emergency = self.get_object()
-        emergency.status = 'resolved'
-        emergency.resolved_at = timezone.now()
-        emergency.save()
-        return Response({'status': 'Emergency resolved'})
+        with transaction.atomic():
+            emergency.status = 'resolved'
+            emergency.resolved_at = timezone.now()
+            emergency.save()
+            released = release_resources(emergency)
+        return Response({'status': 'Emergency resolved', 'units_released': released})
 
 class LoginView(APIView):
     permission_classes = []  # No authentication required for login
@@ -252,124 +824,100 @@ class LoginView(APIView):
             return Response({'token': token.key, 'user': UserSerializer(user).data})
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
-class DashboardView(APIView):
+class LogoutView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        # Deleting the token also evicts it from the token cache (core.signals)
+        Token.objects.filter(user=request.user).delete()
+        return Response({'status': 'Logged out'})
+
+class AuthCacheStatsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-
-        if user.role == 'admin':
-            # Admin sees all data
-            data = {
-                'role': 'admin',
-                'total_patients': Patient.objects.count(),
-                'total_doctors': Doctor.objects.count(),
-                'total_staff': User.objects.filter(role='staff').count(),
-                'total_appointments': Appointment.objects.count(),
-                'available_beds': Bed.objects.filter(status='available').count(),
-                'occupied_beds': Bed.objects.filter(status='occupied').count(),
-                'active_emergencies': EmergencyResponse.objects.filter(status='active').count(),
-                'low_stock_items': Inventory.objects.filter(quantity__lte=models.F('minimum_threshold')).count(),
-                'pending_bills': Billing.objects.filter(status='pending').count(),
-                'total_inventory_value': Inventory.objects.count(),
-            }
-        elif user.role == 'patient':
-            # Patient sees personal data
-            try:
-                patient_profile = user.patient_profile
-                data = {
-                    'role': 'patient',
-                    'welcome_message': f'Welcome back, {user.get_full_name()}',
-                    'my_appointments': Appointment.objects.filter(patient=patient_profile).count(),
-                    'upcoming_appointments': Appointment.objects.filter(
-                        patient=patient_profile,
-                        appointment_date__gte=timezone.now(),
-                        status__in=['scheduled', 'confirmed']
-                    ).count(),
-                    'my_bills': Billing.objects.filter(patient=patient_profile).count(),
-                    'pending_bills': Billing.objects.filter(patient=patient_profile, status='pending').count(),
-                    'my_medical_records': MedicalRecord.objects.filter(patient=patient_profile).count(),
-                    'current_bed': Bed.objects.filter(patient=patient_profile).first(),
-                }
-            except:
-                # If profile doesn't exist, return basic data
-                data = {
-                    'role': 'patient',
-                    'welcome_message': f'Welcome back, {user.get_full_name()}',
-                    'error': 'Profile not found. Please contact administrator.',
-                    'my_appointments': 0,
-                    'upcoming_appointments': 0,
-                    'my_bills': 0,
-                    'pending_bills': 0,
-                    'my_medical_records': 0,
-                    'current_bed': None,
-                }
-            else:
-                # Profile exists, get current bed
-                current_bed = Bed.objects.filter(patient=patient_profile).first()
-                if current_bed:
-                    current_bed_data = BedSerializer(current_bed).data
-                else:
-                    current_bed_data = None
-
-                data = {
-                    'role': 'patient',
-                    'welcome_message': f'Welcome back, {user.get_full_name()}',
-                    'my_appointments': Appointment.objects.filter(patient=patient_profile).count(),
-                    'upcoming_appointments': Appointment.objects.filter(
-                        patient=patient_profile,
-                        appointment_date__gte=timezone.now(),
-                        status__in=['scheduled', 'confirmed']
-                    ).count(),
-                    'my_bills': Billing.objects.filter(patient=patient_profile).count(),
-                    'pending_bills': Billing.objects.filter(patient=patient_profile, status='pending').count(),
-                    'my_medical_records': MedicalRecord.objects.filter(patient=patient_profile).count(),
-                    'current_bed': current_bed_data,
-                }
-        elif user.role == 'doctor':
-            # Doctor sees their appointments and patients
-            try:
-                doctor_profile = user.doctor_profile
-                data = {
-                    'role': 'doctor',
-                    'welcome_message': f'Welcome back, Dr. {user.get_full_name()}',
-                    'my_appointments': Appointment.objects.filter(doctor=doctor_profile).count(),
-                    'today_appointments': Appointment.objects.filter(
-                        doctor=doctor_profile,
-                        appointment_date__date=timezone.now().date()
-                    ).count(),
-                    'pending_appointments': Appointment.objects.filter(
-                        doctor=doctor_profile,
-                        status='scheduled'
-                    ).count(),
-                    'my_patients': Appointment.objects.filter(doctor=doctor_profile).values('patient').distinct().count(),
-                    'completed_appointments': Appointment.objects.filter(
-                        doctor=doctor_profile,
-                        status='completed'
-                    ).count(),
-                }
-            except:
-                # If profile doesn't exist, return basic data
-                data = {
-                    'role': 'doctor',
-                    'welcome_message': f'Welcome back, Dr. {user.get_full_name()}',
-                    'error': 'Profile not found. Please contact administrator.',
-                    'my_appointments': 0,
-                    'today_appointments': 0,
-                    'pending_appointments': 0,
-                    'my_patients': 0,
-                    'completed_appointments': 0,
-                }
-        else:  # staff
-            # Staff sees operational data
-            data = {
-                'role': 'staff',
-                'welcome_message': f'Welcome back, {user.get_full_name()}',
-                'total_appointments': Appointment.objects.count(),
-                'available_beds': Bed.objects.filter(status='available').count(),
-                'active_emergencies': EmergencyResponse.objects.filter(status='active').count(),
-                'low_stock_items': Inventory.objects.filter(quantity__lte=models.F('minimum_threshold')).count(),
-                'pending_bills': Billing.objects.filter(status='pending').count(),
-            }
-
-        return Response(data)
+        if request.user.role != 'admin':
+            return Response({'error': 'Only admins can view cache statistics'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(token_cache.stats())
+
+class ConditionalStatsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role != 'admin':
+            return Response({'error': 'Only admins can view cache statistics'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(conditional_stats.stats())
+
+class RevenueReportView(ReplicaReadsMixin, APIView):
+    """
+    Revenue per day, month or year from the daily rollups: bills raised and
+    billed/tax amounts by creation date, payments and amount collected by
+    payment date. ``group_by`` takes ``bill_type``, ``doctor`` and
+    ``payment_method`` (comma separated); bills fall under a blank
+    ``payment_method``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role not in ('admin', 'staff'):
+            return Response({'error': 'Only admins and staff can view revenue'}, status=status.HTTP_403_FORBIDDEN)
+        period = request.query_params.get('period', 'month')
+        if period not in revenue.PERIODS:
+            return Response({'error': f'period must be one of {", ".join(revenue.PERIODS)}'}, status=status.HTTP_400_BAD_REQUEST)
+        group_by = [group.strip() for group in request.query_params.get('group_by', '').split(',') if group.strip()]
+        unknown = [group for group in group_by if group not in revenue.GROUPS]
+        if unknown:
+            return Response({'error': f'Cannot group by {", ".join(unknown)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = ScopedFilterBackend().filter_queryset(request, DailyRevenue.objects.all(), REVENUE_FILTERS)
+        rows = revenue.revenue_report(rollups, period, group_by)
+        for row in rows:
+            if 'doctor_id' in row:
+                row['doctor'] = row.pop('doctor_id')
+            for measure in ('billed_amount', 'tax_amount', 'collected_amount'):
+                row[measure] = str(row[measure].quantize(Decimal('0.01')))
+        return Response({'period': period, 'group_by': group_by, 'results': rows})
+
+class DashboardView(ReplicaReadsMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        started = time.perf_counter()
+        data, key, queries = dashboard.for_user(request.user)
+        data.update(dashboard.counts(key, queries))
+        return conditional_data_response(request, 'dashboard', data, time.perf_counter() - started)
+
+class AsyncDashboardView(View):
+    """
+    ``DashboardView`` for ASGI deployments (``ASYNC_READS``): on a cache
+    miss the independent counts run concurrently on the database pool
+    instead of one after another. Answers in JSON only.
+    """
+
+    def layout(self, request):
+        if not request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        return dashboard.for_user(request.user)
+
+    async def get(self, request):
+        started = time.perf_counter()
+        request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            # Authentication and the profile lookup in one trip to the pool
+            data, key, queries = await run_pooled(self.layout, request)
+        except exceptions.APIException as e:
+            response = JsonResponse({'detail': e.detail}, status=e.status_code)
+            if e.status_code == status.HTTP_401_UNAUTHORIZED:
+                response['WWW-Authenticate'] = 'Token'
+            return response
+
+        with replica_reads(request.user):
+            data.update(await dashboard.acounts(key, queries))
+        request.accepted_renderer = JSONRenderer()
+        request.accepted_media_type = JSONRenderer.media_type
+        response = conditional_data_response(request, 'dashboard', data, time.perf_counter() - started)
+        # What APIView.finalize_response would set
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = {'request': request, 'response': response}
+        return response.render()
@@ -0,0 +1,35 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Reentrant, so a serialized view may call helpers that serialize too
+_write_lock = threading.RLock()
+
+
+@contextmanager
+def serialized_writes(using='default'):
+    """
+    Runs the block holding this process's write lock when SERIALIZE_WRITES
+    is on and ``using`` is SQLite, which allows one writer at a time anyway.
+    Waiting threads queue on the lock and start as soon as it is released.
+    Without it, SQLite's busy handler polls for the database lock and
+    sleeps in growing steps.
+    """
+    if not settings.SERIALIZE_WRITES or connections[using].vendor != 'sqlite':
+        yield
+        return
+    with _write_lock:
+        yield
+
+
+class SerializedWritesMixin:
+    """Handles the viewset's unsafe requests (POST, PUT, PATCH, DELETE) inside ``serialized_writes()``."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with serialized_writes():
+            return super().dispatch(request, *args, **kwargs)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_management.settings')
+# Serve the async read paths (see ASYNC_READS in settings)
+os.environ.setdefault('HOSPITAL_ASYNC_READS', '1')
 
 application = get_asgi_application()
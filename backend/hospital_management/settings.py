@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -60,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.replicas.replica_pin_middleware',
 ]
 
 ROOT_URLCONF = 'hospital_management.urls'
@@ -85,13 +87,75 @@ WSGI_APPLICATION = 'hospital_management.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite tuned for concurrent writers, opt-in with HOSPITAL_SQLITE_TUNED=1 so
+# development and test runs leave the database file in its default rollback
+# journal mode:
+# - WAL lets readers carry on while one connection writes. It is a property
+#   of the database file and stays on once set.
+# - synchronous=NORMAL only fsyncs at checkpoints. That is safe in WAL mode,
+#   though a power cut can lose the last transactions.
+# - Transactions take the write lock at BEGIN IMMEDIATE. A deferred one that
+#   reads first cannot upgrade its lock once another writer commits, and
+#   fails with "database is locked" without waiting.
+# - Writers wait up to `timeout` seconds for the lock.
+# - Connections are reused for CONN_MAX_AGE seconds instead of reopened
+#   (and re-tuned) per request.
+SQLITE_TUNED = os.environ.get('HOSPITAL_SQLITE_TUNED') == '1'
+
+SQLITE_PRAGMAS = [
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    'cache_size=-65536',  # KiB, i.e. 64 MiB per connection
+    'mmap_size=268435456',
+    'temp_store=MEMORY',
+]
+
+SQLITE_TUNED_DATABASE = {
+    'CONN_MAX_AGE': int(os.environ.get('HOSPITAL_CONN_MAX_AGE', 600)),
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'init_command': ';'.join(f'PRAGMA {pragma}' for pragma in SQLITE_PRAGMAS),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    },
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        **(SQLITE_TUNED_DATABASE if SQLITE_TUNED else {}),
     }
 }
 
+# Read replica, optional. With HOSPITAL_REPLICA_DB set to a copy of the
+# database (e.g. the SQLite snapshot `manage.py refresh_replica --every 30`
+# keeps there), reports and the list/detail reads of ReplicaReadsMixin
+# views go to it instead of competing with admissions and billing writes.
+# A user who writes reads from the primary for REPLICA_PIN_SECONDS after,
+# which must exceed the replica's lag.
+REPLICA_SNAPSHOT = os.environ.get('HOSPITAL_REPLICA_DB')
+REPLICA_DATABASE = 'replica' if REPLICA_SNAPSHOT else None
+REPLICA_PIN_SECONDS = int(os.environ.get('HOSPITAL_REPLICA_PIN_SECONDS', 60))
+if REPLICA_SNAPSHOT:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{REPLICA_SNAPSHOT}?mode=ro',
+        # Reopened per request, so a refreshed snapshot is picked up
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {pragma}' for pragma in SQLITE_PRAGMAS if not pragma.startswith('journal_mode')),
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.replicas.PrimaryReplicaRouter']
+
+# Makes the write-heavy viewsets (SerializedWritesMixin) take a per-process
+# lock around unsafe requests. A threaded server's writers then queue in
+# the process instead of polling SQLite's busy handler for the lock.
+SERIALIZE_WRITES = os.environ.get('HOSPITAL_SERIALIZE_WRITES') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -129,6 +193,18 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Dashboard aggregates are cached here; point this at a shared backend
+# (Redis/Memcached) when running more than one worker process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hospital-management',
+    }
+}
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -136,11 +212,33 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+# Lets the frontend read ETags to revalidate with If-None-Match itself
+CORS_EXPOSE_HEADERS = ['ETag']
 
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
+    # Keyset pagination; each viewset declares its own cursor_ordering
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+}
+
+# Token -> user cache used by CachedTokenAuthentication. Set BACKEND to a
+# cache alias (e.g. 'default') to share entries between worker processes,
+# so a logout or deactivation applies to all of them at once instead of
+# after the TTL.
+TOKEN_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60,
+    'BACKEND': None,
 }
+
+# Set by asgi.py. Under an ASGI server the dashboard and the emergency
+# stream run as async code, and sync views run on a pool of
+# ASYNC_DB_THREADS threads (each with its own database connection) instead
+# of Django's single thread for sync code.
+ASYNC_READS = os.environ.get('HOSPITAL_ASYNC_READS') == '1'
+ASYNC_DB_THREADS = int(os.environ.get('HOSPITAL_ASYNC_DB_THREADS', 8))
@@ -84,6 +84,8 @@ function App() {
   };
 
   const handleLogout = () => {
+    // Revoke the token server-side so it is also dropped from the auth cache
+    axios.post('http://localhost:8000/api/logout/').catch(() => {});
     localStorage.removeItem('token');
     delete axios.defaults.headers.common['Authorization'];
     setUser(null);
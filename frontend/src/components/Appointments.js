@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Typography, Box, Card, CardContent, TextField, Button, FormControl, InputLabel, Select, MenuItem, Checkbox, FormControlLabel, Grid, List, ListItem, ListItemText, Chip } from '@mui/material';
 import { Event, Person, LocalHospital } from '@mui/icons-material';
 import axios from 'axios';
+import { fetchAll } from '../fetchAll';
 
 function Appointments() {
   const [user, setUser] = useState(null);
@@ -66,7 +67,7 @@ function Appointments() {
   const fetchDoctors = async () => {
     try {
       const response = await axios.get('http://localhost:8000/api/doctors/');
-      setDoctors(response.data);
+      setDoctors(response.data.results);
     } catch (error) {
       console.error('Error fetching doctors:', error);
     }
@@ -74,8 +75,7 @@ function Appointments() {
 
   const fetchPatients = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/patients/');
-      setPatients(response.data);
+      setPatients(await fetchAll('http://localhost:8000/api/patients/'));
     } catch (error) {
       console.error('Error fetching patients:', error);
     }
@@ -83,9 +83,7 @@ function Appointments() {
 
   const fetchAvailableBeds = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/beds/');
-      const availableBeds = response.data.filter(bed => bed.status === 'available');
-      setBeds(availableBeds);
+      setBeds(await fetchAll('http://localhost:8000/api/beds/', { status: 'available' }));
     } catch (error) {
       console.error('Error fetching beds:', error);
     }
@@ -93,9 +91,9 @@ function Appointments() {
 
   const fetchAppointments = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/appointments/');
-      console.log('Appointments fetched:', response.data);
-      setAppointments(response.data);
+      const appointments = await fetchAll('http://localhost:8000/api/appointments/');
+      console.log('Appointments fetched:', appointments);
+      setAppointments(appointments);
     } catch (error) {
       console.error('Error fetching appointments:', error);
       alert('Error fetching appointments: ' + error.message);
@@ -224,8 +222,8 @@ function Appointments() {
       console.log('Selected bed:', selectedBed);
 
       // Check if patient already has a bed
-      const allBedsResponse = await axios.get('http://localhost:8000/api/beds/');
-      const patientCurrentBed = allBedsResponse.data.find(bed => bed.patient == patientId && bed.status === 'occupied');
+      const patientBedsResponse = await axios.get('http://localhost:8000/api/beds/', { params: { patient: patientId } });
+      const patientCurrentBed = patientBedsResponse.data.results[0];
 
       if (patientCurrentBed) {
         alert(`Patient is already assigned to bed ${patientCurrentBed.bed_number} in ${patientCurrentBed.ward}. Please release that bed first.`);
@@ -234,7 +232,8 @@ function Appointments() {
 
       // Assign bed to patient using the assign_patient action
       const bedResponse = await axios.post(`http://localhost:8000/api/beds/${bedId}/assign_patient/`, {
-        patient_id: parseInt(patientId)
+        patient_id: parseInt(patientId),
+        appointment_id: appointmentId
       });
 
       console.log('Bed assignment response:', bedResponse);
@@ -275,16 +274,17 @@ function Appointments() {
       let bedAssigned = false;
 
       if (appointment && appointment.notes && appointment.notes.includes('Bed requested')) {
-        // Check for available beds
-        const bedsResponse = await axios.get('http://localhost:8000/api/beds/');
-        const availableBed = bedsResponse.data.find(bed => bed.status === 'available');
+        // The server picks and claims a free bed in one step
+        const allocation = await axios.post('http://localhost:8000/api/beds/allocate/', {
+          patient_id: appointment.patient,
+          appointment_id: appointmentId
+        }).catch(error => {
+          if (error.response?.status === 409) return null;
+          throw error;
+        });
+        const availableBed = allocation?.data;
 
         if (availableBed) {
-          // Assign bed to patient
-          await axios.patch(`http://localhost:8000/api/beds/${availableBed.id}/`, {
-            patient: appointment.patient,
-            status: 'occupied'
-          });
           bedAssigned = true;
           alert(`Appointment approved! Bed ${availableBed.bed_number} has been assigned to the patient.`);
         } else {
@@ -313,8 +313,8 @@ function Appointments() {
     setLoading(true);
     try {
       // For patient booking, we need to get the patient profile
-      const patientResponse = await axios.get('http://localhost:8000/api/patients/');
-      const patient = patientResponse.data.find(p => p.user.id === user.id);
+      const patientResponse = await axios.get('http://localhost:8000/api/patients/', { params: { user: user.id } });
+      const patient = patientResponse.data.results[0];
 
       if (!patient) {
         alert('Patient profile not found. Please contact administrator.');
@@ -348,9 +348,9 @@ function Appointments() {
       // If a specific bed was selected and bed is requested, assign it
       if (formData.request_bed && formData.selected_bed) {
         try {
-          await axios.patch(`http://localhost:8000/api/beds/${formData.selected_bed}/`, {
-            patient: patient.id,
-            status: 'occupied'
+          await axios.post(`http://localhost:8000/api/beds/${formData.selected_bed}/assign_patient/`, {
+            patient_id: patient.id,
+            appointment_id: newAppointment.id
           });
 
           // Update appointment notes with bed assignment
@@ -1,13 +1,15 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Typography, Box, Card, CardContent, Grid, Chip, Button, Dialog, DialogTitle, DialogContent, DialogActions, FormControl, InputLabel, Select, MenuItem } from '@mui/material';
 import { Hotel, Person } from '@mui/icons-material';
 import axios from 'axios';
+import { fetchAll } from '../fetchAll';
 
 function Beds() {
   const [user, setUser] = useState(null);
   const [beds, setBeds] = useState([]);
   const [patients, setPatients] = useState([]);
   const [assignDialog, setAssignDialog] = useState({ open: false, bedId: null, patientId: '' });
+  const cursor = useRef(null);
 
   useEffect(() => {
     const userData = localStorage.getItem('user');
@@ -20,19 +22,39 @@ function Beds() {
     }
   }, [user]);
 
+  // Syncs from the change feed: everything on the first call, then only
+  // the beds changed or deleted since the last one
   const fetchBeds = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/beds/');
-      setBeds(response.data);
+      let hasMore = true;
+      while (hasMore) {
+        const params = cursor.current ? { cursor: cursor.current } : {};
+        const response = await axios.get('http://localhost:8000/api/beds/changes/', { params });
+        const { results, deleted } = response.data;
+        setBeds(current => {
+          const byId = new Map(current.map(bed => [bed.id, bed]));
+          deleted.forEach(id => byId.delete(id));
+          results.forEach(bed => byId.set(bed.id, bed));
+          return Array.from(byId.values()).sort((a, b) => a.id - b.id);
+        });
+        cursor.current = response.data.cursor;
+        hasMore = response.data.has_more;
+      }
     } catch (error) {
+      if (error.response && error.response.status === 410 && cursor.current) {
+        // Too old to catch up; start over
+        cursor.current = null;
+        setBeds([]);
+        fetchBeds();
+        return;
+      }
       console.error('Error fetching beds:', error);
     }
   };
 
   const fetchPatients = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/patients/');
-      setPatients(response.data);
+      setPatients(await fetchAll('http://localhost:8000/api/patients/'));
     } catch (error) {
       console.error('Error fetching patients:', error);
     }
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Typography, Box, Card, CardContent, Grid, Chip, Button, Dialog, DialogTitle, DialogContent, TextField, FormControl, InputLabel, Select, MenuItem, Table, TableBody, TableCell, TableContainer, TableHead, TableRow, Paper, Divider, List, ListItem, ListItemText, IconButton } from '@mui/material';
 import { Payment, Receipt, History, Add, Person, LocalHospital, Healing, Delete, CurrencyRupee } from '@mui/icons-material';
 import axios from 'axios';
+import { fetchAll } from '../fetchAll';
 
 function Billing() {
   const [user, setUser] = useState(null);
@@ -36,8 +37,10 @@ function Billing() {
 
   const fetchBills = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/billings/');
-      setBills(response.data);
+      // Patients only ever see their own bills, so let the server scope them
+      const userData = JSON.parse(localStorage.getItem('user') || '{}');
+      const params = userData.role === 'patient' ? { mine: true } : {};
+      setBills(await fetchAll('http://localhost:8000/api/billings/', params));
     } catch (error) {
       console.error('Error fetching bills:', error);
     }
@@ -45,8 +48,7 @@ function Billing() {
 
   const fetchPatients = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/patients/');
-      setPatients(response.data);
+      setPatients(await fetchAll('http://localhost:8000/api/patients/'));
     } catch (error) {
       console.error('Error fetching patients:', error);
     }
@@ -55,7 +57,7 @@ function Billing() {
   const fetchDoctors = async () => {
     try {
       const response = await axios.get('http://localhost:8000/api/doctors/');
-      setDoctors(response.data);
+      setDoctors(response.data.results);
     } catch (error) {
       console.error('Error fetching doctors:', error);
     }
@@ -372,7 +374,7 @@ function Billing() {
     if (!user) return [];
     if (user.role === 'patient') {
       // For patients, only show their own pending bills
-      return bills.filter(bill => bill.patient_name === `${user.first_name} ${user.last_name}` && bill.status === 'pending');
+      return bills.filter(bill => bill.status === 'pending');
     }
     return bills;
   };
@@ -402,7 +404,7 @@ function Billing() {
             Medicine History
           </Typography>
 
-          {bills.filter(bill => bill.patient_name === `${user.first_name} ${user.last_name}` && bill.status === 'paid').length === 0 ? (
+          {bills.filter(bill => bill.status === 'paid').length === 0 ? (
             <Card sx={{ p: 3, borderRadius: 2, textAlign: 'center', mb: 4 }}>
               <CardContent>
                 <Healing sx={{ fontSize: 60, color: '#4caf50', mb: 2 }} />
@@ -416,7 +418,7 @@ function Billing() {
             </Card>
           ) : (
             <Grid container spacing={2} sx={{ mb: 4 }}>
-              {bills.filter(bill => bill.patient_name === `${user.first_name} ${user.last_name}` && bill.status === 'paid').map(bill => (
+              {bills.filter(bill => bill.status === 'paid').map(bill => (
                 <Grid item xs={12} key={bill.id}>
                   <Card sx={{ borderRadius: 2, boxShadow: 2 }}>
                     <CardContent>
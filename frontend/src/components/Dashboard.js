@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Grid, Card, CardContent, Typography, Box, LinearProgress, Chip, Dialog, DialogTitle, DialogContent, List, ListItem, ListItemText, Button, Divider } from '@mui/material';
 import { People, LocalHospital, Event, Hotel, Payment, Inventory, Warning, Close } from '@mui/icons-material';
 import axios from 'axios';
+import { fetchAll } from '../fetchAll';
 
 function DashboardPage() {
   const [stats, setStats] = useState({});
@@ -23,34 +24,22 @@ function DashboardPage() {
   const fetchDetailData = async (type) => {
     try {
       let data = [];
-      const userData = JSON.parse(localStorage.getItem('user'));
 
       if (type === 'my_appointments') {
-        const response = await axios.get('http://localhost:8000/api/appointments/');
-        data = response.data.filter(apt => apt.patient_name === `${userData.first_name} ${userData.last_name}`);
+        data = await fetchAll('http://localhost:8000/api/appointments/', { mine: true });
       } else if (type === 'upcoming_appointments') {
-        const response = await axios.get('http://localhost:8000/api/appointments/');
-        const now = new Date();
-        data = response.data.filter(apt =>
-          apt.patient_name === `${userData.first_name} ${userData.last_name}` &&
-          new Date(apt.appointment_date) > now
-        );
+        data = await fetchAll('http://localhost:8000/api/appointments/', {
+          mine: true, status: 'scheduled,confirmed', date_from: new Date().toISOString()
+        });
       } else if (type === 'my_bills') {
-        const response = await axios.get('http://localhost:8000/api/billings/');
-        data = response.data.filter(bill => bill.patient_name === `${userData.first_name} ${userData.last_name}`);
+        data = await fetchAll('http://localhost:8000/api/billings/', { mine: true });
       } else if (type === 'pending_bills') {
-        const response = await axios.get('http://localhost:8000/api/billings/');
-        data = response.data.filter(bill =>
-          bill.patient_name === `${userData.first_name} ${userData.last_name}` &&
-          bill.status === 'pending'
-        );
+        data = await fetchAll('http://localhost:8000/api/billings/', { mine: true, status: 'pending' });
       } else if (type === 'medical_records') {
-        const response = await axios.get('http://localhost:8000/api/medical-records/');
-        data = response.data.filter(record => record.patient_name === `${userData.first_name} ${userData.last_name}`);
+        data = await fetchAll('http://localhost:8000/api/medical-records/', { mine: true });
       } else if (type === 'current_bed') {
-        const response = await axios.get('http://localhost:8000/api/beds/');
-        const assignedBed = response.data.find(bed => bed.patient_name === `${userData.first_name} ${userData.last_name}`);
-        data = assignedBed ? [assignedBed] : [];
+        const response = await axios.get('http://localhost:8000/api/beds/', { params: { mine: true } });
+        data = response.data.results;
       }
       return data;
     } catch (error) {
@@ -96,8 +85,7 @@ function DashboardPage() {
 
   const fetchAppointmentsDetail = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/appointments/');
-      const appointments = response.data;
+      const appointments = await fetchAll('http://localhost:8000/api/appointments/');
 
       // Group appointments by date
       const groupedByDate = {};
@@ -130,8 +118,7 @@ function DashboardPage() {
 
   const fetchBedsDetail = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/beds/');
-      return response.data;
+      return await fetchAll('http://localhost:8000/api/beds/');
     } catch (error) {
       console.error('Error fetching beds detail:', error);
       return [];
@@ -157,24 +144,17 @@ function DashboardPage() {
 
   const handleAssignBedToAppointment = async (appointmentId, patientId) => {
     try {
-      // Check if patient already has a bed
-      const allBedsResponse = await axios.get('http://localhost:8000/api/beds/');
-      const patientCurrentBed = allBedsResponse.data.find(bed => bed.patient == patientId && bed.status === 'occupied');
-
-      if (patientCurrentBed) {
-        alert(`Patient is already assigned to bed ${patientCurrentBed.bed_number} in ${patientCurrentBed.ward}. Please release that bed first.`);
-        return;
-      }
-
-      // Check for available beds
-      const availableBed = allBedsResponse.data.find(bed => bed.status === 'available');
+      // The server picks and claims a free bed in one step
+      const allocation = await axios.post('http://localhost:8000/api/beds/allocate/', {
+        patient_id: parseInt(patientId),
+        appointment_id: appointmentId
+      }).catch(error => {
+        if (error.response?.status === 409) return null;
+        throw error;
+      });
+      const availableBed = allocation?.data;
 
       if (availableBed) {
-        // Assign bed to patient using the assign_patient action
-        await axios.post(`http://localhost:8000/api/beds/${availableBed.id}/assign_patient/`, {
-          patient_id: parseInt(patientId)
-        });
-
         // Update appointment notes to indicate bed was assigned
         const appointmentResponse = await axios.get(`http://localhost:8000/api/appointments/${appointmentId}/`);
         const currentNotes = appointmentResponse.data.notes || '';
@@ -29,7 +29,7 @@ function Doctors() {
   const fetchDoctors = async () => {
     try {
       const response = await axios.get('http://localhost:8000/api/doctors/');
-      setDoctors(response.data);
+      setDoctors(response.data.results);
     } catch (error) {
       console.error('Error fetching doctors:', error);
     }
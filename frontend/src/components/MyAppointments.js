@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Grid, Card, CardContent, Typography, Box, Chip, Button, Drawer, Avatar, TextField, Select, MenuItem, FormControl, InputLabel } from '@mui/material';
 import { Event, People, LocalHospital, AccessTime, Close, CheckCircle, Cancel, Add, Remove } from '@mui/icons-material';
 import axios from 'axios';
+import { fetchAll } from '../fetchAll';
 
 function MyAppointments() {
   const [appointments, setAppointments] = useState([]);
@@ -35,14 +36,11 @@ function MyAppointments() {
   const fetchMyAppointments = async () => {
     try {
       setLoading(true);
-      const appointmentsResponse = await axios.get('http://localhost:8000/api/appointments/');
-      const userData = JSON.parse(localStorage.getItem('user'));
-      const doctorName = `${userData.first_name} ${userData.last_name}`;
+      // mine=true limits the list to this doctor's appointments
+      const appointments = await fetchAll('http://localhost:8000/api/appointments/', { mine: true });
 
-      // Filter appointments for this doctor (exclude 'requested' status as they need staff approval first)
-      const doctorAppointments = appointmentsResponse.data.filter(
-        apt => apt.doctor_name === doctorName && apt.status !== 'requested'
-      );
+      // Exclude 'requested' status as they need staff approval first
+      const doctorAppointments = appointments.filter(apt => apt.status !== 'requested');
 
       // Sort by date (most recent first)
       doctorAppointments.sort((a, b) => new Date(b.appointment_date) - new Date(a.appointment_date));
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Grid, Card, CardContent, Typography, Box, Chip, Button, Dialog, DialogTitle, DialogContent, List, ListItem, ListItemText, Divider, Avatar } from '@mui/material';
 import { People, LocalHospital, Event, MedicalServices, Close } from '@mui/icons-material';
 import axios from 'axios';
+import { fetchAll } from '../fetchAll';
 
 function MyPatients() {
   const [patients, setPatients] = useState([]);
@@ -16,24 +17,16 @@ function MyPatients() {
   const fetchMyPatients = async () => {
     try {
       setLoading(true);
-      // Get doctor's profile to find their appointments
-      const appointmentsResponse = await axios.get('http://localhost:8000/api/appointments/');
-      const userData = JSON.parse(localStorage.getItem('user'));
-      const doctorName = `${userData.first_name} ${userData.last_name}`;
-
-      // Filter appointments for this doctor and get unique patients
-      const doctorAppointments = appointmentsResponse.data.filter(
-        apt => apt.doctor_name === doctorName
-      );
+      // The server scopes mine=true to this doctor's appointments
+      const doctorAppointments = await fetchAll('http://localhost:8000/api/appointments/', { mine: true });
 
       // Get unique patient IDs
       const patientIds = [...new Set(doctorAppointments.map(apt => apt.patient))];
 
       // Fetch patient details
-      const patientsResponse = await axios.get('http://localhost:8000/api/patients/');
-      const doctorPatients = patientsResponse.data.filter(
-        patient => patientIds.includes(patient.id)
-      );
+      const doctorPatients = patientIds.length
+        ? await fetchAll('http://localhost:8000/api/patients/', { id: patientIds.join(',') })
+        : [];
 
       setPatients(doctorPatients);
     } catch (error) {
@@ -45,29 +38,14 @@ function MyPatients() {
 
   const fetchPatientDetails = async (patientId) => {
     try {
-      const [patientResponse, appointmentsResponse, medicalRecordsResponse, billsResponse] = await Promise.all([
+      // Appointments and records with this doctor, bills of this patient
+      const [patientResponse, patientAppointments, patientRecords, patientBills] = await Promise.all([
         axios.get(`http://localhost:8000/api/patients/${patientId}/`),
-        axios.get('http://localhost:8000/api/appointments/'),
-        axios.get('http://localhost:8000/api/medical-records/'),
-        axios.get('http://localhost:8000/api/billings/')
+        fetchAll('http://localhost:8000/api/appointments/', { patient: patientId, mine: true }),
+        fetchAll('http://localhost:8000/api/medical-records/', { patient: patientId, mine: true }),
+        fetchAll('http://localhost:8000/api/billings/', { patient: patientId })
       ]);
 
-      const userData = JSON.parse(localStorage.getItem('user'));
-      const doctorName = `${userData.first_name} ${userData.last_name}`;
-
-      // Filter data for this patient and doctor
-      const patientAppointments = appointmentsResponse.data.filter(
-        apt => apt.patient === patientId && apt.doctor_name === doctorName
-      );
-
-      const patientRecords = medicalRecordsResponse.data.filter(
-        record => record.patient === patientId && record.doctor_name === doctorName
-      );
-
-      const patientBills = billsResponse.data.filter(
-        bill => bill.patient === patientId
-      );
-
       return {
         patient: patientResponse.data,
         appointments: patientAppointments,
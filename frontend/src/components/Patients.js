@@ -6,6 +6,7 @@ import {
 } from '@mui/material';
 import { Add, Edit, Delete } from '@mui/icons-material';
 import axios from 'axios';
+import { fetchAll } from '../fetchAll';
 
 function Patients() {
   const [patients, setPatients] = useState([]);
@@ -26,8 +27,7 @@ function Patients() {
 
   const fetchPatients = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/patients/');
-      setPatients(response.data);
+      setPatients(await fetchAll('http://localhost:8000/api/patients/'));
     } catch (error) {
       console.error('Error fetching patients:', error);
     }
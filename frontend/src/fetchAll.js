@@ -0,0 +1,12 @@
+import axios from 'axios';
+
+// Reads every page of a cursor-paginated list by following `next`
+export async function fetchAll(url, params = {}) {
+  let response = await axios.get(url, { params: { page_size: 500, ...params } });
+  const rows = [...response.data.results];
+  while (response.data.next) {
+    response = await axios.get(response.data.next);
+    rows.push(...response.data.results);
+  }
+  return rows;
+}